@@ -1,10 +1,10 @@
 from pathlib import Path
 from datetime import datetime, timezone
-import re
+import argparse
 import os
-import uuid
+import sys
 # from dotenv import load_dotenv
-from sqlmodel import Session, create_engine, SQLModel, Field
+from sqlmodel import Session
 
 
 def find_project_root(marker=".git"):
@@ -16,246 +16,107 @@ def find_project_root(marker=".git"):
 
 
 project_root = find_project_root()
-db_path = project_root / "database.db"
+db_path = Path(os.getenv("DATABASE_PATH", project_root / "database.db"))
+
+sys.path.append(str(project_root / "web" / "backend"))
+from chatlog import (  # noqa: E402
+    CHUNK_SIZE,
+    ChatMessage,
+    bulk_load,
+    init_db,
+    new_pattern_counts,
+)
+from chatlog.connections import write_engine  # noqa: E402
+from chatlog.ingest import parse_chunk, plan_ingest, store_chunks  # noqa: E402
+from chatlog.metrics import format_stage_rates, new_stage_timings  # noqa: E402
+from chatlog.models import (  # noqa: E402
+    ChatEvent,
+    ChatterCountRollup,
+    IngestMetric,
+    LogFile,
+    LogFileRows,
+    MessageCountRollup,
+)
 
 # load_dotenv()
 
-DATABASE_URL = f"sqlite:///{db_path}"
-engine = create_engine(DATABASE_URL)
-
-
-class ChatMessage(SQLModel, table=True):
-    id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
-    created_at: datetime = Field(index=True)
-    timestamp: datetime = Field(index=True)
-    channel_name: str = Field(index=True)
-    username: str | None = Field(default=None, index=True)
-    message_text: str
-    message_type: str
-
 
 filename = Path("./example/sodapoppin-316092067675.log")
 
 
-patterns = {
-    "stream_live": re.compile(r"^\[(\d{2}:\d{2}:\d{2})\]\s+(\w+)\s+is live!$"),
-    "sub_basic": re.compile(
-        r"^\[(\d{2}:\d{2}:\d{2})\]\s+(\w+)\s+subscribed at Tier (\d+)\.$"
-    ),
-    "sub_prime_basic": re.compile(
-        r"^\[(\d{2}:\d{2}:\d{2})\]\s+(\w+)\s+subscribed with Prime\.$"
-    ),
-    "sub_with_months": re.compile(
-        r"^\[(\d{2}:\d{2}:\d{2})\]\s+(\w+)\s+subscribed (?:at Tier (\d+)|with Prime)\.\s+They\'ve subscribed for (\d+) months?!$"
-    ),
-    "sub_with_streak": re.compile(
-        r"^\[(\d{2}:\d{2}:\d{2})\]\s+(\w+)\s+subscribed (?:at Tier (\d+)|with Prime)\.\s+They\'ve subscribed for (\d+) months?, currently on a (\d+) month streak!$"
-    ),
-    "sub_advance": re.compile(
-        r"^\[(\d{2}:\d{2}:\d{2})\]\s+(\w+)\s+subscribed at Tier (\d+) for (\d+) months? in advance(?:, reaching (\d+) months cumulatively so far)?!$"
-    ),
-    "gift_announcement": re.compile(
-        r"^\[(\d{2}:\d{2}:\d{2})\]\s+(\w+)\s+is gifting (\d+) Tier (\d+) Subs? to (\w+)\'s community!\s+They\'ve gifted a total of (\d+) in the channel!$"
-    ),
-    "gift_individual": re.compile(
-        r"^\[(\d{2}:\d{2}:\d{2})\]\s+(\w+)\s+gifted a Tier (\d+) sub to (\w+)!(?:\s+They have given (\d+) Gift Subs in the channel!)?$"
-    ),
-    "gift_first": re.compile(
-        r"^\[(\d{2}:\d{2}:\d{2})\]\s+(\w+)\s+gifted a Tier (\d+) sub to (\w+)!\s+This is their first Gift Sub in the channel!$"
-    ),
-    "anon_gift_announcement": re.compile(
-        r"^\[(\d{2}:\d{2}:\d{2})\]\s+AnAnonymousGifter is gifting (\d+) Tier (\d+) Subs? to (\w+)\'s community!$"
-    ),
-    "anon_gift_individual": re.compile(
-        r"^\[(\d{2}:\d{2}:\d{2})\]\s+An anonymous user gifted(?: (\d+) months? of)? a Tier (\d+) sub to (\w+)!$"
-    ),
-    "timeout": re.compile(
-        r"^\[(\d{2}:\d{2}:\d{2})\]\s+(\w+)\s+has been timed out for (.+)\.$"
-    ),
-    "permanent_ban": re.compile(
-        r"^\[(\d{2}:\d{2}:\d{2})\]\s+(\w+)\s+has been permanently banned\.$"
-    ),
-    "raid": re.compile(
-        r"^\[(\d{2}:\d{2}:\d{2})\]\s+(\d+) raiders? from (\w+) have joined!$"
-    ),
-    "room_mode_on": re.compile(
-        r"^\[(\d{2}:\d{2}:\d{2})\]\s+This room is now in (.+) mode\.$"
-    ),
-    "room_mode_off": re.compile(
-        r"^\[(\d{2}:\d{2}:\d{2})\]\s+This room is no longer in (.+) mode\.$"
-    ),
-    "announcement": re.compile(r"^\[(\d{2}:\d{2}:\d{2})\]\s+Announcement$"),
-    "chat_message": re.compile(r"^\[(\d{2}:\d{2}:\d{2})\]\s+(\w+):\s+(.+)$"),
-    "chat_message_foreign": re.compile(
-        r"^\[(\d{2}:\d{2}:\d{2})\]\s+([\w\u0080-\uFFFF]+)\s+(\w+):\s+(.+)$"
-    ),
-}
-
-
-pattern_counts = {
-    "stream_live": 0,
-    "sub_basic": 0,
-    "sub_prime_basic": 0,
-    "sub_with_months": 0,
-    "sub_with_streak": 0,
-    "sub_advance": 0,
-    "gift_announcement": 0,
-    "gift_individual": 0,
-    "gift_first": 0,
-    "anon_gift_announcement": 0,
-    "anon_gift_individual": 0,
-    "timeout": 0,
-    "permanent_ban": 0,
-    "raid": 0,
-    "room_mode_on": 0,
-    "room_mode_off": 0,
-    "announcement": 0,
-    "chat_message": 0,
-    "chat_message_foreign": 0,
-    "no_match": 0,
-}
-
-username_indices = {
-    "stream_live": [1],
-    "raid": [2],
-    "announcement": [],
-    "sub_basic": [1],
-    "sub_prime_basic": [1],
-    "sub_with_months": [1],
-    "sub_with_streak": [1],
-    "sub_advance": [1],
-    "gift_announcement": [1, 4],
-    "gift_individual": [1, 3],
-    "gift_first": [1, 3],
-    "anon_gift_announcement": [3],
-    "anon_gift_individual": [2],
-    "timeout": [1],
-    "permanent_ban": [1],
-    "room_mode_on": [],
-    "room_mode_off": [],
-    "chat_message": [1],
-    "chat_message_foreign": [1, 2],
-}
-
-
-non_chat_patterns = [
-    "stream_live",
-    "sub_basic",
-    "sub_prime_basic",
-    "sub_with_months",
-    "sub_with_streak",
-    "sub_advance",
-    "gift_announcement",
-    "gift_individual",
-    "gift_first",
-    "anon_gift_announcement",
-    "anon_gift_individual",
-    "timeout",
-    "permanent_ban",
-    "raid",
-    "room_mode_on",
-    "room_mode_off",
-    "announcement",
-]
-
-
-def extract_usernames(pattern_name, match_groups):
-    if pattern_name not in username_indices:
-        return []
-
-    indices = username_indices[pattern_name]
-    usernames = []
-
-    for idx in indices:
-        if idx < len(match_groups) and match_groups[idx]:
-            usernames.append(match_groups[idx])
-
-    return usernames
-
-
-def store_db(
-    session, created_at, timestamp, channel_name, username, message_text, message_type
+def add_example_data(
+    engine, filename=filename, channel_name="sodapoppin", chunk_size=CHUNK_SIZE, bulk=False
 ):
-    message = ChatMessage(
-        created_at=created_at,
-        timestamp=timestamp,
-        channel_name=channel_name,
-        username=username,
-        message_text=message_text,
-        message_type=message_type,
-    )
-    session.add(message)
-    session.commit()
-
-
-def add_example_data():
     now = datetime.now(timezone.utc)
     print(f"Adding example data, started at {now.isoformat()}")
 
-    with Session(engine) as session:
-        with open(filename, "r", encoding="utf-8") as f:
-            data = [line for line in f]
-            stream_date = data[0].split("at ")[1].strip().split(" ")[0]
-            print(f"stream date: {stream_date}")
-
-            try:
-                for item in data[2:]:
-                    message = item.strip()
-
-                    for pattern_name, pattern in patterns.items():
-                        match = pattern.match(message)
-                        if match:
-                            pattern_counts[pattern_name] += 1
-                            timestamp_str = f"{stream_date} {match.group(1)}"
-                            naive_timestamp = datetime.strptime(
-                                timestamp_str, "%Y-%m-%d %H:%M:%S"
-                            )
-                            aware_timestamp = naive_timestamp.replace(
-                                tzinfo=timezone.utc
-                            )
-
-                            usernames = extract_usernames(pattern_name, match.groups())
-
-                            if pattern_name == "chat_message":
-                                message_text = match.group(3)
-                            elif pattern_name == "chat_message_foreign":
-                                message_text = match.group(3) + match.group(4)
-                            else:
-                                message_text = match.string.split("] ")[1].strip()
-
-                            store_db(
-                                session=session,
-                                created_at=datetime.now(timezone.utc),
-                                timestamp=aware_timestamp,
-                                channel_name="sodapoppin",
-                                username=usernames[0] if usernames else None,
-                                message_text=message_text,
-                                message_type=pattern_name,
-                            )
-                            break
-
-                    else:
-                        print(f"Failed to match: {message}")
-
-            except Exception as e:
-                print(e)
-
+    counts = new_pattern_counts()
+    timings = new_stage_timings()
+
+    with engine.connect() as conn:
+        tasks, stats, skipped = plan_ingest(conn, [filename], channel_name)
+    if skipped:
+        print(f"{filename} is stored already")
+    else:
+        # a failed chunk rolls back and ends the run; committed chunks stay,
+        # and running again resumes after them
+        with bulk_load(engine) if bulk else engine.connect() as conn:
+            total, elapsed = store_chunks(
+                conn,
+                tasks,
+                map(parse_chunk, tasks),
+                stats,
+                now,
+                counts,
+                chunk_size,
+                timings=timings,
+            )
+        print(f"stored {total} rows in {elapsed:.2f}s")
+        print(format_stage_rates(timings))
+
+    print(counts)
     print(f"finished at {datetime.now(timezone.utc).isoformat()}")
     return
 
 
-def delete_all():
+def delete_all(engine):
     print("Deleting all data...")
     with Session(engine) as session:
         session.query(ChatMessage).delete()
+        session.query(ChatEvent).delete()
+        session.query(MessageCountRollup).delete()
+        session.query(ChatterCountRollup).delete()
+        session.query(LogFile).delete()
+        session.query(LogFileRows).delete()
+        session.query(IngestMetric).delete()
         session.commit()
     return
 
 
 def main():
-    # delete_all()
-    SQLModel.metadata.create_all(engine)
-    add_example_data()
+    parser = argparse.ArgumentParser(description="Load a Chatterino log into the database")
+    parser.add_argument("filename", nargs="?", type=Path, default=filename)
+    parser.add_argument("--channel", default="sodapoppin")
+    parser.add_argument(
+        "--chunk-size", type=int, default=CHUNK_SIZE, help="rows per transaction"
+    )
+    parser.add_argument(
+        "--bulk",
+        action="store_true",
+        help="drop indexes and relax durability while loading, see chatlog.bulk_load",
+    )
+    parser.add_argument(
+        "--natural-key",
+        action="store_true",
+        help="never store a line twice, see chatlog.db.add_natural_key",
+    )
+    args = parser.parse_args()
+
+    # ingest's one writer connection, see chatlog.connections
+    engine = write_engine(db_path)
+    # delete_all(engine)
+    init_db(engine, args.natural_key)
+    add_example_data(engine, args.filename, args.channel, args.chunk_size, args.bulk)
 
 
 if "__main__" == __name__:
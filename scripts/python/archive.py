@@ -0,0 +1,60 @@
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+import argparse
+import sys
+
+sys.path.append(str(Path(__file__).resolve().parents[2] / "web" / "backend"))
+from add_example_data import db_path, project_root  # noqa: E402
+from chatlog import init_db  # noqa: E402
+from chatlog.archive import archive_before  # noqa: E402
+from chatlog.connections import write_engine  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Move old chat messages out of the database into per-channel, "
+        "per-day Parquet files that GET /chats/ still reads"
+    )
+    parser.add_argument(
+        "--before",
+        type=datetime.fromisoformat,
+        help="archive whole UTC days before this date (default: --days ago)",
+    )
+    parser.add_argument(
+        "--days", type=int, default=30, help="keep this many days in the database"
+    )
+    parser.add_argument(
+        "--archive-dir",
+        type=Path,
+        default=project_root / "archive",
+        help="where the Parquet files go; the API reads ARCHIVE_PATH",
+    )
+    parser.add_argument(
+        "--vacuum",
+        action="store_true",
+        help="rebuild the database afterwards to give the freed pages back",
+    )
+    parser.add_argument(
+        "--database",
+        type=Path,
+        default=db_path,
+        help="database to archive (default: DATABASE_PATH)",
+    )
+    args = parser.parse_args()
+
+    cutoff = args.before or datetime.now(timezone.utc) - timedelta(days=args.days)
+    if cutoff.tzinfo is None:
+        cutoff = cutoff.replace(tzinfo=timezone.utc)
+
+    engine = write_engine(args.database)
+    init_db(engine)
+    total = archive_before(engine, args.archive_dir, cutoff)
+    print(f"archived {total} rows from before {cutoff.date()} to {args.archive_dir}")
+
+    if args.vacuum:
+        with engine.connect() as conn:
+            conn.exec_driver_sql("VACUUM")
+
+
+if "__main__" == __name__:
+    main()
@@ -0,0 +1,164 @@
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
+from datetime import datetime, timezone
+from functools import partial
+from pathlib import Path
+from typing import get_args
+import argparse
+import os
+import sys
+
+sys.path.append(str(Path(__file__).resolve().parents[2] / "web" / "backend"))
+from add_example_data import db_path  # noqa: E402
+from chatlog import CHUNK_SIZE, bulk_load, init_db, new_pattern_counts  # noqa: E402
+from chatlog.connections import write_engine  # noqa: E402
+from chatlog.ingest import (  # noqa: E402
+    CHUNK_BYTES,
+    parse_chunk,
+    plan_ingest,
+    store_chunks,
+)
+from chatlog.logfiles import channels_directory, find_log_files  # noqa: E402
+from chatlog.metrics import format_stage_rates, new_stage_timings  # noqa: E402
+from chatlog.shards import ShardBy, ShardRouter  # noqa: E402
+
+
+def load(engine, paths, now, parse, workers, chunk_bytes, chunk_size, bulk, counts, timings):
+    """Store the lines of paths not stored in engine's database yet."""
+    with engine.connect() as conn:
+        tasks, stats, skipped = plan_ingest(conn, paths, chunk_bytes=chunk_bytes)
+    print(
+        f"{len(paths)} files, {skipped} unchanged, {len(tasks)} chunks to parse, "
+        f"{workers or os.cpu_count()} workers"
+    )
+    if not tasks:
+        return 0
+
+    with bulk_load(engine) if bulk else engine.connect() as conn:
+        # results arrive in task order, so rows keep their order within each file
+        total, elapsed = store_chunks(
+            conn, tasks, parse(tasks), stats, now, counts, chunk_size, timings=timings
+        )
+    print(f"stored {total} rows in {elapsed:.2f}s")
+    return total
+
+
+def backfill(
+    root,
+    workers=None,
+    chunk_bytes=CHUNK_BYTES,
+    chunk_size=CHUNK_SIZE,
+    bulk=False,
+    router=None,
+    engine=None,
+):
+    """Load the log files under root into engine, or into their shards with a ShardRouter."""
+    now = datetime.now(timezone.utc)
+    print(f"Backfilling {root}, started at {now.isoformat()}")
+
+    paths = find_log_files(root)
+    if router is None:
+        shards = {None: paths}
+    else:
+        shards = {}
+        for path in paths:
+            shards.setdefault(router.key_for(path), []).append(path)
+
+    counts = new_pattern_counts()
+    timings = new_stage_timings()
+    with ExitStack() as stack:
+        if workers == 1:
+            parse = partial(map, parse_chunk)
+        else:
+            pool = stack.enter_context(ProcessPoolExecutor(max_workers=workers))
+            parse = partial(pool.map, parse_chunk)
+
+        total = 0
+        for key, shard_paths in sorted(shards.items(), key=lambda item: item[0] or ""):
+            if key is not None:
+                print(f"shard {key}:")
+            total += load(
+                engine if key is None else router.engine(key),
+                shard_paths,
+                now,
+                parse,
+                workers,
+                chunk_bytes,
+                chunk_size,
+                bulk,
+                counts,
+                timings,
+            )
+
+    if total:
+        print(counts)
+        print(format_stage_rates(timings))
+    print(f"finished at {datetime.now(timezone.utc).isoformat()}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Load a directory of Chatterino logs using a pool of parser processes"
+    )
+    parser.add_argument(
+        "root",
+        nargs="?",
+        type=Path,
+        default=channels_directory,
+        help="Channels directory, a single channel's directory, or a log file",
+    )
+    parser.add_argument(
+        "--workers", type=int, default=None, help="parser processes (default: CPU count)"
+    )
+    parser.add_argument(
+        "--chunk-bytes", type=int, default=CHUNK_BYTES, help="split files larger than this"
+    )
+    parser.add_argument(
+        "--chunk-size", type=int, default=CHUNK_SIZE, help="rows per transaction"
+    )
+    parser.add_argument(
+        "--bulk",
+        action="store_true",
+        help="drop indexes and relax durability while loading, see chatlog.bulk_load",
+    )
+    parser.add_argument(
+        "--natural-key",
+        action="store_true",
+        help="never store a line twice, see chatlog.db.add_natural_key",
+    )
+    parser.add_argument(
+        "--shard-dir",
+        type=Path,
+        help="store each channel's (or month's) rows in a database of its own "
+        "in this directory, see chatlog.shards",
+    )
+    parser.add_argument("--shard-by", choices=get_args(ShardBy), default="channel")
+    parser.add_argument(
+        "--database",
+        type=Path,
+        default=db_path,
+        help="database to store into without --shard-dir (default: DATABASE_PATH)",
+    )
+    args = parser.parse_args()
+
+    router = None
+    engine = None
+    if args.shard_dir is not None:
+        router = ShardRouter(args.shard_dir, args.shard_by, args.natural_key)
+    else:
+        # ingest's one writer connection, see chatlog.connections
+        engine = write_engine(args.database)
+        init_db(engine, args.natural_key)
+    backfill(
+        args.root,
+        args.workers,
+        args.chunk_bytes,
+        args.chunk_size,
+        args.bulk,
+        router,
+        engine,
+    )
+
+
+if "__main__" == __name__:
+    main()
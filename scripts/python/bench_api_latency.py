@@ -0,0 +1,102 @@
+from pathlib import Path
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+import httpx
+
+backend = Path(__file__).resolve().parents[2] / "web" / "backend"
+sys.path.append(str(backend))
+
+# a quick page, and a search whose matches all have to be ranked in SQLite
+requests = {
+    "fast": "/chats/?limit=10",
+    "slow": "/chats/search?q={term}&limit=100",
+}
+
+
+async def blocking(fn, *args):
+    """Run database work on the event loop, as the endpoints did before."""
+    import main
+
+    with main.Session(main.engine) as session:
+        return fn(session, *args)
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+async def measure(app, concurrency, per_worker, slow_every, term):
+    latencies = {kind: [] for kind in requests}
+    transport = httpx.ASGITransport(app=app)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+
+        async def worker(worker_id):
+            for i in range(per_worker):
+                kind = "slow" if (worker_id + i) % slow_every == 0 else "fast"
+                started = time.perf_counter()
+                response = await client.get(requests[kind].format(term=term))
+                response.raise_for_status()
+                latencies[kind].append(time.perf_counter() - started)
+
+        await asyncio.gather(*(worker(n) for n in range(concurrency)))
+
+    return latencies
+
+
+async def run(args):
+    import main
+
+    main.engine.echo = False
+    with main.engine.connect() as conn:
+        rows = conn.exec_driver_sql("SELECT count(*) FROM chatmessage").scalar()
+    print(
+        f"{rows} rows, {args.concurrency} concurrent clients, "
+        f"{args.requests} requests each, 1 in {args.slow_every} slow"
+    )
+
+    threaded = main.run_in_db_thread
+    async with main.lifespan(main.app):
+        for name, runner in [("event loop", blocking), ("threadpool", threaded)]:
+            main.run_in_db_thread = runner
+            latencies = await measure(
+                main.app, args.concurrency, args.requests, args.slow_every, args.term
+            )
+            for kind, values in latencies.items():
+                if values:
+                    print(
+                        f"{name:>11} {kind}: p50 {statistics.median(values) * 1000:7.1f} ms"
+                        f"  p99 {percentile(values, 0.99) * 1000:7.1f} ms  (n={len(values)})"
+                    )
+    main.run_in_db_thread = threaded
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measure /chats/ latency under concurrency with queries on the "
+        "event loop versus offloaded to the database threadpool"
+    )
+    parser.add_argument(
+        "--database", type=Path, help="database to query (default: the project database)"
+    )
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=20, help="requests per client")
+    parser.add_argument("--slow-every", type=int, default=10)
+    parser.add_argument(
+        "--term", default="subscribed", help="search term for the slow requests"
+    )
+    args = parser.parse_args()
+
+    if args.database is not None:
+        os.environ["DATABASE_PATH"] = str(args.database)
+    asyncio.run(run(args))
+
+
+if "__main__" == __name__:
+    main()
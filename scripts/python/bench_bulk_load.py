@@ -0,0 +1,65 @@
+from datetime import datetime, timezone
+from pathlib import Path
+import argparse
+import random
+import sys
+import tempfile
+import time
+
+from sqlmodel import create_engine
+
+sys.path.append(str(Path(__file__).resolve().parents[2] / "web" / "backend"))
+from bench_classify import sample_lines  # noqa: E402
+from chatlog import bulk_load, init_db, parse_lines, store_rows  # noqa: E402
+
+
+def make_rows(n):
+    now = datetime.now(timezone.utc)
+    lines = random.Random(0).choices(sample_lines, k=n)
+    return [
+        {
+            "created_at": now,
+            "timestamp": event.time,
+            "channel_name": "sodapoppin",
+            "username": event.usernames[0] if event.usernames else None,
+            "message_text": event.text,
+            "message_type": event.type,
+            "details": event.details,
+        }
+        for event in parse_lines(lines, "2024-11-10")
+        if event.type is not None
+    ]
+
+
+def load(db_path, rows, bulk, chunk_size):
+    engine = create_engine(f"sqlite:///{db_path}")
+    init_db(engine)
+
+    started = time.perf_counter()
+    with bulk_load(engine) if bulk else engine.connect() as conn:
+        store_rows(conn, iter(rows), chunk_size, progress=False)
+    elapsed = time.perf_counter() - started
+
+    engine.dispose()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare load time with and without chatlog.bulk_load"
+    )
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--chunk-size", type=int, default=10_000)
+    args = parser.parse_args()
+
+    rows = make_rows(args.rows)
+    print(f"{len(rows)} rows, {args.chunk_size} rows per transaction")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, bulk in [("default", False), ("bulk", True)]:
+            elapsed = load(Path(tmp) / f"{name}.db", rows, bulk, args.chunk_size)
+            print(f"{name:>8}: {elapsed:.2f}s ({len(rows) / elapsed:,.0f} rows/sec)")
+
+
+if "__main__" == __name__:
+    main()
@@ -0,0 +1,103 @@
+from pathlib import Path
+import argparse
+import sys
+import time
+
+sys.path.append(str(Path(__file__).resolve().parents[2] / "web" / "backend"))
+from chatlog import classify, patterns  # noqa: E402
+
+
+sample_lines = [
+    "[19:24:36] sodapoppin is live!",
+    "[19:24:37] alice subscribed at Tier 1.",
+    "[19:24:38] bob subscribed with Prime.",
+    "[19:24:39] carol subscribed at Tier 1. They've subscribed for 5 months!",
+    "[19:24:39] carol subscribed with Prime. They've subscribed for 1 month!",
+    "[19:24:40] dave subscribed with Prime. They've subscribed for 12 months, currently on a 3 month streak!",
+    "[19:24:41] erin subscribed at Tier 1 for 3 months in advance, reaching 10 months cumulatively so far!",
+    "[19:24:41] erin subscribed at Tier 2 for 1 month in advance!",
+    "[19:24:42] frank is gifting 5 Tier 1 Subs to sodapoppin's community! They've gifted a total of 50 in the channel!",
+    "[19:24:43] frank gifted a Tier 1 sub to gina! They have given 50 Gift Subs in the channel!",
+    "[19:24:43] frank gifted a Tier 1 sub to gina!",
+    "[19:24:44] hank gifted a Tier 1 sub to ivan! This is their first Gift Sub in the channel!",
+    "[19:24:45] AnAnonymousGifter is gifting 10 Tier 1 Subs to sodapoppin's community!",
+    "[19:24:46] An anonymous user gifted 3 months of a Tier 1 sub to judy!",
+    "[19:24:46] An anonymous user gifted a Tier 1 sub to judy!",
+    "[19:24:47] kim has been timed out for 10m 0s.",
+    "[19:24:48] leo has been permanently banned.",
+    "[19:24:49] 1234 raiders from mallory have joined!",
+    "[19:24:49] 1 raider from mallory have joined!",
+    "[19:24:50] This room is now in emote-only mode.",
+    "[19:24:51] This room is no longer in emote-only mode.",
+    "[19:24:52] Announcement",
+    "[19:24:53] nina: hello chat",
+    "[19:24:53] nina: who subscribed at Tier 3?",
+    "[19:24:53] nina: frank gifted a Tier 1 sub to gina!",
+    "[19:24:53] nina: kim has been timed out for 10m 0s.",
+    "[19:24:53] nina: This room is now in emote-only mode.",
+    "[19:24:53] nina: Announcement",
+    "[19:24:54] 한국인 oscar: 안녕하세요",
+    "[19:24:54] 한국인 oscar: raiders incoming",
+    "[19:24:55] some unmatched line !!",
+    "[19:24:55] peggy subscribed at Tier 1 but then left",
+    "",
+]
+
+
+def classify_sequential(message):
+    for pattern_name, pattern in patterns.items():
+        match = pattern.match(message)
+        if match:
+            return pattern_name, match.groups()
+    return None, None
+
+
+def load_corpus(filenames):
+    corpus = list(sample_lines)
+    for filename in filenames:
+        with open(filename, "r", encoding="utf-8") as f:
+            corpus.extend(line.strip() for line in f)
+    return corpus
+
+
+def time_classifier(fn, corpus, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for message in corpus:
+            fn(message)
+    elapsed = time.perf_counter() - started
+    return len(corpus) * repeat / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Check classify() against the sequential pattern loop and time both"
+    )
+    parser.add_argument("filenames", nargs="*", type=Path, help="extra log files")
+    parser.add_argument("--repeat", type=int, default=1000)
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.filenames)
+
+    mismatches = 0
+    for message in corpus:
+        expected = classify_sequential(message)
+        actual = classify(message)
+        if actual != expected:
+            mismatches += 1
+            print(f"mismatch: {message!r}\n  sequential: {expected}\n  classify:   {actual}")
+
+    print(f"{len(corpus)} lines, {mismatches} mismatches")
+
+    repeat = max(1, args.repeat * len(sample_lines) // len(corpus))
+    sequential = time_classifier(classify_sequential, corpus, repeat)
+    dispatched = time_classifier(classify, corpus, repeat)
+    print(f"sequential: {sequential:,.0f} lines/sec")
+    print(f"classify:   {dispatched:,.0f} lines/sec ({dispatched / sequential:.1f}x)")
+
+    if mismatches:
+        sys.exit(1)
+
+
+if "__main__" == __name__:
+    main()
@@ -0,0 +1,153 @@
+from collections import Counter
+from datetime import datetime, timezone
+from pathlib import Path
+import argparse
+import random
+import sys
+import tempfile
+import time
+
+from sqlmodel import create_engine
+
+sys.path.append(str(Path(__file__).resolve().parents[2] / "web" / "backend"))
+from bench_classify import sample_lines  # noqa: E402
+from chatlog import CHUNK_SIZE, classify, init_db, parse_lines, store_rows  # noqa: E402
+from chatlog.events import rebuild_events, top_gifters_query  # noqa: E402
+from chatlog.names import NAMED_MESSAGES  # noqa: E402
+from chatlog.patterns import chat_patterns, patterns, single_gift_patterns  # noqa: E402
+
+
+def mixed_rows(n, chat_share):
+    """Row dicts from sample_lines, ``chat_share`` of them chat messages."""
+    rng = random.Random(0)
+    kinds = {line: classify(line)[0] for line in sample_lines if line}
+    chat = [line for line, kind in kinds.items() if kind in chat_patterns]
+    other = [line for line, kind in kinds.items() if kind not in chat_patterns]
+    lines = [rng.choice(chat if rng.random() < chat_share else other) for _ in range(n)]
+    now = datetime.now(timezone.utc)
+    return [
+        {
+            "created_at": now,
+            "timestamp": event.time,
+            "channel_name": rng.choice(["sodapoppin", "xqc"]),
+            "username": event.usernames[0] if event.usernames else None,
+            "message_text": event.text,
+            "message_type": event.type,
+            "details": event.details,
+        }
+        for event in parse_lines(lines, "2024-11-10")
+        if event.type is not None
+    ]
+
+
+def load(engine, rows, chunk_size):
+    started = time.perf_counter()
+    with engine.connect() as conn:
+        store_rows(conn, iter(rows), chunk_size, progress=False)
+    return time.perf_counter() - started
+
+
+def event_bytes(engine):
+    """Bytes of the chatevent table and its indexes, from SQLite's dbstat table."""
+    with engine.connect() as conn:
+        return conn.exec_driver_sql(
+            "SELECT sum(pgsize) FROM dbstat WHERE name = 'chatevent' "
+            "OR name IN (SELECT name FROM sqlite_master WHERE tbl_name = 'chatevent')"
+        ).scalar()
+
+
+def snapshot(engine):
+    with engine.connect() as conn:
+        return conn.exec_driver_sql("SELECT * FROM chatevent ORDER BY message_id").all()
+
+
+def gifters_from_text(conn):
+    """Top gifters the way it was done before ChatEvent: a regex over every message."""
+    placeholders = ", ".join("?" for _ in single_gift_patterns)
+    counts = Counter()
+    for username, message_type, text in conn.exec_driver_sql(
+        f"SELECT username, message_type, message_text FROM {NAMED_MESSAGES} "
+        f"WHERE message_type IN ({placeholders})",
+        tuple(single_gift_patterns),
+    ):
+        if patterns[message_type].match(f"[00:00:00] {text}"):
+            counts[username] += 1
+    return sorted(counts.items(), key=lambda item: (-item[1], item[0]))
+
+
+def gifters_from_events(conn):
+    return [tuple(row) for row in conn.execute(top_gifters_query())]
+
+
+def timed(engine, fetch, repeat):
+    with engine.connect() as conn:
+        result = fetch(conn)
+        started = time.perf_counter()
+        for _ in range(repeat):
+            fetch(conn)
+    return result, (time.perf_counter() - started) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measure what storing sub/gift/raid/timeout fields in ChatEvent "
+        "costs on ingest, and what it saves on an aggregate query"
+    )
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument(
+        "--chat-share",
+        type=float,
+        nargs="+",
+        default=[0.5, 0.95],
+        help="share of chat messages among the rows; events make up the rest",
+    )
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    failed = False
+    with tempfile.TemporaryDirectory() as tmp:
+        for chat_share in args.chat_share:
+            rows = mixed_rows(args.rows, chat_share)
+            events = sum(1 for row in rows if row["details"] is not None)
+            print(f"\n{len(rows)} rows, {events} with a ChatEvent ({chat_share:.0%} chat)")
+
+            engines = {}
+            for name in ["without", "with"]:
+                engines[name] = engine = create_engine(
+                    f"sqlite:///{Path(tmp) / f'{name}-{chat_share}.db'}"
+                )
+                init_db(engine)
+                load_rows = rows
+                if name == "without":
+                    load_rows = [{**row, "details": None} for row in rows]
+                elapsed = load(engine, load_rows, args.chunk_size)
+                print(f"{name:>8} ChatEvent: {len(rows) / elapsed:10,.0f} rows/sec")
+            mib = 1024 * 1024
+            print(f"ChatEvent and its indexes: {event_bytes(engines['with']) / mib:.1f} MiB")
+
+            stored = snapshot(engines["with"])
+            with engines["with"].begin() as conn:
+                rebuild_events(conn)
+            if snapshot(engines["with"]) != stored:
+                print("ChatEvent rows differ from the ones rebuilt from message_text")
+                failed = True
+
+            from_text, text_ms = timed(engines["without"], gifters_from_text, args.repeat)
+            from_events, events_ms = timed(engines["with"], gifters_from_events, args.repeat)
+            if from_text != from_events:
+                print("top gifters differ")
+                failed = True
+            print(
+                f"top gifters: regex over message_text {text_ms:.1f} ms, "
+                f"ChatEvent {events_ms:.1f} ms"
+            )
+            for engine in engines.values():
+                engine.dispose()
+
+    if failed:
+        sys.exit(1)
+
+
+if "__main__" == __name__:
+    main()
@@ -0,0 +1,188 @@
+from pathlib import Path
+import argparse
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+from sqlalchemy import Column, Index, Integer, MetaData, String, Table, insert
+from sqlmodel import create_engine, select
+
+sys.path.append(str(Path(__file__).resolve().parents[2] / "web" / "backend"))
+from bench_bulk_load import make_rows  # noqa: E402
+from chatlog import CHUNK_SIZE  # noqa: E402
+from chatlog.models import Channel, ChatMessage, ChatUser, MessageType  # noqa: E402
+from chatlog.names import chat_columns, names  # noqa: E402
+from chatlog.queries import chats_query  # noqa: E402
+
+channels = ["sodapoppin", "xqc", "forsen", "pokimane", "shroud", "summit1g"]
+
+# chatmessage as it was before the lookup tables, with the same column types
+columns = ChatMessage.__table__.c
+string_table = Table(
+    "chatmessage",
+    MetaData(),
+    Column("created_at", columns.created_at.type, nullable=False),
+    Column("timestamp", columns.timestamp.type, nullable=False),
+    Column("channel_name", String, nullable=False),
+    Column("username", String),
+    Column("message_text", columns.message_text.type, nullable=False),
+    Column("message_type", String, nullable=False),
+    Column("id", Integer, primary_key=True),
+)
+for columns in [
+    ["created_at"],
+    ["timestamp"],
+    ["channel_name", "timestamp"],
+    ["username", "timestamp"],
+    ["message_type", "timestamp"],
+    ["channel_name", "username", "timestamp"],
+    ["channel_name", "message_type", "timestamp"],
+]:
+    Index(f"ix_chatmessage_{'_'.join(columns)}", *(string_table.c[c] for c in columns))
+
+
+def spread_rows(n, users):
+    """make_rows() spread over several channels and ``users`` chatters.
+
+    A few chatters write most messages, like in a real chat.
+    """
+    rng = random.Random(1)
+    rows = make_rows(n)
+    pool = [f"chatter_{i}" for i in range(users)]
+    picks = rng.choices(pool, weights=[1 / (i + 1) for i in range(users)], k=len(rows))
+    for row, username in zip(rows, picks):
+        row["channel_name"] = rng.choice(channels)
+        if row["username"] is not None:
+            row["username"] = username
+    return rows
+
+
+def load(engine, rows, chunk_size, encode):
+    started = time.perf_counter()
+    with engine.connect() as conn:
+        for i in range(0, len(rows), chunk_size):
+            chunk = rows[i : i + chunk_size]
+            with conn.begin():
+                if encode:
+                    conn.execute(insert(ChatMessage), names(conn).encode(conn, chunk))
+                else:
+                    conn.execute(insert(string_table), chunk)
+        conn.exec_driver_sql("ANALYZE")
+        conn.commit()
+    return time.perf_counter() - started
+
+
+def sizes(engine):
+    """(type, name, bytes) of every table and index, from SQLite's dbstat table."""
+    with engine.connect() as conn:
+        return conn.exec_driver_sql(
+            "SELECT m.type, s.name, sum(s.pgsize) FROM dbstat s "
+            "JOIN sqlite_master m ON m.name = s.name "
+            "GROUP BY s.name ORDER BY m.type DESC, s.name"
+        ).all()
+
+
+def string_query(filters, order_by, desc):
+    """chats_query() for string_table."""
+    stmt = select(string_table).where(
+        *(string_table.c[name] == value for name, value in filters.items())
+    )
+    columns = [string_table.c.timestamp, string_table.c.id]
+    if order_by != "timestamp":
+        columns.insert(0, string_table.c[order_by])
+    return stmt.order_by(*(c.desc() if desc else c for c in columns))
+
+
+def measure(engine, fetch, repeat):
+    with engine.connect() as conn:
+        fetch(conn)
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            fetch(conn)
+            timings.append(time.perf_counter() - started)
+    return statistics.median(timings) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare DB size, index size and /chats/ filter latency with "
+        "channel, user and message type stored as strings and as lookup ids"
+    )
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--users", type=int, default=20_000)
+    parser.add_argument("--limit", type=int, default=100, help="rows per page")
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    args = parser.parse_args()
+
+    rows = spread_rows(args.rows, args.users)
+    user = rows[0]["username"] or "chatter_0"
+    print(f"{len(rows)} rows, {len(channels)} channels, up to {args.users} chatters")
+
+    cases = {
+        "channel": ({"channel_name": "xqc"}, "timestamp", True),
+        "user": ({"username": user}, "timestamp", True),
+        "message_type": ({"message_type": "raid"}, "timestamp", True),
+        "channel+user": ({"channel_name": "xqc", "username": user}, "timestamp", True),
+        "channel+type": ({"channel_name": "xqc", "message_type": "raid"}, "timestamp", False),
+        "order by user": ({"channel_name": "xqc"}, "username", False),
+        "order by type": ({}, "message_type", True),
+    }
+
+    with tempfile.TemporaryDirectory() as tmp:
+        strings = create_engine(f"sqlite:///{Path(tmp) / 'strings.db'}")
+        string_table.metadata.create_all(strings)
+        ids = create_engine(f"sqlite:///{Path(tmp) / 'ids.db'}")
+        for model in [Channel, ChatUser, MessageType, ChatMessage]:
+            model.__table__.create(ids)
+
+        mib = 1024 * 1024
+        for name, engine, encode in [("strings", strings, False), ("ids", ids, True)]:
+            elapsed = load(engine, rows, args.chunk_size, encode)
+            size = Path(engine.url.database).stat().st_size
+            print(
+                f"\n{name}: loaded at {len(rows) / elapsed:,.0f} rows/sec, "
+                f"file {size / mib:.1f} MiB"
+            )
+            totals = {}
+            for kind, obj, nbytes in sizes(engine):
+                totals[kind] = totals.get(kind, 0) + nbytes
+                print(f"  {kind:>5} {obj:<52} {nbytes / mib:7.2f} MiB")
+            for kind, nbytes in totals.items():
+                plural = "indexes" if kind == "index" else "tables"
+                print(f"  {'all ' + plural:<58} {nbytes / mib:7.2f} MiB")
+
+        print(f"\nfirst {args.limit} rows, median of {args.repeat} runs")
+        print(f"{'':>14} {'strings':>10} {'ids':>10}")
+        for case, (filters, order_by, desc) in cases.items():
+            old = string_query(filters, order_by, desc).limit(args.limit)
+            new = chats_query(
+                **filters, order_by=order_by, desc=desc, columns=chat_columns
+            ).limit(args.limit)
+
+            def fetch_strings(conn):
+                return conn.execute(old).all()
+
+            def fetch_ids(conn):
+                return names(conn).decode(conn, conn.execute(new).all())
+
+            with strings.connect() as a, ids.connect() as b:
+                expected = [row.id for row in fetch_strings(a)]
+                if expected != [row.id for row in fetch_ids(b)]:
+                    print(f"{case}: results differ")
+                    sys.exit(1)
+
+            print(
+                f"{case:>14} {measure(strings, fetch_strings, args.repeat):7.3f} ms "
+                f"{measure(ids, fetch_ids, args.repeat):7.3f} ms"
+            )
+
+        strings.dispose()
+        ids.dispose()
+
+
+if "__main__" == __name__:
+    main()
@@ -0,0 +1,88 @@
+from pathlib import Path
+import argparse
+import sys
+import tempfile
+import time
+import uuid
+
+from sqlalchemy import (
+    Column,
+    DateTime,
+    Index,
+    Integer,
+    MetaData,
+    String,
+    Table,
+    Uuid,
+    insert,
+)
+from sqlmodel import create_engine
+
+sys.path.append(str(Path(__file__).resolve().parents[2] / "web" / "backend"))
+from bench_bulk_load import make_rows  # noqa: E402
+from chatlog import CHUNK_SIZE  # noqa: E402
+
+
+def named_table(id_type):
+    """chatmessage as it was before the lookup tables, with ids of id_type."""
+    table = Table(
+        "chatmessage",
+        MetaData(),
+        Column("id", id_type, primary_key=True),
+        Column("created_at", DateTime, nullable=False),
+        Column("timestamp", DateTime, nullable=False),
+        Column("channel_name", String, nullable=False),
+        Column("username", String),
+        Column("message_text", String, nullable=False),
+        Column("message_type", String, nullable=False),
+    )
+    for column in ["created_at", "timestamp", "channel_name", "username", "message_type"]:
+        Index(f"ix_chatmessage_{column}", table.c[column])
+    return table
+
+
+# chatmessage before and after the integer primary key
+uuid_table = named_table(Uuid)
+integer_table = named_table(Integer)
+
+
+def load(db_path, table, rows, chunk_size):
+    engine = create_engine(f"sqlite:///{db_path}")
+    table.metadata.create_all(engine)
+    if table is uuid_table:
+        rows = [{"id": uuid.uuid4(), **row} for row in rows]
+
+    stmt = insert(table)
+    started = time.perf_counter()
+    with engine.connect() as conn:
+        for i in range(0, len(rows), chunk_size):
+            with conn.begin():
+                conn.execute(stmt, rows[i : i + chunk_size])
+    elapsed = time.perf_counter() - started
+
+    engine.dispose()
+    return elapsed, db_path.stat().st_size
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare insert throughput and DB size for uuid4 and integer ids"
+    )
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    args = parser.parse_args()
+
+    rows = make_rows(args.rows)
+    print(f"{len(rows)} rows, {args.chunk_size} rows per transaction")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, table in [("uuid4", uuid_table), ("integer", integer_table)]:
+            elapsed, size = load(Path(tmp) / f"{name}.db", table, rows, args.chunk_size)
+            print(
+                f"{name:>8}: {elapsed:.2f}s ({len(rows) / elapsed:,.0f} rows/sec), "
+                f"{size / 1024 / 1024:.1f} MiB"
+            )
+
+
+if "__main__" == __name__:
+    main()
@@ -0,0 +1,88 @@
+from pathlib import Path
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+from sqlmodel import Session, create_engine, select
+
+sys.path.append(str(Path(__file__).resolve().parents[2] / "web" / "backend"))
+from bench_bulk_load import make_rows  # noqa: E402
+from chatlog import init_db, insert_rows  # noqa: E402
+from chatlog.models import ChatMessageRead  # noqa: E402
+
+
+def model_path(session, limit):
+    """GET /chats/ before: response_model validation of every row, json.dumps."""
+    import main
+
+    rows = session.exec(select(*main.chat_columns).limit(limit)).all()
+    rows = main.decode_rows(session, rows)
+    validated = TypeAdapter(list[ChatMessageRead]).validate_python(
+        rows, from_attributes=True
+    )
+    content = jsonable_encoder(validated)
+    return json.dumps(
+        content, ensure_ascii=False, allow_nan=False, separators=(",", ":")
+    ).encode()
+
+
+def tuple_path(session, limit):
+    """GET /chats/ now: plain rows of chat_columns encoded with orjson."""
+    import main
+
+    rows = session.exec(select(*main.chat_columns).limit(limit)).all()
+    return main.encode_rows(main.decode_rows(session, rows))
+
+
+def measure(fn, session, limit, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn(session, limit)
+        timings.append(time.perf_counter() - started)
+    return min(timings) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare the per-request cost of encoding /chats/ pages via "
+        "ChatMessage models and via plain rows"
+    )
+    parser.add_argument("--rows", type=int, default=20_000)
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--limits", type=int, nargs="+", default=[100, 1000, 10_000])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = Path(tmp) / "serialization.db"
+        os.environ["DATABASE_PATH"] = str(db_path)
+        engine = create_engine(f"sqlite:///{db_path}")
+        init_db(engine)
+        with engine.begin() as conn:
+            insert_rows(conn, make_rows(args.rows))
+
+        with Session(engine) as session:
+            for limit in args.limits:
+                old = model_path(session, limit)
+                new = tuple_path(session, limit)
+                if json.loads(old) != json.loads(new):
+                    print(f"limit={limit}: encodings differ")
+                    sys.exit(1)
+
+                old_ms = measure(model_path, session, limit, args.repeat)
+                new_ms = measure(tuple_path, session, limit, args.repeat)
+                print(
+                    f"limit={limit:>6}: models {old_ms:8.2f} ms  rows+orjson "
+                    f"{new_ms:8.2f} ms  ({old_ms / new_ms:.1f}x)"
+                )
+
+        engine.dispose()
+
+
+if "__main__" == __name__:
+    main()
@@ -0,0 +1,388 @@
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta, timezone
+from itertools import combinations
+from pathlib import Path
+import argparse
+import asyncio
+import importlib
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+backend = Path(__file__).resolve().parents[2] / "web" / "backend"
+sys.path.append(str(backend))
+from chatlog import bulk_load, classify, init_db, new_pattern_counts, parse_lines  # noqa: E402
+from chatlog.connections import write_engine  # noqa: E402
+from chatlog.ingest import parse_chunk, plan_ingest, store_chunks  # noqa: E402
+from chatlog.logfiles import find_log_files  # noqa: E402
+from chatlog.metrics import new_stage_timings, stage_rates  # noqa: E402
+from generate_logs import check_templates, generate  # noqa: E402
+
+
+# the /chats/ filters bench_chats() combines; time_range sets both datetimes
+chats_filters = ["channel_name", "username", "message_type", "time_range"]
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def generated_logs(work_dir, lines, seed):
+    """Logs of about ``lines`` lines in work_dir, written on first use.
+
+    Returns their directory and the lines written per pattern.
+    """
+    root = work_dir / f"logs-{lines}-{seed}"
+    counts_path = root / "counts.json"
+    if counts_path.exists():
+        print(f"reusing {root}")
+        return root, json.loads(counts_path.read_text())
+
+    started = time.perf_counter()
+    counts = generate(root, lines, seed=seed)
+    counts_path.write_text(json.dumps(counts))
+    print(f"generated {sum(counts.values())} lines in {time.perf_counter() - started:.1f}s")
+    return root, counts
+
+
+def bench_classify(paths, max_lines, repeat):
+    """classify() and parse_lines() throughput over the first max_lines lines."""
+    lines = []
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as f:
+            lines.extend(line.rstrip("\n") for line in f)
+        if len(lines) >= max_lines:
+            break
+    lines = lines[:max_lines]
+    messages = [line for line in lines if line.startswith("[")]
+
+    def best_of(fn):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            fn()
+            timings.append(time.perf_counter() - started)
+        return min(timings)
+
+    def run_classify():
+        for message in messages:
+            classify(message)
+
+    classify_seconds = best_of(run_classify)
+    parse_seconds = best_of(lambda: sum(1 for _ in parse_lines(lines)))
+    return {
+        "lines": len(lines),
+        "classify_lines_per_sec": len(messages) / classify_seconds,
+        "parse_lines_per_sec": len(lines) / parse_seconds,
+    }
+
+
+def bench_ingest(root, db_path, workers, bulk, expected):
+    """Load root into a new database the way backfill.py does."""
+    engine = write_engine(db_path)
+    init_db(engine)
+    with engine.connect() as conn:
+        tasks, stats, _ = plan_ingest(conn, find_log_files(root))
+
+    counts = new_pattern_counts()
+    timings = new_stage_timings()
+    now = datetime.now(timezone.utc)
+    with bulk_load(engine) if bulk else engine.connect() as conn:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            total, elapsed = store_chunks(
+                conn,
+                tasks,
+                pool.map(parse_chunk, tasks),
+                stats,
+                now,
+                counts,
+                progress=False,
+                timings=timings,
+            )
+    engine.dispose()
+    return {
+        "rows": total,
+        "seconds": elapsed,
+        "rows_per_sec": total / elapsed,
+        "stage_lines_per_sec": stage_rates(timings),
+        "counts_match": counts == expected,
+    }
+
+
+def db_size(db_path, rows):
+    """Bytes of the database file, per row and per table with its indexes."""
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        tables = dict(
+            conn.execute(
+                "SELECT coalesce(m.tbl_name, s.name), sum(s.pgsize) FROM dbstat s "
+                "LEFT JOIN sqlite_master m ON m.name = s.name "
+                "GROUP BY 1 ORDER BY 2 DESC"
+            )
+        )
+    finally:
+        conn.close()
+    size = os.path.getsize(db_path)
+    return {"bytes": size, "bytes_per_row": size / max(rows, 1), "tables": tables}
+
+
+def filter_values(db_path, rng):
+    """Channel names, usernames, message types and a time span to filter on."""
+    conn = sqlite3.connect(db_path)
+    try:
+        channels = [name for (name,) in conn.execute("SELECT name FROM channel")]
+        # the users of random messages, so busy chatters come up more often
+        (max_id,) = conn.execute("SELECT max(id) FROM chatmessage").fetchone()
+        ids = [rng.randint(1, max_id) for _ in range(1000)]
+        users = [
+            name
+            for (name,) in conn.execute(
+                "SELECT u.name FROM chatmessage m JOIN chatuser u ON u.id = m.user_id "
+                f"WHERE m.id IN ({', '.join('?' for _ in ids)}) AND u.name != ''",
+                ids,
+            )
+        ]
+        types = [name for (name,) in conn.execute("SELECT name FROM messagetype")]
+        first, last = conn.execute(
+            "SELECT min(timestamp), max(timestamp) FROM chatmessage"
+        ).fetchone()
+    finally:
+        conn.close()
+    span = tuple(
+        datetime.fromisoformat(value).replace(tzinfo=timezone.utc) for value in [first, last]
+    )
+    return channels, users or [""], types, span
+
+
+def chats_params(combo, values, rng):
+    channels, users, types, (first, last) = values
+    params = {"limit": 100}
+    if "channel_name" in combo:
+        params["channel_name"] = rng.choice(channels)
+    if "username" in combo:
+        params["username"] = rng.choice(users)
+    if "message_type" in combo:
+        params["message_type"] = rng.choice(types)
+    if "time_range" in combo:
+        hours = max(int((last - first).total_seconds() // 3600), 1)
+        start = first + timedelta(hours=rng.randrange(hours))
+        params["start_datetime"] = start.isoformat()
+        params["end_datetime"] = (start + timedelta(hours=1)).isoformat()
+    return params
+
+
+async def bench_chats(db_path, requests, seed):
+    """GET /chats/ latency for each combination of filters, with the cache off."""
+    os.environ["DATABASE_PATH"] = str(db_path)
+    os.environ["CACHE_SIZE"] = "0"
+    api = sys.modules.get("main")
+    api = importlib.reload(api) if api is not None else importlib.import_module("main")
+    rng = random.Random(seed)
+    values = filter_values(db_path, rng)
+
+    results = {}
+    transport = httpx.ASGITransport(app=api.app)
+    async with api.lifespan(api.app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            for size in range(len(chats_filters) + 1):
+                for combo in combinations(chats_filters, size):
+                    latencies = []
+                    rows = []
+                    for _ in range(requests):
+                        params = chats_params(combo, values, rng)
+                        started = time.perf_counter()
+                        response = await client.get("/chats/", params=params)
+                        latencies.append(time.perf_counter() - started)
+                        response.raise_for_status()
+                        rows.append(len(response.json()))
+                    name = "+".join(combo) or "unfiltered"
+                    results[name] = {
+                        "p50_ms": statistics.median(latencies) * 1000,
+                        "p99_ms": percentile(latencies, 0.99) * 1000,
+                        "mean_ms": statistics.fmean(latencies) * 1000,
+                        "rows_mean": statistics.fmean(rows),
+                    }
+                    print(
+                        f"  /chats/ {name:<50} p50 {results[name]['p50_ms']:8.1f} ms"
+                        f"  p99 {results[name]['p99_ms']:8.1f} ms"
+                    )
+    api.engine.dispose()
+    return results
+
+
+def run_size(lines, args, work_dir):
+    print(f"\n== {lines:,} lines")
+    root, expected = generated_logs(work_dir, lines, args.seed)
+    paths = find_log_files(root)
+    result = {
+        "lines": sum(expected.values()),
+        "log_bytes": sum(path.stat().st_size for path in paths),
+    }
+
+    result["classify"] = bench_classify(paths, args.classify_lines, args.repeat)
+    print(
+        f"classify {result['classify']['classify_lines_per_sec']:,.0f} lines/sec, "
+        f"parse_lines {result['classify']['parse_lines_per_sec']:,.0f} lines/sec"
+    )
+
+    db_path = work_dir / f"bench-{lines}-{args.seed}.db"
+    for suffix in ["", "-wal", "-shm"]:
+        Path(f"{db_path}{suffix}").unlink(missing_ok=True)
+    result["ingest"] = bench_ingest(root, db_path, args.workers, args.bulk, expected)
+    print(
+        f"ingest {result['ingest']['rows']} rows at "
+        f"{result['ingest']['rows_per_sec']:,.0f} rows/sec"
+    )
+    if not result["ingest"]["counts_match"]:
+        print("ingest pattern counts differ from the generated lines")
+
+    result["db"] = db_size(db_path, result["ingest"]["rows"])
+    print(f"database {result['db']['bytes'] / 1024 / 1024:,.1f} MiB")
+
+    result["chats"] = asyncio.run(bench_chats(db_path, args.requests, args.seed))
+    if not args.keep:
+        db_path.unlink()
+    return result
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "describe", "--always", "--dirty"],
+            cwd=backend,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def flatten(results, prefix=""):
+    """``{"1000000.ingest.rows_per_sec": value, ...}`` of the numbers in results."""
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{name}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def compare(baseline, current, tolerance):
+    """Print how each metric moved from baseline; return the ones that got worse.
+
+    Metrics ending in ``_per_sec`` are better higher, ones ending in ``_ms``
+    or ``bytes_per_row`` better lower; anything else is not compared.
+    """
+    old = flatten(baseline["results"])
+    new = flatten(current["results"])
+    regressions = []
+    for name in sorted(old.keys() & new.keys()):
+        if name.endswith("_per_sec"):
+            change = new[name] / old[name] - 1 if old[name] else 0.0
+        elif name.endswith(("_ms", "bytes_per_row")):
+            change = old[name] / new[name] - 1 if new[name] else 0.0
+        else:
+            continue
+        worse = change < -tolerance
+        if worse:
+            regressions.append(name)
+        print(
+            f"{'WORSE' if worse else '':>5} {name:<70} {old[name]:14,.1f} -> "
+            f"{new[name]:14,.1f} ({change:+.0%})"
+        )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark classify, ingest, database size and /chats/ latency "
+        "on generated logs, writing the results as JSON"
+    )
+    parser.add_argument(
+        "--lines", type=int, nargs="+", default=[1_000_000, 10_000_000]
+    )
+    parser.add_argument("--output", type=Path, default=Path("bench_suite.json"))
+    parser.add_argument(
+        "--compare", type=Path, help="earlier results to compare against"
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.1,
+        help="share a metric may get worse by before --compare fails",
+    )
+    parser.add_argument(
+        "--work-dir",
+        type=Path,
+        help="where logs and databases go; generated logs are reused from here",
+    )
+    parser.add_argument(
+        "--keep", action="store_true", help="keep the databases in --work-dir"
+    )
+    parser.add_argument("--workers", type=int, default=None, help="parser processes")
+    parser.add_argument(
+        "--bulk", action="store_true", help="ingest with chatlog.bulk_load"
+    )
+    parser.add_argument("--classify-lines", type=int, default=1_000_000)
+    parser.add_argument("--requests", type=int, default=50, help="per filter combination")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    check_templates(args.seed)
+    current = {
+        "meta": {
+            "started_at": datetime.now(timezone.utc).isoformat(),
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "args": {
+                key: str(value) if isinstance(value, Path) else value
+                for key, value in vars(args).items()
+            },
+        },
+        "results": {},
+    }
+
+    with tempfile.TemporaryDirectory() as tmp:
+        work_dir = args.work_dir or Path(tmp)
+        work_dir.mkdir(parents=True, exist_ok=True)
+        for lines in args.lines:
+            current["results"][str(lines)] = run_size(lines, args, work_dir)
+            # written after every size, so a long run leaves partial results
+            args.output.write_text(json.dumps(current, indent=2))
+    print(f"\nwrote {args.output}")
+
+    failed = not all(
+        result["ingest"]["counts_match"] for result in current["results"].values()
+    )
+    if args.compare is not None:
+        print(f"\ncompared to {args.compare}:")
+        regressions = compare(
+            json.loads(args.compare.read_text()), current, args.tolerance
+        )
+        if regressions:
+            print(f"{len(regressions)} metrics got worse by more than {args.tolerance:.0%}")
+            failed = True
+    if failed:
+        sys.exit(1)
+
+
+if "__main__" == __name__:
+    main()
@@ -0,0 +1,106 @@
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+import argparse
+import random
+import sys
+import time
+
+sys.path.append(str(Path(__file__).resolve().parents[2] / "web" / "backend"))
+from chatlog import classify, parse_lines  # noqa: E402
+from chatlog.parser import StreamClock  # noqa: E402
+
+
+def make_times(n, lines_per_second, rng):
+    """``HH:MM:SS`` times of n lines of a stream starting at 20:00, in bursts.
+
+    Also returns the datetimes the times stand for.
+    """
+    at = datetime(2024, 11, 10, 20, 0, 0, tzinfo=timezone.utc)
+    times = []
+    expected = []
+    for _ in range(n):
+        at += timedelta(seconds=rng.expovariate(lines_per_second))
+        times.append(f"{at:%H:%M:%S}")
+        expected.append(at.replace(microsecond=0))
+    return times, expected
+
+
+def resolve_strptime(times, stream_date):
+    """What parse_lines() did before StreamClock, without the midnight rollover."""
+    return [
+        datetime.strptime(f"{stream_date} {t}", "%Y-%m-%d %H:%M:%S").replace(
+            tzinfo=timezone.utc
+        )
+        for t in times
+    ]
+
+
+def resolve_clock(times, stream_date):
+    clock = StreamClock(stream_date)
+    return [clock(t) for t in times]
+
+
+def best_of(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Time turning HH:MM:SS into datetimes with strptime and with StreamClock"
+    )
+    parser.add_argument("filenames", nargs="*", type=Path, help="log files to take times from")
+    parser.add_argument("--lines", type=int, default=500_000)
+    parser.add_argument(
+        "--rate", type=float, default=20, help="lines per second of generated times"
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    stream_date = "2024-11-10"
+    expected = None
+    if args.filenames:
+        times = []
+        for filename in args.filenames:
+            with open(filename, "r", encoding="utf-8") as f:
+                for line in f:
+                    _, groups = classify(line.strip())
+                    if groups:
+                        times.append(groups[0])
+    else:
+        times, expected = make_times(args.lines, args.rate, random.Random(1))
+
+    old = resolve_strptime(times, stream_date)
+    new = resolve_clock(times, stream_date)
+    wrong = sum(1 for a, b in zip(old, new) if a != b)
+    print(
+        f"{len(times)} times, {len(set(times))} distinct, "
+        f"{wrong} that strptime dates a day early, as they are past midnight"
+    )
+    if expected is not None and new != expected:
+        print("StreamClock differs from the generated datetimes")
+        sys.exit(1)
+
+    strptime_seconds = best_of(lambda: resolve_strptime(times, stream_date), args.repeat)
+    clock_seconds = best_of(lambda: resolve_clock(times, stream_date), args.repeat)
+    print(f"strptime:    {len(times) / strptime_seconds:12,.0f} lines/sec")
+    print(
+        f"StreamClock: {len(times) / clock_seconds:12,.0f} lines/sec "
+        f"({strptime_seconds / clock_seconds:.1f}x)"
+    )
+
+    lines = [f"[{t}] chatter: message" for t in times]
+    parse_seconds = best_of(lambda: list(parse_lines(lines, stream_date)), args.repeat)
+    print(
+        f"parse_lines: {len(times) / parse_seconds:12,.0f} lines/sec, "
+        f"{clock_seconds / parse_seconds:.0%} of it in StreamClock; strptime alone "
+        f"took {strptime_seconds / parse_seconds:.1f}x as long as all of it"
+    )
+
+
+if "__main__" == __name__:
+    main()
@@ -0,0 +1,202 @@
+from datetime import datetime, timezone
+from pathlib import Path
+import argparse
+import asyncio
+import importlib
+import json
+import os
+import sys
+import tempfile
+
+import httpx
+from sqlalchemy import func, select
+
+sys.path.append(str(Path(__file__).resolve().parents[2] / "web" / "backend"))
+sys.path.append(str(Path(__file__).resolve().parent))
+from chatlog import ChatMessage, init_db  # noqa: E402
+from chatlog.archive import archive_before  # noqa: E402
+from chatlog.connections import write_engine  # noqa: E402
+from generate_logs import generate  # noqa: E402
+
+
+# logs of the first load, archived as a whole; later ones start after them
+START = datetime(2024, 11, 10)
+LATER = datetime(2024, 12, 10)
+LIVE = datetime(2024, 12, 20)
+PRUNED = datetime(2025, 1, 10)
+
+ORDERS = ["timestamp", "username", "message_type"]
+
+
+def check(ok, message):
+    print(f"{'ok' if ok else 'FAILED'}: {message}")
+    return ok
+
+
+async def walk(client, params, limit=1000):
+    """Every row of a /chats/ query, page by page with X-Next-Cursor."""
+    rows = []
+    cursor = None
+    while True:
+        page_params = {**params, "limit": limit}
+        if cursor is not None:
+            page_params["cursor"] = cursor
+        response = await client.get("/chats/", params=page_params)
+        response.raise_for_status()
+        rows += response.json()
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            return rows
+
+
+def count_rows(engine):
+    with engine.connect() as conn:
+        return conn.execute(select(func.count(ChatMessage.id))).scalar()
+
+
+def min_hot_id(engine):
+    with engine.connect() as conn:
+        return conn.execute(select(func.min(ChatMessage.id))).scalar()
+
+
+async def run(tmp, lines):
+    from backfill import backfill
+
+    # the database the API reads, at DATABASE_PATH
+    engine = write_engine(Path(os.environ["DATABASE_PATH"]))
+    archive_dir = Path(os.environ["ARCHIVE_PATH"])
+    init_db(engine)
+    backfill(tmp / "old", workers=1, engine=engine)
+    archived = count_rows(engine)
+
+    api = importlib.import_module("main")
+    transport = httpx.ASGITransport(app=api.app)
+    results = []
+    async with api.lifespan(api.app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://check") as client:
+            # the API follows new rows from the largest id it saw before archiving
+            live = {"channel_name": "xqc", "start_datetime": "2024-12-20T00:00:00Z"}
+            before = len((await client.get("/chats/", params=live)).json())
+
+            archive_before(engine, archive_dir, datetime.now(timezone.utc), progress=False)
+            results.append(
+                check(count_rows(engine) == 0, f"all {archived} rows are archived")
+            )
+
+            # new rows, with ChatEvent rows of their own, after the old ones are gone
+            generate(tmp / "later", lines // 2, lines_per_stream=2_000, start=LATER, seed=1)
+            backfill(tmp / "later", workers=1, engine=engine)
+            generate(tmp / "live", 500, channels=["xqc"], start=LIVE, seed=2)
+            backfill(tmp / "live", workers=1, engine=engine)
+            hot = count_rows(engine)
+
+            await asyncio.sleep(api.STREAM_POLL_INTERVAL * 4)
+            after = len((await client.get("/chats/", params=live)).json())
+            results.append(
+                check(
+                    before == 0 and after > 0,
+                    f"rows stored after archiving are followed ({after} new in xqc)",
+                )
+            )
+
+            for order_by in ORDERS:
+                for desc in [False, True]:
+                    rows = await walk(client, {"order_by": order_by, "desc": desc})
+                    ids = {row["id"] for row in rows}
+                    results.append(
+                        check(
+                            len(rows) == len(ids) == archived + hot,
+                            f"/chats/ by {order_by}{' desc' if desc else ''} walks "
+                            f"{len(rows)} rows with {len(ids)} distinct ids, "
+                            f"{archived} archived and {hot} stored",
+                        )
+                    )
+
+            # a range over archived and stored rows, with and without a timezone
+            aware = {
+                "start_datetime": "2024-11-10T21:00:00Z",
+                "end_datetime": "2024-12-11T00:00:00Z",
+            }
+            naive = {key: value.rstrip("Z") for key, value in aware.items()}
+            first_hot = min_hot_id(engine)
+            for desc in [False, True]:
+                rows = await walk(client, {**aware, "desc": desc})
+                same = await walk(client, {**naive, "desc": desc}) == rows
+                results.append(
+                    check(
+                        same and any(row["id"] < first_hot for row in rows),
+                        f"a time range without a timezone reads the {len(rows)} rows "
+                        f"a UTC one does{' desc' if desc else ''}",
+                    )
+                )
+
+                # /chats/export merges archived rows in as /chats/ does
+                for order_by in ORDERS:
+                    params = {**aware, "order_by": order_by, "desc": desc}
+                    response = await client.get("/chats/export", params=params)
+                    exported = [json.loads(line) for line in response.text.splitlines()]
+                    results.append(
+                        check(
+                            exported == await walk(client, params),
+                            f"/chats/export by {order_by}{' desc' if desc else ''} "
+                            f"streams the {len(exported)} rows /chats/ pages through",
+                        )
+                    )
+
+            response = await client.get("/chats/search", params={"q": "pog"})
+            skipped = response.headers.get("X-Archived-Rows-Skipped")
+            results.append(
+                check(
+                    response.status_code == 200 and skipped == str(archived),
+                    f"/chats/search says {skipped} archived rows were not searched",
+                )
+            )
+    api.engine.dispose()
+
+    # a database archived before next_id was kept, whose archive was then
+    # dropped: only ChatEvent still holds the archived rows' ids
+    archive_before(engine, archive_dir, datetime.now(timezone.utc), progress=False)
+    with engine.begin() as conn:
+        conn.exec_driver_sql("DELETE FROM archivefile")
+        conn.exec_driver_sql("DELETE FROM ingeststate WHERE key = 'next_id'")
+        events = conn.exec_driver_sql("SELECT count(*) FROM chatevent").scalar()
+    generate(tmp / "pruned", lines // 2, lines_per_stream=2_000, start=PRUNED, seed=3)
+    backfill(tmp / "pruned", workers=1, engine=engine)
+    with engine.connect() as conn:
+        stored_events = conn.exec_driver_sql("SELECT count(*) FROM chatevent").scalar()
+    results.append(
+        check(
+            count_rows(engine) > 0 and stored_events > events,
+            f"rows stored past {events} ChatEvent rows of dropped archives",
+        )
+    )
+    engine.dispose()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Check that rows stored after archiving get new ids and are served"
+    )
+    parser.add_argument("--lines", type=int, default=6_000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        generate(
+            tmp / "old", args.lines, lines_per_stream=2_000, start=START, seed=args.seed
+        )
+
+        os.environ["DATABASE_PATH"] = str(tmp / "chat.db")
+        os.environ["ARCHIVE_PATH"] = str(tmp / "archive")
+        os.environ["STREAM_POLL_INTERVAL"] = "0.05"
+        os.environ.pop("SHARD_DIR", None)
+        results = asyncio.run(run(tmp, args.lines))
+
+    if not all(results):
+        sys.exit(1)
+
+
+if "__main__" == __name__:
+    main()
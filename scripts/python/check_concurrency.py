@@ -0,0 +1,260 @@
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from multiprocessing import Process, Queue
+from pathlib import Path
+from queue import Empty
+import argparse
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+from sqlalchemy import func
+from sqlalchemy.exc import OperationalError
+from sqlmodel import Session, create_engine, select
+
+sys.path.append(str(Path(__file__).resolve().parents[2] / "web" / "backend"))
+sys.path.append(str(Path(__file__).resolve().parent))
+from chatlog import ChatMessage, init_db, new_pattern_counts  # noqa: E402
+from chatlog.connections import read_engine, write_engine  # noqa: E402
+from chatlog.db import CHUNK_SIZE  # noqa: E402
+from chatlog.ingest import parse_chunk, plan_ingest, store_chunks  # noqa: E402
+from chatlog.logfiles import find_log_files  # noqa: E402
+from chatlog.models import ChatUser  # noqa: E402
+from chatlog.names import chat_columns, names  # noqa: E402
+from chatlog.queries import chats_query  # noqa: E402
+from chatlog.rollups import message_counts_query, top_chatters_query  # noqa: E402
+from generate_logs import default_channels, generate  # noqa: E402
+
+
+START = datetime(2024, 11, 10)
+
+
+def check(ok, message):
+    print(f"{'ok' if ok else 'FAILED'}: {message}")
+    return ok
+
+
+def engines(db_path, readers, plain):
+    """``(writer, reader)``: chatlog.connections, or with plain the defaults the API used to have."""
+    if plain:
+        writer = create_engine(f"sqlite:///{db_path}")
+        reader = create_engine(
+            f"sqlite:///{db_path}",
+            connect_args={"check_same_thread": False},
+            pool_size=readers,
+            max_overflow=0,
+        )
+        return writer, reader
+    return write_engine(db_path), read_engine(db_path, readers)
+
+
+def store(engine, root, chunk_size=CHUNK_SIZE):
+    """Store the log files under root the way backfill.py does; returns the rows stored."""
+    with engine.connect() as conn:
+        tasks, stats, _ = plan_ingest(conn, find_log_files(root))
+    with engine.connect() as conn:
+        total, _ = store_chunks(
+            conn,
+            tasks,
+            map(parse_chunk, tasks),
+            stats,
+            datetime.now(timezone.utc),
+            new_pattern_counts(),
+            chunk_size,
+            progress=False,
+        )
+    return total
+
+
+def ingest(db_path, root, chunk_size, plain, results):
+    """Writer process: store root, committing every chunk_size rows."""
+    writer, _ = engines(db_path, 1, plain)
+    started = time.perf_counter()
+    try:
+        total = store(writer, root, chunk_size)
+        error = None
+    except OperationalError as e:
+        total = None
+        error = str(e.orig)
+    results.put({"rows": total, "seconds": time.perf_counter() - started, "error": error})
+
+
+def read_queries(usernames, rng):
+    """An endless mix of what the API asks for: /chats/ pages and /stats/ rollups.
+
+    Yields ``(statement, chats)``; rows of /chats/ queries hold lookup ids to decode.
+    """
+    while True:
+        start = START.replace(tzinfo=timezone.utc) + timedelta(hours=rng.randrange(24 * 8))
+        kind = rng.randrange(6)
+        if kind == 0:
+            stmt = chats_query(channel_name=rng.choice(default_channels), columns=chat_columns)
+        elif kind == 1:
+            stmt = chats_query(username=rng.choice(usernames), columns=chat_columns)
+        elif kind == 2:
+            stmt = chats_query(
+                message_type="sub_with_months", start_datetime=start, columns=chat_columns
+            )
+        elif kind == 3:
+            stmt = chats_query(
+                start_datetime=start,
+                end_datetime=start + timedelta(hours=1),
+                order_by="username",
+                columns=chat_columns,
+            )
+        elif kind == 4:
+            yield message_counts_query(interval="hour", start_datetime=start), False
+            continue
+        else:
+            yield top_chatters_query(rng.choice(default_channels)), False
+            continue
+        yield stmt, True
+
+
+def read(reader, usernames, seed, stop, stats):
+    """Reader thread: run queries until stop is set; max(id) must never go back."""
+    rng = random.Random(seed)
+    queries = read_queries(usernames, rng)
+    last_id = 0
+    while not stop.is_set():
+        stmt, chats = next(queries)
+        started = time.perf_counter()
+        try:
+            with Session(reader) as session:
+                rows = session.exec(stmt.limit(100)).all()
+                if chats:
+                    conn = session.connection()
+                    names(conn).decode(conn, rows)
+                max_id = session.exec(select(func.max(ChatMessage.id))).one() or 0
+        except OperationalError as e:
+            stats["errors"][str(e.orig)] += 1
+            continue
+        stats["latencies"].append(time.perf_counter() - started)
+        if max_id < last_id:
+            stats["went_back"] += 1
+        last_id = max_id
+
+
+def percentile(values, share):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * share))]
+
+
+def run(directory, lines, readers, chunk_size, plain, seed):
+    seeded = directory / "seeded"
+    live = directory / "live"
+    generate(seeded, lines // 4, lines_per_stream=20_000, start=START, seed=seed)
+    generate(
+        live,
+        lines,
+        lines_per_stream=20_000,
+        start=START + timedelta(days=2),
+        seed=seed + 1,
+    )
+
+    db_path = directory / ("plain.db" if plain else "pragmas.db")
+    writer, reader = engines(db_path, readers, plain)
+    init_db(writer)
+    store(writer, seeded)
+    with writer.connect() as conn:
+        stored = conn.execute(select(func.count(ChatMessage.id))).scalar()
+        usernames = list(conn.execute(select(ChatUser.name).limit(200)).scalars())
+    writer.dispose()
+
+    results = Queue()
+    writing = Process(target=ingest, args=(db_path, live, chunk_size, plain, results))
+    stop = threading.Event()
+    stats = [{"latencies": [], "errors": Counter(), "went_back": 0} for _ in range(readers)]
+    threads = [
+        threading.Thread(target=read, args=(reader, usernames, seed + i, stop, stats[i]))
+        for i in range(readers)
+    ]
+    started = time.perf_counter()
+    writing.start()
+    for thread in threads:
+        thread.start()
+    written = None
+    while written is None and (writing.is_alive() or not results.empty()):
+        try:
+            written = results.get(timeout=1)
+        except Empty:
+            pass
+    if written is None:
+        written = {"rows": None, "seconds": 0, "error": f"exit code {writing.exitcode}"}
+    stop.set()
+    for thread in threads:
+        thread.join()
+    writing.join()
+    elapsed = time.perf_counter() - started
+
+    writer, _ = engines(db_path, 1, plain)
+    with writer.connect() as conn:
+        total = conn.execute(select(func.count(ChatMessage.id))).scalar()
+        integrity = conn.exec_driver_sql("PRAGMA integrity_check").scalar()
+    writer.dispose()
+    reader.dispose()
+
+    latencies = [value for reader_stats in stats for value in reader_stats["latencies"]]
+    errors = sum((reader_stats["errors"] for reader_stats in stats), Counter())
+    return {
+        "written": written,
+        "stored": total - stored,
+        "integrity": integrity,
+        "reads": len(latencies),
+        "reads_per_sec": len(latencies) / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000 if latencies else None,
+        "p99_ms": percentile(latencies, 0.99) * 1000 if latencies else None,
+        "errors": errors,
+        "went_back": sum(reader_stats["went_back"] for reader_stats in stats),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Run API-style readers against a database while ingest writes to it"
+    )
+    parser.add_argument("--lines", type=int, default=200_000, help="lines ingested")
+    parser.add_argument("--readers", type=int, default=8, help="reader threads")
+    parser.add_argument(
+        "--chunk-size", type=int, default=1_000, help="rows per write transaction"
+    )
+    parser.add_argument(
+        "--plain",
+        action="store_true",
+        help="use default engines without pragmas, as before chatlog.connections",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        result = run(Path(tmp), args.lines, args.readers, args.chunk_size, args.plain, args.seed)
+
+    written = result["written"]
+    print(
+        f"writer: {written['rows']} rows in {written['seconds']:.1f}s"
+        + (f", failed: {written['error']}" if written["error"] else "")
+    )
+    print(
+        f"readers: {result['reads']} queries ({result['reads_per_sec']:,.0f}/sec), "
+        f"p50 {result['p50_ms'] or 0:.1f} ms, p99 {result['p99_ms'] or 0:.1f} ms, "
+        f"errors {dict(result['errors'])}"
+    )
+    results = [
+        check(written["error"] is None, "writer finished without lock errors"),
+        check(
+            written["rows"] is not None and result["stored"] == written["rows"],
+            f"all {result['stored']} written rows are stored",
+        ),
+        check(result["integrity"] == "ok", "integrity_check after the run"),
+        check(not result["errors"], "readers hit no lock errors"),
+        check(result["went_back"] == 0, "readers never saw max(id) go back"),
+    ]
+    if not all(results):
+        sys.exit(1)
+
+
+if "__main__" == __name__:
+    main()
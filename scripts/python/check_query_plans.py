@@ -0,0 +1,114 @@
+from datetime import datetime
+from itertools import product
+from pathlib import Path
+import argparse
+import sys
+import tempfile
+
+from sqlmodel import create_engine
+
+sys.path.append(str(Path(__file__).resolve().parents[2] / "web" / "backend"))
+from bench_bulk_load import make_rows  # noqa: E402
+from chatlog import init_db, insert_rows  # noqa: E402
+from chatlog.queries import chats_query  # noqa: E402
+
+
+start = datetime(2024, 11, 10, 19, 0)
+end = datetime(2024, 11, 10, 20, 0)
+
+filters = {
+    "channel_name": "sodapoppin",
+    "username": "nina",
+    "message_type": "chat_message",
+}
+
+ranges = {
+    "no range": {},
+    "start": {"start_datetime": start},
+    "start+end": {"start_datetime": start, "end_datetime": end},
+}
+
+cursor_keys = {
+    "timestamp": [start, 1000],
+    "username": ["nina", start, 1000],
+    "message_type": ["chat_message", start, 1000],
+}
+
+
+def query_plan(conn, stmt):
+    compiled = stmt.limit(100).compile(dialect=conn.dialect)
+    params = []
+    for name in compiled.positiontup:
+        value = compiled.params[name]
+        params.append(value.isoformat(" ") if isinstance(value, datetime) else value)
+    return [
+        row[-1]
+        for row in conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}", tuple(params))
+    ]
+
+
+def check(conn, order_by):
+    """Yield (description, plan, sorts) for every filter combination."""
+    for mask in product([False, True], repeat=len(filters)):
+        equal = {name: value for (name, value), on in zip(filters.items(), mask) if on}
+        for (range_name, time_range), desc, paged in product(
+            ranges.items(), [False, True], [False, True]
+        ):
+            stmt = chats_query(
+                **equal,
+                **time_range,
+                order_by=order_by,
+                desc=desc,
+                after=cursor_keys[order_by] if paged else None,
+            )
+            plan = query_plan(conn, stmt)
+            sorts = any("TEMP B-TREE" in step for step in plan)
+            description = (
+                f"order_by={order_by} filters={sorted(equal) or '-'} {range_name}"
+                f"{' desc' if desc else ''}{' cursor' if paged else ''}"
+            )
+            yield description, plan, sorts
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Check that GET /chats/ queries are served by an index without a sort"
+    )
+    parser.add_argument("--rows", type=int, default=20_000)
+    parser.add_argument("--verbose", action="store_true", help="print every plan")
+    args = parser.parse_args()
+
+    failures = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{Path(tmp) / 'plans.db'}")
+        init_db(engine)
+        with engine.begin() as conn:
+            insert_rows(conn, make_rows(args.rows))
+
+        for analyzed in [False, True]:
+            with engine.begin() as conn:
+                if analyzed:
+                    conn.exec_driver_sql("ANALYZE")
+                print(f"{'with' if analyzed else 'without'} ANALYZE statistics:")
+
+                for order_by in cursor_keys:
+                    results = list(check(conn, order_by))
+                    sorted_count = sum(sorts for _, _, sorts in results)
+                    print(f"  order_by={order_by}: {sorted_count}/{len(results)} use a temp b-tree")
+
+                    for description, plan, sorts in results:
+                        if args.verbose or sorts:
+                            print(f"    {description}")
+                            for step in plan:
+                                print(f"      {step}")
+                    failures += sorted_count
+
+        engine.dispose()
+
+    if failures:
+        print(f"{failures} plans sort in a temp b-tree")
+        sys.exit(1)
+
+
+if "__main__" == __name__:
+    main()
@@ -0,0 +1,217 @@
+from datetime import datetime, timezone
+from pathlib import Path
+import argparse
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+
+from sqlmodel import create_engine
+
+sys.path.append(str(Path(__file__).resolve().parents[2] / "web" / "backend"))
+from chatlog import init_db, new_pattern_counts  # noqa: E402
+from chatlog.db import add_natural_key  # noqa: E402
+from chatlog.ingest import parse_chunk, plan_ingest, store_chunks  # noqa: E402
+from chatlog.logfiles import find_log_files  # noqa: E402
+from chatlog.names import NAMED_MESSAGES  # noqa: E402
+from chatlog.rollups import rebuild_rollups  # noqa: E402
+from chatlog.tailer import Tailer  # noqa: E402
+
+
+chat_line = re.compile(rb"\[\d\d:\d\d:\d\d\] \w+: ")
+
+
+def ingest(engine, root):
+    """backfill.py's ingest, in one process. Returns (rows stored, seconds)."""
+    started = time.perf_counter()
+    with engine.connect() as conn:
+        tasks, stats, _ = plan_ingest(conn, find_log_files(root))
+        conn.commit()
+        total, _ = store_chunks(
+            conn,
+            tasks,
+            map(parse_chunk, tasks),
+            stats,
+            datetime.now(timezone.utc),
+            new_pattern_counts(),
+            progress=False,
+        )
+    return total, time.perf_counter() - started
+
+
+def stored(engine):
+    """Every stored line, without ids or created_at, in a stable order."""
+    with engine.connect() as conn:
+        return conn.exec_driver_sql(
+            "SELECT channel_name, timestamp, username, message_type, message_text "
+            f"FROM {NAMED_MESSAGES} ORDER BY 1, 2, 3, 4, 5"
+        ).all()
+
+
+def rollups(engine):
+    with engine.connect() as conn:
+        return (
+            conn.exec_driver_sql("SELECT * FROM messagecountrollup ORDER BY 1, 2, 3, 4").all(),
+            conn.exec_driver_sql("SELECT * FROM chattercountrollup ORDER BY 1, 2, 3").all(),
+        )
+
+
+def same_as(engine, fresh):
+    """Whether engine stores what fresh does, with the same rollups and ChatEvent rows.
+
+    Also runs the FTS index's integrity check, which fails on stale entries.
+    """
+    with engine.connect() as conn:
+        events = conn.exec_driver_sql("SELECT count(*) FROM chatevent").scalar()
+        conn.exec_driver_sql(
+            "INSERT INTO chatmessage_fts (chatmessage_fts) VALUES ('integrity-check')"
+        )
+        conn.rollback()
+    with fresh.connect() as conn:
+        fresh_events = conn.exec_driver_sql("SELECT count(*) FROM chatevent").scalar()
+    return (
+        stored(engine) == stored(fresh)
+        and rollups(engine) == rollups(fresh)
+        and events == fresh_events
+    )
+
+
+def tail(engine, root, tailer=None):
+    """Store root the way tail.py does, once; returns the Tailer."""
+    if tailer is None:
+        tailer = Tailer(engine, root, from_start=True)
+        tailer.load()
+    tailer.scan()
+    tailer.flush()
+    return tailer
+
+
+def database(directory, name, natural_key=False):
+    engine = create_engine(f"sqlite:///{directory / name}")
+    init_db(engine, natural_key)
+    return engine
+
+
+def check(ok, message):
+    print(f"{'ok' if ok else 'FAILED'}: {message}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Check that re-ingesting a log directory skips unchanged files, "
+        "stores only appended lines and handles rewritten files"
+    )
+    parser.add_argument("root", type=Path, help="Channels directory to copy logs from")
+    parser.add_argument(
+        "--split", type=float, default=0.7, help="part of each file written before appending"
+    )
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        full = tmp / "full"
+        shutil.copytree(args.root, full)
+        paths = find_log_files(full)
+
+        # files cut mid-line, as when Chatterino is still writing them
+        growing = tmp / "growing"
+        cuts = {}
+        for path in paths:
+            target = growing / path.relative_to(full)
+            target.parent.mkdir(parents=True, exist_ok=True)
+            data = path.read_bytes()
+            cuts[target] = (data, int(len(data) * args.split))
+            target.write_bytes(data[: cuts[target][1]])
+
+        reference = database(tmp, "reference.db")
+        total, elapsed = ingest(reference, full)
+        print(f"fresh ingest of {len(paths)} files: {total} rows in {elapsed:.2f}s")
+        expected = stored(reference)
+
+        again, rerun = ingest(reference, full)
+        print(f"re-ingest: {again} rows in {rerun:.3f}s")
+        results.append(
+            check(again == 0 and stored(reference) == expected, "rerun stores nothing")
+        )
+
+        appended = database(tmp, "appended.db")
+        first, _ = ingest(appended, growing)
+        for target, (data, cut) in cuts.items():
+            with open(target, "ab") as f:
+                f.write(data[cut:])
+        second, elapsed = ingest(appended, growing)
+        print(f"appended: {first} rows, then {second} rows in {elapsed:.3f}s")
+        results.append(
+            check(stored(appended) == expected, "grown files match a fresh ingest")
+        )
+        results.append(
+            check(rollups(appended) == rollups(reference), "grown files' rollups match")
+        )
+
+        # a rewritten file: the same lines, but the first chat message edited
+        default = database(tmp, "default.db")
+        natural = database(tmp, "natural.db", natural_key=True)
+        for engine in [default, natural]:
+            ingest(engine, full)
+        # the tailer notices on load, or while following the file
+        loaded = database(tmp, "loaded.db")
+        tail(loaded, full)
+        followed = database(tmp, "followed.db")
+        tailer = tail(followed, full)
+
+        rewritten = paths[0]
+        lines = rewritten.read_bytes().split(b"\n")
+        first_message = next(i for i, line in enumerate(lines) if chat_line.match(line))
+        lines[first_message] += b" (edited)"
+        replacement = rewritten.with_suffix(".tmp")
+        replacement.write_bytes(b"\n".join(lines))
+        os.replace(replacement, rewritten)
+
+        for engine in [default, natural]:
+            stored_again, _ = ingest(engine, full)
+            name = Path(engine.url.database).name
+            print(f"{name}: rewritten file stored {stored_again} rows")
+        tail(loaded, full)
+        tail(followed, full, tailer)
+        fresh = database(tmp, "fresh.db")
+        fresh_natural = database(tmp, "fresh_natural.db", natural_key=True)
+        ingest(fresh, full)
+        ingest(fresh_natural, full)
+        results.append(
+            check(same_as(default, fresh), "the rewritten file's rows match a fresh ingest")
+        )
+        results.append(
+            check(same_as(natural, fresh_natural), "with the natural key as well")
+        )
+        results.append(check(same_as(loaded, fresh), "and when the tailer loads it"))
+        results.append(check(same_as(followed, fresh), "and when the tailer follows it"))
+
+        # lines repeated within a second collapse under the natural key
+        with default.begin() as conn:
+            deleted = add_natural_key(conn)
+        results.append(
+            check(
+                stored(default) == stored(natural),
+                f"add_natural_key deleted {deleted} duplicates",
+            )
+        )
+        before = rollups(default)
+        with default.begin() as conn:
+            rebuild_rollups(conn)
+        results.append(check(before == rollups(default), "rollups match a rebuild"))
+
+        for engine in [reference, appended, default, natural, loaded, followed]:
+            engine.dispose()
+        fresh.dispose()
+        fresh_natural.dispose()
+
+    if not all(results):
+        sys.exit(1)
+
+
+if "__main__" == __name__:
+    main()
@@ -0,0 +1,165 @@
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+import argparse
+import random
+import sys
+import tempfile
+
+from sqlmodel import create_engine
+
+sys.path.append(str(Path(__file__).resolve().parents[2] / "web" / "backend"))
+from chatlog import init_db, new_pattern_counts, parse_lines  # noqa: E402
+from chatlog.ingest import parse_chunk, plan_ingest, store_chunks  # noqa: E402
+from chatlog.names import NAMED_MESSAGES  # noqa: E402
+from chatlog.tailer import Tailer  # noqa: E402
+
+
+def make_log(start, hours, rng, lines_per_minute=20):
+    """A log of a stream from start lasting hours, with the timestamps it should parse to.
+
+    Lines come in bursts, several per second, and a few step back a
+    second or two, as when Chatterino writes them out of order.
+    """
+    lines = [f"# Start logging at {start:%Y-%m-%d %H:%M:%S} Eastern Standard Time", ""]
+    expected = []
+    at = start
+    end = start + timedelta(hours=hours)
+    while at < end:
+        at += timedelta(seconds=rng.expovariate(lines_per_minute / 60))
+        logged = at - timedelta(seconds=rng.choice([0] * 20 + [1, 2]))
+        user = f"chatter_{rng.randrange(50)}"
+        lines.append(f"[{logged:%H:%M:%S}] {user}: message {len(expected)}")
+        expected.append(logged.replace(microsecond=0, tzinfo=timezone.utc))
+    return "\n".join(lines) + "\n", expected
+
+
+def check(ok, message):
+    print(f"{'ok' if ok else 'FAILED'}: {message}")
+    return ok
+
+
+def times(events):
+    return [event.time for event in events if event.type is not None]
+
+
+def check_parse_lines(rng):
+    results = []
+    for start, hours in [
+        (datetime(2024, 11, 10, 23, 59, 50), 0.01),
+        (datetime(2024, 11, 10, 20, 0, 0), 10),
+        (datetime(2024, 12, 31, 18, 0, 0), 12),
+        (datetime(2024, 2, 28, 22, 0, 0), 54),
+    ]:
+        text, expected = make_log(start, hours, rng)
+        parsed = times(parse_lines(text.splitlines()))
+        days = len({t.date() for t in expected})
+        results.append(
+            check(
+                parsed == expected,
+                f"{start} for {hours}h, {days} dates, {len(expected)} lines",
+            )
+        )
+
+    # a header starts a new stream on its own date
+    first, _ = make_log(datetime(2024, 11, 10, 23, 0, 0), 2, rng)
+    second, expected = make_log(datetime(2024, 11, 12, 9, 0, 0), 1, rng)
+    parsed = times(parse_lines((first + second).splitlines()))
+    results.append(check(parsed[-len(expected) :] == expected, "a header resets the date"))
+    return results
+
+
+def stored(engine):
+    with engine.connect() as conn:
+        return [
+            datetime.fromisoformat(timestamp).replace(tzinfo=timezone.utc)
+            for (timestamp,) in conn.exec_driver_sql(
+                f"SELECT timestamp FROM {NAMED_MESSAGES} ORDER BY id"
+            )
+        ]
+
+
+def ingest(engine, root, chunk_bytes):
+    with engine.connect() as conn:
+        paths = sorted(root.glob("*/*.log"))
+        tasks, stats, _ = plan_ingest(conn, paths, chunk_bytes=chunk_bytes)
+        conn.commit()
+        store_chunks(
+            conn,
+            tasks,
+            map(parse_chunk, tasks),
+            stats,
+            datetime.now(timezone.utc),
+            new_pattern_counts(),
+            progress=False,
+        )
+
+
+def check_ingest(rng, tmp):
+    """Chunked and resumed ingest date lines the way one serial read does."""
+    text, expected = make_log(datetime(2024, 11, 10, 21, 0, 0), 60, rng)
+    data = text.encode()
+    root = tmp / "logs"
+    path = root / "sodapoppin" / "sodapoppin-2024-11-10.log"
+    path.parent.mkdir(parents=True)
+
+    results = []
+    path.write_bytes(data)
+    for chunk_bytes in [len(data), 64 * 1024, 4096]:
+        engine = create_engine(f"sqlite:///{tmp / f'chunks-{chunk_bytes}.db'}")
+        init_db(engine)
+        ingest(engine, root, chunk_bytes)
+        chunks = -(-len(data) // chunk_bytes)
+        results.append(check(stored(engine) == expected, f"ingest in {chunks} chunks"))
+        engine.dispose()
+
+    # stored up to a point two midnights in, then appended to
+    engine = create_engine(f"sqlite:///{tmp / 'resumed.db'}")
+    init_db(engine)
+    cut = data.index(b"\n", len(data) * 3 // 4) + 1
+    path.write_bytes(data[:cut])
+    ingest(engine, root, 4096)
+    path.write_bytes(data)
+    ingest(engine, root, 4096)
+    results.append(check(stored(engine) == expected, "ingest resumed after two midnights"))
+    engine.dispose()
+
+    # a tailer started on the cut file, then reading what was appended
+    engine = create_engine(f"sqlite:///{tmp / 'tailed.db'}")
+    init_db(engine)
+    path.write_bytes(data[:cut])
+    tailer = Tailer(engine, root)
+    tailer.load()
+    day = tailer.files[path.resolve()].clock.day
+    path.write_bytes(data)
+    tailer.read(path.resolve())
+    appended = data[cut:].count(b"\n")
+    rows = tailer.rows[engine]
+    results.append(
+        check(
+            len(rows) == appended
+            and [row["timestamp"] for row in rows] == expected[-appended:],
+            f"tailer started on {day:%Y-%m-%d}",
+        )
+    )
+    engine.dispose()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Check that lines logged after midnight get the next day's date"
+    )
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    results = check_parse_lines(rng)
+    with tempfile.TemporaryDirectory() as tmp:
+        results += check_ingest(rng, Path(tmp))
+
+    if not all(results):
+        sys.exit(1)
+
+
+if "__main__" == __name__:
+    main()
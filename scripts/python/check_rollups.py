@@ -0,0 +1,159 @@
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+import argparse
+import random
+import sys
+import tempfile
+import time
+
+from sqlmodel import Session, create_engine
+
+sys.path.append(str(Path(__file__).resolve().parents[2] / "web" / "backend"))
+from bench_bulk_load import make_rows  # noqa: E402
+from chatlog import init_db, store_rows  # noqa: E402
+from chatlog.names import NAMED_MESSAGES  # noqa: E402
+from chatlog.patterns import chat_patterns, event_categories  # noqa: E402
+from chatlog.rollups import (  # noqa: E402
+    RESOLUTIONS,
+    epoch,
+    event_totals_query,
+    message_counts_query,
+    rebuild_rollups,
+    top_chatters_query,
+)
+
+channels = ["sodapoppin", "xqc", "forsen"]
+
+start = datetime(2024, 11, 12, tzinfo=timezone.utc)
+end = datetime(2024, 11, 25, 23, 59, 59, tzinfo=timezone.utc)
+
+
+def spread_rows(n, days):
+    """make_rows() spread over several channels and days."""
+    rng = random.Random(1)
+    rows = make_rows(n)
+    for row in rows:
+        row["channel_name"] = rng.choice(channels)
+        row["timestamp"] += timedelta(days=rng.randrange(days))
+    return rows
+
+
+def snapshot(conn):
+    return (
+        conn.exec_driver_sql("SELECT * FROM messagecountrollup ORDER BY 1, 2, 3, 4").all(),
+        conn.exec_driver_sql("SELECT * FROM chattercountrollup ORDER BY 1, 2, 3").all(),
+    )
+
+
+def raw(conn, sql, *params):
+    timestamp = "CAST(strftime('%s', timestamp) AS INTEGER)"
+    return conn.exec_driver_sql(
+        sql.format(seconds=timestamp, messages=NAMED_MESSAGES), params
+    ).all()
+
+
+def timed(fn):
+    started = time.perf_counter()
+    result = fn()
+    return result, (time.perf_counter() - started) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Check the /stats/ rollups against aggregates over ChatMessage"
+    )
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--days", type=int, default=30)
+    args = parser.parse_args()
+
+    rows = spread_rows(args.rows, args.days)
+    failures = []
+
+    def check(name, ok):
+        print(f"{'ok' if ok else 'FAIL'}: {name}")
+        if not ok:
+            failures.append(name)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{Path(tmp) / 'rollups.db'}")
+        init_db(engine)
+        with engine.connect() as conn:
+            total, elapsed = store_rows(conn, iter(rows), progress=False)
+        print(f"stored {total} rows with rollups in {elapsed:.2f}s")
+
+        with engine.begin() as conn:
+            incremental = snapshot(conn)
+            rebuild_rollups(conn)
+            check("incremental rollups match a rebuild", snapshot(conn) == incremental)
+
+        day = RESOLUTIONS["day"]
+        with engine.connect() as conn, Session(engine) as session:
+            stmt = message_counts_query("xqc", None, start, end, "day")
+            rolled, rolled_ms = timed(lambda: session.exec(stmt).all())
+            scanned, scanned_ms = timed(
+                lambda: raw(
+                    conn,
+                    "SELECT channel_name, {seconds} - {seconds} % ? AS bucket, "
+                    "message_type, count(*) FROM {messages} "
+                    "WHERE channel_name = ? AND timestamp BETWEEN ? AND ? "
+                    "GROUP BY bucket, message_type ORDER BY bucket, message_type",
+                    day, "xqc", start.strftime("%F %T"), end.strftime("%F %T.999999"),
+                )
+            )
+            check(f"messages per day ({rolled_ms:.1f} ms vs {scanned_ms:.1f} ms scan)",
+                  [tuple(r) for r in rolled] == [tuple(r) for r in scanned])
+
+            stmt = top_chatters_query(None, start, end).limit(10)
+            rolled, rolled_ms = timed(lambda: session.exec(stmt).all())
+            placeholders = ", ".join("?" for _ in chat_patterns)
+            scanned, scanned_ms = timed(
+                lambda: raw(
+                    conn,
+                    "SELECT username, count(*) AS n FROM {messages} "
+                    f"WHERE message_type IN ({placeholders}) AND username IS NOT NULL "
+                    "AND timestamp BETWEEN ? AND ? "
+                    "GROUP BY username ORDER BY n DESC, username LIMIT 10",
+                    *chat_patterns, start.strftime("%F %T"), end.strftime("%F %T.999999"),
+                )
+            )
+            check(f"top chatters ({rolled_ms:.1f} ms vs {scanned_ms:.1f} ms scan)",
+                  [tuple(r) for r in rolled] == [tuple(r) for r in scanned])
+
+            stmt = event_totals_query(None, start, end)
+            rolled, rolled_ms = timed(lambda: session.exec(stmt).all())
+            scanned = {}
+            started = time.perf_counter()
+            for category, types in event_categories.items():
+                placeholders = ", ".join("?" for _ in types)
+                for channel_name, n in raw(
+                    conn,
+                    "SELECT channel_name, count(*) FROM {messages} "
+                    f"WHERE message_type IN ({placeholders}) "
+                    "AND timestamp BETWEEN ? AND ? GROUP BY channel_name",
+                    *types, start.strftime("%F %T"), end.strftime("%F %T.999999"),
+                ):
+                    scanned.setdefault(channel_name, dict.fromkeys(event_categories, 0))
+                    scanned[channel_name][category] = n
+            scanned_ms = (time.perf_counter() - started) * 1000
+            check(f"event totals ({rolled_ms:.1f} ms vs {scanned_ms:.1f} ms scan)",
+                  {r.channel_name: {c: getattr(r, c) for c in event_categories}
+                   for r in rolled} == scanned)
+
+            # every minute bucket of a channel sums to its day buckets
+            minutes = sum(
+                r.count for r in session.exec(message_counts_query("forsen", interval="minute"))
+            )
+            days = sum(
+                r.count for r in session.exec(message_counts_query("forsen", interval="day"))
+            )
+            check("minute and day buckets agree", minutes == days)
+            check("range bounds are bucket aligned", epoch(start) % day == 0)
+
+        engine.dispose()
+
+    if failures:
+        sys.exit(1)
+
+
+if "__main__" == __name__:
+    main()
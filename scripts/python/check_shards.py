@@ -0,0 +1,321 @@
+from collections import Counter
+from datetime import datetime, timedelta
+from pathlib import Path
+import argparse
+import asyncio
+import importlib
+import json
+import os
+import sys
+import tempfile
+
+import httpx
+from sqlalchemy import func, select
+
+sys.path.append(str(Path(__file__).resolve().parents[2] / "web" / "backend"))
+sys.path.append(str(Path(__file__).resolve().parent))
+from chatlog import ChatMessage, init_db  # noqa: E402
+from chatlog.connections import write_engine  # noqa: E402
+from chatlog.shards import ShardRouter, shard_key  # noqa: E402
+from chatlog.tailer import Tailer  # noqa: E402
+from generate_logs import generate  # noqa: E402
+
+
+# streams from here to a few days on, so month shards split the logs in two
+START = datetime(2024, 11, 27)
+
+ORDERS = ["timestamp", "username", "message_type"]
+
+
+def check(ok, message):
+    print(f"{'ok' if ok else 'FAILED'}: {message}")
+    return ok
+
+
+def filter_sets(username):
+    return {
+        "unfiltered": {},
+        "channel": {"channel_name": "xqc"},
+        "username": {"username": username},
+        "message_type": {"message_type": "sub_with_months"},
+        "time range": {
+            "start_datetime": "2024-11-29T20:00:00Z",
+            "end_datetime": "2024-12-02T06:00:00Z",
+        },
+        "channel and time range": {
+            "channel_name": "forsen",
+            "start_datetime": "2024-11-30T00:00:00Z",
+        },
+    }
+
+
+async def walk(client, params, limit=1000):
+    """Every row of a /chats/ query, page by page with X-Next-Cursor."""
+    rows = []
+    cursor = None
+    while True:
+        page_params = {**params, "limit": limit}
+        if cursor is not None:
+            page_params["cursor"] = cursor
+        response = await client.get("/chats/", params=page_params)
+        response.raise_for_status()
+        rows += response.json()
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            return rows
+
+
+def without_ids(rows):
+    """Rows as a multiset, leaving out what differs between separate loads."""
+    return Counter(
+        tuple(value for key, value in row.items() if key not in ("id", "created_at"))
+        for row in rows
+    )
+
+
+def sort_values(rows, order_by):
+    """What a query's rows are sorted by, except the id, which differs between layouts."""
+    return [(row[order_by], row["timestamp"]) for row in rows]
+
+
+async def collect(username):
+    """The responses the checks compare, from the API as configured in the environment."""
+    api = sys.modules.get("main")
+    api = importlib.reload(api) if api is not None else importlib.import_module("main")
+    results = {"chats": {}, "pages": {}}
+    transport = httpx.ASGITransport(app=api.app)
+    async with api.lifespan(api.app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://check") as client:
+            for name, filters in filter_sets(username).items():
+                for order_by in ORDERS:
+                    for desc in [False, True]:
+                        params = {**filters, "order_by": order_by, "desc": desc}
+                        results["chats"][name, order_by, desc] = await walk(client, params)
+                        response = await client.get(
+                            "/chats/", params={**params, "offset": 1500, "limit": 100}
+                        )
+                        results["pages"][name, order_by, desc] = response.json()
+
+            for path, params in [
+                ("/stats/messages", {"interval": "hour"}),
+                (
+                    "/stats/messages",
+                    {
+                        "interval": "day",
+                        "start_datetime": "2024-11-30T12:00:00Z",
+                        "end_datetime": "2024-12-01T06:00:00Z",
+                    },
+                ),
+                ("/stats/messages", {"channel_name": "lirik", "offset": 10, "limit": 5}),
+                ("/stats/top-chatters", {"limit": 20}),
+                ("/stats/top-gifters", {"limit": 20}),
+                ("/stats/events", {}),
+            ]:
+                response = await client.get(path, params=params)
+                response.raise_for_status()
+                results[path, json.dumps(params)] = response.json()
+
+            response = await client.get(
+                "/chats/search", params={"q": "pog", "order_by": "timestamp", "desc": True}
+            )
+            results["search"] = response.json()
+            response = await client.get("/chats/export", params={"order_by": "username"})
+            results["export"] = [json.loads(line) for line in response.text.splitlines()]
+            response = await client.get("/metrics")
+            results["metrics"] = sorted(
+                line
+                for line in response.text.splitlines()
+                if line.startswith("chatlog_ingest_lines_total")
+            )
+            if api.router is not None:
+                # with one database this would stream until cancelled
+                results["stream_status"] = (await client.get("/chats/stream")).status_code
+    api.engine.dispose()
+    if api.router is not None:
+        api.router.dispose()
+    return results
+
+
+def compare(single, sharded, layout):
+    results = []
+    mismatched = []
+    for key, rows in single["chats"].items():
+        other = sharded["chats"][key]
+        name, order_by, desc = key
+        ids = [row["id"] for row in other]
+        if (
+            without_ids(rows) != without_ids(other)
+            or sort_values(rows, order_by) != sort_values(other, order_by)
+            or len(set(ids)) != len(ids)
+            or sharded["pages"][key] != other[1500:1600]
+        ):
+            mismatched.append(f"{name} by {order_by}{' desc' if desc else ''}")
+    results.append(
+        check(
+            not mismatched,
+            f"{layout}: /chats/ pages of {len(single['chats'])} queries match one database"
+            + (f", not {mismatched}" if mismatched else ""),
+        )
+    )
+
+    stats = [key for key in single if isinstance(key, tuple)]
+    results.append(
+        check(
+            all(single[key] == sharded[key] for key in stats),
+            f"{layout}: {len(stats)} /stats/ responses match",
+        )
+    )
+    results.append(
+        check(
+            [row["timestamp"] for row in single["search"]]
+            == [row["timestamp"] for row in sharded["search"]],
+            f"{layout}: /chats/search by timestamp matches",
+        )
+    )
+    results.append(
+        check(
+            without_ids(single["export"]) == without_ids(sharded["export"])
+            and sort_values(single["export"], "username")
+            == sort_values(sharded["export"], "username"),
+            f"{layout}: /chats/export of {len(single['export'])} rows matches",
+        )
+    )
+    results.append(
+        check(single["metrics"] == sharded["metrics"], f"{layout}: ingest totals match")
+    )
+    results.append(
+        check(sharded["stream_status"] == 501, f"{layout}: /chats/stream is not served")
+    )
+    return results
+
+
+def check_routing(directory):
+    results = []
+    router = ShardRouter(directory / "channel", "channel")
+    results.append(check(router.route("xqc") == ["xqc"], "a channel's query reads its shard"))
+    router.dispose()
+
+    router = ShardRouter(directory / "month", "month")
+    with router.engine("2024-11").connect() as conn:
+        last = conn.execute(select(func.max(ChatMessage.timestamp))).scalar()
+    results.append(
+        check(
+            router.keys() == ["2024-11", "2024-12"]
+            and router.route(start_datetime=last + timedelta(seconds=1)) == ["2024-12"]
+            and router.route(end_datetime=last) == ["2024-11"]
+            and router.route(start_datetime=last, end_datetime=last) == ["2024-11"],
+            "month shards are pruned by their timestamp range",
+        )
+    )
+    router.dispose()
+
+    undated = directory / "undated" / "xqc" / "stream.log"
+    undated.parent.mkdir(parents=True)
+    undated.write_text("# Start logging at 2024-11-30 20:00:00 UTC\n[20:00:01]  a: hi\n")
+    results.append(
+        check(
+            shard_key(undated, "month") == "2024-11",
+            "a file without a date in its name goes by its first header",
+        )
+    )
+    return results
+
+
+def check_tailer(directory, root):
+    """A tailer storing into month shards stores what backfill.py did."""
+    router = ShardRouter(directory / "tailed", "month")
+    tailer = Tailer(None, root, from_start=True, router=router)
+    tailer.load()
+    tailer.scan()
+    tailer.flush()
+
+    backfilled = ShardRouter(directory / "month", "month")
+    counts = {}
+    for shards in [router, backfilled]:
+        for key in shards.keys():
+            with shards.engine(key).connect() as conn:
+                counts[shards, key] = conn.execute(select(func.count(ChatMessage.id))).scalar()
+    ok = router.keys() == backfilled.keys() and all(
+        counts[router, key] == counts[backfilled, key] for key in router.keys()
+    )
+    router.dispose()
+    backfilled.dispose()
+    return [check(ok, f"tailer stores {tailer.total} rows into the same month shards")]
+
+
+async def check_new_rows(directory, root):
+    """Rows stored into a new shard while the API runs are found without a restart."""
+    api = importlib.reload(sys.modules["main"])
+    transport = httpx.ASGITransport(app=api.app)
+    async with api.lifespan(api.app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://check") as client:
+            params = {"channel_name": "newchannel", "limit": 1000}
+            before = len((await client.get("/chats/", params=params)).json())
+
+            generate(root, 500, channels=["newchannel"], start=START, seed=1)
+            router = ShardRouter(directory / "channel", "channel")
+            tailer = Tailer(None, root / "newchannel", from_start=True, router=router)
+            tailer.load()
+            tailer.scan()
+            tailer.flush()
+            router.dispose()
+
+            await asyncio.sleep(api.STREAM_POLL_INTERVAL * 4)
+            after = len((await client.get("/chats/", params=params)).json())
+    api.engine.dispose()
+    api.router.dispose()
+    return [
+        check(
+            before == 0 and after == tailer.total > 0,
+            f"{tailer.total} rows tailed into a new shard are served",
+        )
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Check that sharded storage answers the API like one database does"
+    )
+    parser.add_argument("--lines", type=int, default=40_000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        root = tmp / "logs"
+        generate(root, args.lines, lines_per_stream=2_000, start=START, seed=args.seed)
+
+        os.environ["DATABASE_PATH"] = str(tmp / "single.db")
+        os.environ["CACHE_SIZE"] = "0"
+        os.environ["STREAM_POLL_INTERVAL"] = "0.05"
+        os.environ.pop("SHARD_DIR", None)
+        from backfill import backfill
+
+        engine = write_engine(tmp / "single.db")
+        init_db(engine)
+        backfill(root, workers=1, engine=engine)
+        for by in ["channel", "month"]:
+            backfill(root, workers=1, router=ShardRouter(tmp / by, by))
+
+        single = asyncio.run(collect(username=None))
+        username = single[("/stats/top-chatters", json.dumps({"limit": 20}))][0]["username"]
+        single = asyncio.run(collect(username))
+
+        results = []
+        for by in ["channel", "month"]:
+            os.environ["SHARD_DIR"] = str(tmp / by)
+            os.environ["SHARD_BY"] = by
+            results += compare(single, asyncio.run(collect(username)), f"by {by}")
+        results += check_routing(tmp)
+        results += check_tailer(tmp, root)
+
+        os.environ["SHARD_DIR"] = str(tmp / "channel")
+        os.environ["SHARD_BY"] = "channel"
+        results += asyncio.run(check_new_rows(tmp, root))
+
+    if not all(results):
+        sys.exit(1)
+
+
+if "__main__" == __name__:
+    main()
@@ -0,0 +1,232 @@
+from datetime import datetime
+from pathlib import Path
+import argparse
+import asyncio
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import httpx
+from sqlmodel import create_engine
+
+scripts = Path(__file__).resolve().parent
+backend = scripts.parents[1] / "web" / "backend"
+sys.path.append(str(backend))
+from chatlog import init_db  # noqa: E402
+from chatlog.logfiles import find_log_files  # noqa: E402
+from chatlog.names import NAMED_MESSAGES  # noqa: E402
+
+# filters each group of clients subscribes with; None streams everything
+subscriptions = [
+    {},
+    {"channel_name": "sodapoppin"},
+    {"message_type": "raid"},
+    {"channel_name": "xqc", "message_type": "chat_message"},
+]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def append_logs(sources, channels, lines_per_write, interval, limit=None):
+    """Copy each source log into channels/ a few lines at a time, like Chatterino."""
+    files = []
+    for source in sources:
+        target = channels / source.parent.name / source.name
+        target.parent.mkdir(parents=True, exist_ok=True)
+        target.touch()
+        files.append((source.open("rb"), target.open("ab")))
+
+    written = 0
+    pending = list(files)
+    while pending and (limit is None or written < limit):
+        for source, target in list(pending):
+            data = b"".join(source.readline() for _ in range(lines_per_write))
+            target.write(data)
+            target.flush()
+            if not data.endswith(b"\n") or data.count(b"\n") < lines_per_write:
+                pending.remove((source, target))
+        written += lines_per_write
+        time.sleep(interval)
+
+    for source, target in files:
+        source.close()
+        target.close()
+
+
+async def subscribe(base_url, filters, received, delay, stop):
+    """Stream events until stop is set, reconnecting with Last-Event-ID after lagging."""
+    lagged = 0
+    last_id = None
+    async with httpx.AsyncClient(base_url=base_url, timeout=None) as client:
+        while not stop.is_set():
+            headers = {} if last_id is None else {"Last-Event-ID": str(last_id)}
+            async with client.stream(
+                "GET", "/chats/stream", params=filters, headers=headers
+            ) as response:
+                event = None
+                async for line in response.aiter_lines():
+                    if line.startswith("event: "):
+                        event = line[7:]
+                    elif line.startswith("data: ") and event == "lagged":
+                        lagged += 1
+                        break
+                    elif line.startswith("data: "):
+                        row = json.loads(line[6:])
+                        last_id = row["id"]
+                        created_at = datetime.fromisoformat(row["created_at"])
+                        received[row["id"]] = time.time() - created_at.timestamp()
+                        if delay:
+                            await asyncio.sleep(delay)
+                    if stop.is_set():
+                        break
+    return lagged
+
+
+def expected_ids(engine, filters, after):
+    conditions = " ".join(f"AND {name} = ?" for name in filters)
+    with engine.connect() as conn:
+        return {
+            row_id
+            for (row_id,) in conn.exec_driver_sql(
+                f"SELECT id FROM {NAMED_MESSAGES} WHERE id > ? {conditions}",
+                (after, *filters.values()),
+            )
+        }
+
+
+async def run(args, engine, base_url, channels, after):
+    stop = asyncio.Event()
+    clients = []
+    for n in range(args.clients):
+        filters = subscriptions[n % len(subscriptions)]
+        received = {}
+        delay = args.slow_delay if n < args.slow_clients else 0
+        task = asyncio.create_task(subscribe(base_url, filters, received, delay, stop))
+        clients.append((filters, received, delay, task))
+    await asyncio.sleep(1)
+
+    sources = find_log_files(args.logs)
+    writer = threading.Thread(
+        target=append_logs,
+        args=(sources, channels, args.lines_per_write, args.write_interval, args.lines),
+    )
+    started = time.perf_counter()
+    writer.start()
+    await asyncio.to_thread(writer.join)
+    print(f"appended {len(sources)} logs in {time.perf_counter() - started:.1f}s")
+
+    # wait for the tailer to flush and every client to catch up
+    deadline = time.monotonic() + args.timeout
+    while time.monotonic() < deadline:
+        await asyncio.sleep(1)
+        if all(
+            expected_ids(engine, filters, after) <= received.keys()
+            for filters, received, delay, _ in clients
+            if not delay
+        ):
+            break
+    stop.set()
+    await asyncio.sleep(0.5)
+
+    failures = 0
+    for filters, received, delay, task in clients:
+        task.cancel()
+        lagged = 0
+        try:
+            lagged = await task
+        except asyncio.CancelledError:
+            pass
+        expected = expected_ids(engine, filters, after)
+        if delay:
+            # a slow client may still be catching up: it must have every row
+            # up to the last one it got, after lagging and reconnecting
+            expected = {i for i in expected if i <= max(received, default=0)}
+        missing = expected - received.keys()
+        extra = received.keys() - expected
+        latencies = sorted(received.values())
+        failures += bool(missing or extra)
+        print(
+            f"{'slow' if delay else 'fast'} {json.dumps(filters)}: "
+            f"{len(received)}/{len(expected)} rows, {len(missing)} missing, "
+            f"{len(extra)} unexpected, lagged {lagged}x, latency p50 "
+            f"{statistics.median(latencies or [0]) * 1000:.0f} ms "
+            f"max {(latencies or [0])[-1] * 1000:.0f} ms"
+        )
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Tail logs into a scratch database with poll.py and check that "
+        "/chats/stream delivers every ingested row to each subscriber"
+    )
+    parser.add_argument("logs", type=Path, help="Channels directory to replay")
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument(
+        "--slow-clients", type=int, default=2, help="clients that read slowly"
+    )
+    parser.add_argument(
+        "--slow-delay", type=float, default=0.002, help="seconds a slow client spends per row"
+    )
+    parser.add_argument("--lines-per-write", type=int, default=50)
+    parser.add_argument("--write-interval", type=float, default=0.01)
+    parser.add_argument(
+        "--lines", type=int, default=None, help="stop after this many lines per log"
+    )
+    parser.add_argument("--timeout", type=float, default=60)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = Path(tmp) / "stream.db"
+        channels = Path(tmp) / "Channels"
+        channels.mkdir()
+        env = {**os.environ, "DATABASE_PATH": str(db_path)}
+
+        engine = create_engine(f"sqlite:///{db_path}")
+        init_db(engine)
+
+        # the API and the ingest path run as they would in production: the
+        # tailer stores rows and the API publishes them to its subscribers
+        port = free_port()
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port),
+             "--log-level", "warning"],
+            cwd=backend, env=env, stdout=subprocess.DEVNULL,
+        )
+        tailer = subprocess.Popen(
+            [sys.executable, str(scripts / "poll.py"), str(channels), "--from-start"],
+            env=env, stdout=subprocess.DEVNULL,
+        )
+        base_url = f"http://127.0.0.1:{port}"
+        try:
+            while True:
+                try:
+                    httpx.get(f"{base_url}/docs")
+                    break
+                except httpx.TransportError:
+                    time.sleep(0.1)
+            failures = asyncio.run(run(args, engine, base_url, channels, after=0))
+        finally:
+            tailer.terminate()
+            server.terminate()
+            tailer.wait()
+            server.wait()
+            engine.dispose()
+
+    if failures:
+        print(f"{failures} subscribers lost or gained rows")
+        sys.exit(1)
+
+
+if "__main__" == __name__:
+    main()
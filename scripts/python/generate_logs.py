@@ -0,0 +1,341 @@
+from datetime import datetime, timedelta
+from pathlib import Path
+import argparse
+import random
+import sys
+
+sys.path.append(str(Path(__file__).resolve().parents[2] / "web" / "backend"))
+from chatlog import classify, new_pattern_counts, patterns  # noqa: E402
+
+
+# lines per pattern, relative; "no_match" is lines no pattern matches. Gift
+# announcements are followed by one gift line per gifted sub on top of this.
+default_weights = {
+    "chat_message": 9000,
+    "chat_message_foreign": 150,
+    "stream_live": 1,
+    "sub_basic": 40,
+    "sub_prime_basic": 30,
+    "sub_with_months": 60,
+    "sub_with_streak": 50,
+    "sub_advance": 5,
+    "gift_announcement": 8,
+    "gift_individual": 20,
+    "gift_first": 5,
+    "anon_gift_announcement": 2,
+    "anon_gift_individual": 4,
+    "timeout": 25,
+    "permanent_ban": 3,
+    "raid": 1,
+    "room_mode_on": 1,
+    "room_mode_off": 1,
+    "announcement": 2,
+    "no_match": 20,
+}
+
+words = (
+    "lol lmao kekw pog poggers omegalul monkas pepega based cringe gg ez wp "
+    "what why how when is the a an it this that chat streamer game play run "
+    "boss clip sub prime hype letsgo no yes maybe true real fake nice bad "
+    "again first last time 1 2 3 10 100 ??? !!! :) :( <3"
+).split()
+
+foreign_names = ["한국인", "민수", "지훈", "さくら", "たろう", "小明", "王伟", "Дима", "Ольга"]
+
+room_modes = ["emote-only", "subscribers-only", "followers-only", "slow", "unique-chat"]
+
+unmatched = [
+    "Joined channel.",
+    "Disconnected from chat, reconnecting...",
+    "subscribed at Tier 1 but then left",
+    "{user} subscribed at Tier 1 but then left",
+    "{user} is gifting Subs to the community!",
+    "{user} has been timed out.",
+    "Now hosting {channel}.",
+]
+
+default_channels = ["sodapoppin", "xqc", "forsen", "lirik"]
+
+
+def make_usernames(n, rng):
+    """n distinct usernames of the kind Twitch allows."""
+    parts = [word for word in words if word.isalpha()]
+    names = set()
+    while len(names) < n:
+        names.add(f"{rng.choice(parts)}_{rng.choice(parts)}{rng.randrange(10_000)}")
+    return sorted(names)
+
+
+class LineMaker:
+    """Message text, everything after ``[HH:MM:SS] ``, for each entry in ``patterns``.
+
+    Users are drawn with a heavy skew, so a few chat a lot and most only
+    now and then, as in a real channel.
+    """
+
+    def __init__(self, rng, usernames):
+        self.rng = rng
+        self.usernames = usernames
+
+    def user(self):
+        return self.usernames[int(len(self.usernames) * self.rng.random() ** 3)]
+
+    def tier(self):
+        return self.rng.choice([1, 1, 1, 1, 2, 3])
+
+    def months(self):
+        return self.rng.randint(2, 60)
+
+    def plural(self, n, word):
+        return f"{n} {word}" if n == 1 else f"{n} {word}s"
+
+    def text(self):
+        return " ".join(self.rng.choice(words) for _ in range(self.rng.randint(1, 12)))
+
+    def duration(self):
+        seconds = self.rng.choice([1, 10, 30, 60, 600, 1800, 3600, 86400, 1209600])
+        days, rest = divmod(seconds, 86400)
+        hours, rest = divmod(rest, 3600)
+        minutes, seconds = divmod(rest, 60)
+        parts = [(days, "d"), (hours, "h"), (minutes, "m"), (seconds, "s")]
+        while parts[0][0] == 0 and len(parts) > 1:
+            parts.pop(0)
+        return " ".join(f"{value}{unit}" for value, unit in parts)
+
+    def make(self, kind, channel):
+        rng = self.rng
+        tier = self.tier()
+        sub = rng.choice([f"at Tier {tier}", "with Prime"])
+        if kind == "chat_message":
+            return f"{self.user()}: {self.text()}"
+        if kind == "chat_message_foreign":
+            return f"{rng.choice(foreign_names)} {self.user()}: {self.text()}"
+        if kind == "stream_live":
+            return f"{channel} is live!"
+        if kind == "sub_basic":
+            return f"{self.user()} subscribed at Tier {tier}."
+        if kind == "sub_prime_basic":
+            return f"{self.user()} subscribed with Prime."
+        if kind == "sub_with_months":
+            months = rng.randint(1, 60)
+            return (
+                f"{self.user()} subscribed {sub}. "
+                f"They've subscribed for {self.plural(months, 'month')}!"
+            )
+        if kind == "sub_with_streak":
+            months = self.months()
+            return (
+                f"{self.user()} subscribed {sub}. They've subscribed for {months} months, "
+                f"currently on a {rng.randint(2, months)} month streak!"
+            )
+        if kind == "sub_advance":
+            ahead = rng.randint(1, 12)
+            reaching = rng.choice(
+                ["", f", reaching {self.months()} months cumulatively so far"]
+            )
+            return (
+                f"{self.user()} subscribed at Tier {tier} for "
+                f"{self.plural(ahead, 'month')} in advance{reaching}!"
+            )
+        if kind == "gift_individual":
+            given = rng.choice(
+                ["", f" They have given {rng.randint(2, 500)} Gift Subs in the channel!"]
+            )
+            return f"{self.user()} gifted a Tier {tier} sub to {self.user()}!{given}"
+        if kind == "gift_first":
+            return (
+                f"{self.user()} gifted a Tier {tier} sub to {self.user()}! "
+                f"This is their first Gift Sub in the channel!"
+            )
+        if kind == "anon_gift_announcement":
+            count = rng.choice([5, 10, 20, 50, 100])
+            return (
+                f"AnAnonymousGifter is gifting {count} Tier {tier} Subs to "
+                f"{channel}'s community!"
+            )
+        if kind == "anon_gift_individual":
+            months = rng.choice(
+                ["", "", f" {self.plural(rng.choice([3, 6, 12]), 'month')} of"]
+            )
+            return f"An anonymous user gifted{months} a Tier {tier} sub to {self.user()}!"
+        if kind == "timeout":
+            return f"{self.user()} has been timed out for {self.duration()}."
+        if kind == "permanent_ban":
+            return f"{self.user()} has been permanently banned."
+        if kind == "raid":
+            raiders = rng.choice([1, 3, 25, 250, 4000])
+            raider = "raider" if raiders == 1 else "raiders"
+            return f"{raiders} {raider} from {rng.choice(self.usernames)} have joined!"
+        if kind == "room_mode_on":
+            return f"This room is now in {rng.choice(room_modes)} mode."
+        if kind == "room_mode_off":
+            return f"This room is no longer in {rng.choice(room_modes)} mode."
+        if kind == "announcement":
+            return "Announcement"
+        if kind == "no_match":
+            return rng.choice(unmatched).format(user=self.user(), channel=channel)
+        raise ValueError(f"no template for {kind}")
+
+    def gifts(self, channel):
+        """A community gift: the announcement, then a line per gifted sub."""
+        gifter = self.user()
+        tier = self.tier()
+        count = self.rng.choice([1, 1, 5, 5, 10, 20, 50])
+        subs = "Sub" if count == 1 else "Subs"
+        yield "gift_announcement", (
+            f"{gifter} is gifting {count} Tier {tier} {subs} to {channel}'s community! "
+            f"They've gifted a total of {count * self.rng.randint(1, 20)} in the channel!"
+        )
+        for _ in range(count):
+            yield "gift_individual", f"{gifter} gifted a Tier {tier} sub to {self.user()}!"
+
+    def lines(self, kind, channel):
+        """``(kind, text)`` of the lines logged for one event of the given kind."""
+        if kind == "gift_announcement":
+            yield from self.gifts(channel)
+            return
+        yield kind, self.make(kind, channel)
+        if kind == "announcement":
+            # the announced message follows on a line of its own
+            yield "chat_message", f"{self.user()}: {self.text()}"
+
+
+def header(at):
+    return f"# Start logging at {at:%Y-%m-%d %H:%M:%S} Eastern Standard Time"
+
+
+def write_stream(f, maker, kinds, weights, channel, start, lines, rate, reconnect, counts):
+    """Write one stream of ``lines`` lines, or a few more, starting at start.
+
+    Lines are ``rate`` per second on average, in bursts. With probability
+    ``reconnect`` Chatterino restarts partway, which logs a second header.
+    """
+    rng = maker.rng
+    at = start
+    f.write(header(at) + "\n\n")
+    restart_at = rng.randrange(lines) if rng.random() < reconnect else None
+    written = 0
+    while written < lines:
+        kind = rng.choices(kinds, weights)[0]
+        for kind, text in maker.lines(kind, channel):
+            at += timedelta(seconds=rng.expovariate(rate))
+            f.write(f"[{at:%H:%M:%S}] {text}\n")
+            counts[kind] += 1
+            written += 1
+        if restart_at is not None and written >= restart_at:
+            f.write("\n" + header(at) + "\n\n")
+            restart_at = None
+
+
+def generate(
+    root,
+    lines,
+    channels=default_channels,
+    lines_per_stream=100_000,
+    rate=10.0,
+    users=50_000,
+    weights=default_weights,
+    reconnect=0.2,
+    start=datetime(2024, 11, 10),
+    seed=0,
+):
+    """Write about ``lines`` log lines under root as ``<channel>/<channel>-<date>.log``.
+
+    Every file is one stream starting in the evening, so long ones go past
+    midnight; channels take turns, one stream a day each. Returns the lines
+    written per pattern, as new_pattern_counts() would count them.
+    """
+    root = Path(root)
+    rng = random.Random(seed)
+    maker = LineMaker(rng, make_usernames(users, rng))
+    kinds = list(weights)
+    kind_weights = list(weights.values())
+    counts = new_pattern_counts()
+
+    streams = max(1, -(-lines // lines_per_stream))
+    for i in range(streams):
+        channel = channels[i % len(channels)]
+        day = start + timedelta(days=i // len(channels))
+        stream_start = day + timedelta(hours=rng.uniform(18, 23.5))
+        size = min(lines_per_stream, lines - i * lines_per_stream)
+        path = root / channel / f"{channel}-{day:%Y-%m-%d}.log"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            write_stream(
+                f,
+                maker,
+                kinds,
+                kind_weights,
+                channel,
+                stream_start,
+                size,
+                rate,
+                reconnect,
+                counts,
+            )
+    return counts
+
+
+def check_templates(seed=0, samples=200):
+    """Raise if a template does not classify as the pattern it is meant for."""
+    rng = random.Random(seed)
+    maker = LineMaker(rng, make_usernames(100, rng))
+    missing = set(patterns) - set(default_weights)
+    if missing:
+        raise ValueError(f"no weight for {sorted(missing)}")
+    for kind in default_weights:
+        for _ in range(samples):
+            for expected, text in maker.lines(kind, "sodapoppin"):
+                actual, _ = classify(f"[12:00:00] {text}")
+                if (actual or "no_match") != expected:
+                    raise ValueError(f"{text!r} classifies as {actual}, not {expected}")
+
+
+def parse_weight(value):
+    kind, _, weight = value.partition("=")
+    if kind not in default_weights or not weight:
+        raise argparse.ArgumentTypeError(
+            f"expected PATTERN=WEIGHT, PATTERN one of {', '.join(default_weights)}"
+        )
+    return kind, float(weight)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Write synthetic Chatterino logs covering every pattern, for benchmarks"
+    )
+    parser.add_argument("root", type=Path, help="Channels directory to write to")
+    parser.add_argument("--lines", type=int, default=1_000_000)
+    parser.add_argument("--channels", nargs="+", default=default_channels)
+    parser.add_argument("--lines-per-stream", type=int, default=100_000)
+    parser.add_argument("--rate", type=float, default=10, help="lines per second")
+    parser.add_argument("--users", type=int, default=50_000)
+    parser.add_argument(
+        "--weight",
+        type=parse_weight,
+        action="append",
+        default=[],
+        metavar="PATTERN=WEIGHT",
+        help="change the relative weight of a pattern, or no_match; repeatable",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    check_templates(args.seed)
+    weights = {**default_weights, **dict(args.weight)}
+    counts = generate(
+        args.root,
+        args.lines,
+        args.channels,
+        args.lines_per_stream,
+        args.rate,
+        args.users,
+        weights,
+        seed=args.seed,
+    )
+    print(counts)
+    print(f"wrote {sum(counts.values())} lines to {args.root}")
+
+
+if "__main__" == __name__:
+    main()
@@ -1,71 +1,90 @@
-import time
-import sqlite3
-from datetime import datetime
-import re
-
-import os
 from pathlib import Path
+from typing import get_args
+import argparse
+import sys
 
-chat_message_pattern = r"^\[(\d{2}:\d{2}:\d{2})\]\s+(\w+):\s+(.+)$"
-
-username = "cjw"
-channel_name = "sodapoppin"
-mac_directory = f"/Users/{username}/Library/Application Support/chatterino/Logs/Twitch/Channels/{channel_name}/"
-
-most_recent_log_file = max(Path(mac_directory).iterdir(), key=os.path.getmtime).name
-
-# for mac m1
-filename = mac_directory + most_recent_log_file
-
-# for windows
-# TODO
+sys.path.append(str(Path(__file__).resolve().parents[2] / "web" / "backend"))
+from add_example_data import db_path  # noqa: E402
+from chatlog import CHUNK_SIZE, init_db  # noqa: E402
+from chatlog.connections import write_engine  # noqa: E402
+from chatlog.logfiles import channels_directory  # noqa: E402
+from chatlog.metrics import format_stage_rates  # noqa: E402
+from chatlog.shards import ShardBy, ShardRouter  # noqa: E402
+from chatlog.tailer import FLUSH_INTERVAL, Tailer  # noqa: E402
 
 
-def store_db(message):
-    created_at = datetime.now().isoformat()
-    timestamp = message.group(1)
-    username = message.group(2)
-    message_text = message.group(3)
-    cursor.execute(
-        "INSERT INTO chat_messages (created_at, timestamp, channel_name, username, message_text) VALUES (?, ?, ?, ?, ?)",
-        (created_at, timestamp, channel_name, username, message_text),
+def main():
+    parser = argparse.ArgumentParser(
+        description="Follow every channel's Chatterino logs and store new lines as they are written"
     )
-    conn.commit()
-    # print(f"Stored: {line.strip()}")
-
-
-def poll_and_store_db(filename, poll_interval=0.1):
-    with open(filename, "r", encoding="utf-8") as file:
-        file.seek(0, 2)
-        while True:
-            line = file.readline()
-            if line:
-                message = line.strip()
-                match = re.match(chat_message_pattern, message)
-                if match:
-                    store_db(match)
-            else:
-                time.sleep(poll_interval)
-
+    parser.add_argument(
+        "root",
+        nargs="?",
+        type=Path,
+        default=channels_directory,
+        help="Channels directory or a single channel's directory",
+    )
+    parser.add_argument(
+        "--flush-interval",
+        type=float,
+        default=FLUSH_INTERVAL,
+        help="seconds between writes of buffered rows",
+    )
+    parser.add_argument(
+        "--flush-rows",
+        type=int,
+        default=CHUNK_SIZE,
+        help="write early once this many rows are buffered",
+    )
+    parser.add_argument(
+        "--from-start",
+        action="store_true",
+        help="read files without a stored offset from the start instead of the end",
+    )
+    parser.add_argument(
+        "--natural-key",
+        action="store_true",
+        help="never store a line twice, see chatlog.db.add_natural_key",
+    )
+    parser.add_argument(
+        "--shard-dir",
+        type=Path,
+        help="store each channel's (or month's) rows in a database of its own "
+        "in this directory, see chatlog.shards",
+    )
+    parser.add_argument("--shard-by", choices=get_args(ShardBy), default="channel")
+    parser.add_argument(
+        "--database",
+        type=Path,
+        default=db_path,
+        help="database to store into without --shard-dir (default: DATABASE_PATH)",
+    )
+    args = parser.parse_args()
 
-if "__main__" == __name__:
+    router = None
+    engine = None
+    if args.shard_dir is not None:
+        router = ShardRouter(args.shard_dir, args.shard_by, args.natural_key)
+    else:
+        # the tailer's one writer connection, see chatlog.connections
+        engine = write_engine(args.database)
+        init_db(engine, args.natural_key)
+    tailer = Tailer(
+        engine,
+        args.root,
+        args.flush_interval,
+        args.flush_rows,
+        args.from_start,
+        router,
+    )
+    print(f"Following {args.root}")
     try:
-        conn = sqlite3.connect("chat_logs.db")
-        cursor = conn.cursor()
-        cursor.execute(
-            """
-            CREATE TABLE IF NOT EXISTS chat_messages (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                created_at TEXT,
-                timestamp TEXT,
-                channel_name TEXT,
-                username TEXT,
-                message_text TEXT
-            )
-        """
-        )
-        conn.commit()
-        poll_and_store_db(filename)
+        tailer.run()
     except KeyboardInterrupt:
         print("\nStopping...")
-        conn.close()
+    print(tailer.counts)
+    print(format_stage_rates(tailer.timings))
+
+
+if "__main__" == __name__:
+    main()
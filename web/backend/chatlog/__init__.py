@@ -0,0 +1,41 @@
+from chatlog.db import (
+    CHUNK_SIZE,
+    bulk_load,
+    create_indexes,
+    init_db,
+    insert_rows,
+    store_rows,
+)
+from chatlog.models import ChatMessage
+from chatlog.parser import (
+    ParsedEvent,
+    classify,
+    extract_usernames,
+    parse_lines,
+    read_stream_date,
+)
+from chatlog.patterns import (
+    new_pattern_counts,
+    non_chat_patterns,
+    patterns,
+    username_indices,
+)
+
+__all__ = [
+    "CHUNK_SIZE",
+    "ChatMessage",
+    "ParsedEvent",
+    "bulk_load",
+    "classify",
+    "create_indexes",
+    "extract_usernames",
+    "init_db",
+    "insert_rows",
+    "new_pattern_counts",
+    "non_chat_patterns",
+    "parse_lines",
+    "patterns",
+    "read_stream_date",
+    "store_rows",
+    "username_indices",
+]
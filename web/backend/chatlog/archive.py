@@ -0,0 +1,353 @@
+import heapq
+import os
+from datetime import date, datetime, time, timedelta, timezone
+from pathlib import Path
+
+from sqlalchemy import delete, func, insert, select
+
+from chatlog.export import arrow_schema
+from chatlog.models import ArchiveFile, Channel, ChatMessage
+from chatlog.names import ChatRow, chat_columns, chat_fields, names
+from chatlog.queries import as_utc, name_id, sort_fields
+
+# rows per Parquet row group in archive files
+ROW_GROUP_SIZE = 64 * 1024
+
+
+def day_bounds(day):
+    start = datetime.combine(day, time(), timezone.utc)
+    return start, start + timedelta(days=1)
+
+
+def archive_path(channel_name, day):
+    return Path(channel_name) / f"{day.isoformat()}.parquet"
+
+
+def read_file(path, filters=None):
+    import pyarrow.parquet as pq
+
+    return pq.read_table(path, memory_map=True, filters=filters)
+
+
+def write_file(path, rows):
+    """Write ChatRows sorted by (timestamp, id) to path, atomically."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = arrow_schema(chat_fields)
+    table = pa.Table.from_arrays(
+        [pa.array(column, field.type) for column, field in zip(zip(*rows), schema)],
+        schema=schema,
+    )
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".parquet.tmp")
+    pq.write_table(table, tmp, compression="zstd", row_group_size=ROW_GROUP_SIZE)
+    os.replace(tmp, path)
+
+
+def table_rows(table):
+    columns = [table.column(name).to_pylist() for name in chat_fields]
+    return [ChatRow(*values) for values in zip(*columns)]
+
+
+def utc_rows(rows):
+    """ChatRows with aware UTC timestamps, as archived rows have, see as_utc()."""
+    for row in rows:
+        if row.timestamp.tzinfo is None:
+            row = row._replace(timestamp=as_utc(row.timestamp))
+        yield row
+
+
+def archive_day(conn, archive_dir, channel_name, day):
+    """Move one channel's rows for one UTC day out of ChatMessage into Parquet.
+
+    Rows already archived for that day, e.g. by an earlier run or a run
+    that stopped before its rows were deleted, are merged in by id. The
+    file is replaced first; the ArchiveFile row and the delete commit
+    together in the caller's transaction.
+    """
+    start, end = day_bounds(day)
+    conditions = [
+        ChatMessage.channel_id == name_id("channel_name", channel_name),
+        ChatMessage.timestamp >= start,
+        ChatMessage.timestamp < end,
+    ]
+    selected = conn.execute(select(*chat_columns).where(*conditions)).all()
+    rows = {row.id: row for row in utc_rows(names(conn).decode(conn, selected))}
+    if not rows:
+        return 0
+
+    relative = archive_path(channel_name, day)
+    path = Path(archive_dir) / relative
+    if path.exists():
+        for row in table_rows(read_file(path)):
+            rows.setdefault(row.id, row)
+
+    ordered = sorted(rows.values(), key=lambda row: (row.timestamp, row.id))
+    write_file(path, ordered)
+
+    conn.execute(delete(ArchiveFile).where(ArchiveFile.path == str(relative)))
+    conn.execute(
+        insert(ArchiveFile).values(
+            path=str(relative),
+            channel_name=channel_name,
+            day=day,
+            min_timestamp=ordered[0].timestamp,
+            max_timestamp=ordered[-1].timestamp,
+            min_id=min(rows),
+            max_id=max(rows),
+            rows=len(ordered),
+        )
+    )
+    conn.execute(delete(ChatMessage).where(*conditions))
+    return len(ordered)
+
+
+def archive_before(engine, archive_dir, cutoff, progress=True):
+    """Archive every channel's whole UTC days that end on or before cutoff.
+
+    Each (channel, day) is its own transaction. Returns the rows moved.
+    """
+    cutoff_day = cutoff.astimezone(timezone.utc).date()
+    day = func.date(ChatMessage.timestamp)
+    with engine.connect() as conn:
+        pairs = conn.execute(
+            select(Channel.name, day)
+            .join(ChatMessage, ChatMessage.channel_id == Channel.id)
+            .where(ChatMessage.timestamp < day_bounds(cutoff_day)[0])
+            .group_by(Channel.name, day)
+            .order_by(Channel.name, day)
+        ).all()
+        conn.commit()
+
+        total = 0
+        for channel_name, day_text in pairs:
+            with conn.begin():
+                moved = archive_day(
+                    conn, archive_dir, channel_name, date.fromisoformat(day_text)
+                )
+            total += moved
+            if progress:
+                print(f"archived {moved} rows of {channel_name} on {day_text}")
+    return total
+
+
+def archive_files(conn, channel_name=None, start_datetime=None, end_datetime=None):
+    """ArchiveFile rows whose channel and timestamp range can match the filters."""
+    start_datetime = as_utc(start_datetime)
+    end_datetime = as_utc(end_datetime)
+    conditions = []
+    if channel_name is not None:
+        conditions.append(ArchiveFile.channel_name == channel_name)
+    if start_datetime is not None:
+        conditions.append(ArchiveFile.max_timestamp >= start_datetime)
+    if end_datetime is not None:
+        conditions.append(ArchiveFile.min_timestamp <= end_datetime)
+    return conn.execute(
+        select(ArchiveFile).where(*conditions).order_by(ArchiveFile.min_timestamp)
+    ).all()
+
+
+def sort_key(order_by, desc):
+    """Python sort key equal to the SQL order of sort_fields(order_by).
+
+    SQLite sorts NULLs first ascending and last descending; with
+    ``reverse=True`` for desc, ``(value is not None, value)`` does the same.
+    """
+    fields = sort_fields(order_by)
+
+    def key(row):
+        return tuple(
+            (getattr(row, name) is not None, getattr(row, name)) for name in fields
+        )
+
+    return key
+
+
+def after_expression(order_by, desc, key):
+    """Parquet filter for rows after ``key``, the counterpart of after_cursor()."""
+    import pyarrow.compute as pc
+
+    fields = [pc.field(name) for name in sort_fields(order_by)]
+
+    def compare(field, value):
+        return field < value if desc else field > value
+
+    # lexicographic comparison over the non-null tail: timestamp and id
+    rest = compare(fields[-1], key[-1])
+    for field, value in zip(reversed(fields[1:-1]), reversed(key[1:-1])):
+        rest = compare(field, value) | ((field == value) & rest)
+    if len(fields) == 1:
+        return rest
+
+    first, value = fields[0], key[0]
+    if value is None:
+        if desc:
+            return first.is_null() & rest
+        return first.is_valid() | (first.is_null() & rest)
+    seek = compare(first, value) | ((first == value) & rest)
+    if desc and order_by == "username":
+        return seek | first.is_null()
+    return seek
+
+
+def archive_filter(
+    username=None,
+    message_type=None,
+    start_datetime=None,
+    end_datetime=None,
+    order_by="timestamp",
+    desc=False,
+    after=None,
+):
+    """Parquet filter for the /chats/ filters and cursor, or None without any."""
+    import pyarrow.compute as pc
+
+    start_datetime = as_utc(start_datetime)
+    end_datetime = as_utc(end_datetime)
+    if after is not None:
+        after = [as_utc(value) if isinstance(value, datetime) else value for value in after]
+
+    conditions = []
+    if username is not None:
+        conditions.append(pc.field("username") == username)
+    if message_type is not None:
+        conditions.append(pc.field("message_type") == message_type)
+    if start_datetime is not None:
+        conditions.append(pc.field("timestamp") >= start_datetime)
+    if end_datetime is not None:
+        conditions.append(pc.field("timestamp") <= end_datetime)
+    if after is not None:
+        conditions.append(after_expression(order_by, desc, after))
+    expression = None
+    for condition in conditions:
+        expression = condition if expression is None else expression & condition
+    return expression
+
+
+def file_sorting(order_by, desc):
+    """Arrow sort_by() keys for /chats/ order, nulls placed as sort_key() does."""
+    return [
+        (name, "descending" if desc else "ascending", "at_end" if desc else "at_start")
+        for name in sort_fields(order_by)
+    ]
+
+
+def archived_page(
+    archive_dir,
+    files,
+    username=None,
+    message_type=None,
+    start_datetime=None,
+    end_datetime=None,
+    order_by="timestamp",
+    desc=False,
+    after=None,
+    limit=100,
+):
+    """The first ``limit`` archived rows after ``after`` in /chats/ order.
+
+    Only the given (already pruned) files are memory-mapped. Filters and
+    the cursor are pushed down to Parquet, and each file contributes at
+    most ``limit`` rows, sorted in Arrow. Archive files hold one day each,
+    so when ordering by timestamp reading stops at the first file that
+    starts past the last row of a full page.
+    """
+    expression = archive_filter(
+        username, message_type, start_datetime, end_datetime, order_by, desc, after
+    )
+    sorting = file_sorting(order_by, desc)
+    key = sort_key(order_by, desc)
+
+    # read files in the order their rows come, so a full page can stop early
+    if desc:
+        files = sorted(files, key=lambda f: f.max_timestamp, reverse=True)
+    else:
+        files = sorted(files, key=lambda f: f.min_timestamp)
+
+    page = []
+    for archived in files:
+        if order_by == "timestamp" and len(page) == limit:
+            last = page[-1].timestamp
+            if desc:
+                past = as_utc(archived.max_timestamp) < last
+            else:
+                past = as_utc(archived.min_timestamp) > last
+            if past:
+                break
+
+        table = read_file(Path(archive_dir) / archived.path, expression)
+        if order_by != "timestamp":
+            table = table.sort_by(sorting).slice(0, limit)
+        elif desc:
+            # files are written in (timestamp, id) order already
+            table = table.slice(max(0, table.num_rows - limit))[::-1]
+        else:
+            table = table.slice(0, limit)
+        page = list(heapq.merge(page, table_rows(table), key=key, reverse=desc))[:limit]
+
+    return page
+
+
+def merge_pages(order_by, desc, *pages):
+    """Merge pages that are each in /chats/ order, dropping rows seen twice.
+
+    Timestamps are made aware, so database rows compare with archived ones.
+    """
+    seen = set()
+    pages = [utc_rows(page) for page in pages]
+    for row in heapq.merge(*pages, key=sort_key(order_by, desc), reverse=desc):
+        if row.id not in seen:
+            seen.add(row.id)
+            yield row
+
+
+def archived_rows(
+    archive_dir,
+    files,
+    username=None,
+    message_type=None,
+    start_datetime=None,
+    end_datetime=None,
+    order_by="timestamp",
+    desc=False,
+):
+    """Every archived row matching the filters, in /chats/ order, for /chats/export.
+
+    Ordered by timestamp, files are read a group at a time: the files
+    whose time ranges overlap, about one day of every channel. Other
+    orders hold the matching rows of every file at once.
+    """
+    expression = archive_filter(username, message_type, start_datetime, end_datetime)
+    sorting = file_sorting(order_by, desc)
+    key = sort_key(order_by, desc)
+
+    def read(archived):
+        table = read_file(Path(archive_dir) / archived.path, expression)
+        if order_by != "timestamp":
+            table = table.sort_by(sorting)
+        elif desc:
+            # files are written in (timestamp, id) order already
+            table = table[::-1]
+        return table_rows(table)
+
+    if order_by != "timestamp":
+        yield from heapq.merge(*map(read, files), key=key, reverse=desc)
+        return
+
+    if desc:
+        files = sorted(files, key=lambda f: as_utc(f.max_timestamp), reverse=True)
+    else:
+        files = sorted(files, key=lambda f: as_utc(f.min_timestamp))
+    group = []
+    for archived in files:
+        low, high = as_utc(archived.min_timestamp), as_utc(archived.max_timestamp)
+        # no row of a later file can come before the rows of the group so far
+        if group and (high < bound if desc else low > bound):
+            yield from heapq.merge(*map(read, group), key=key, reverse=desc)
+            group = []
+        if not group:
+            bound = low if desc else high
+        bound = min(bound, low) if desc else max(bound, high)
+        group.append(archived)
+    yield from heapq.merge(*map(read, group), key=key, reverse=desc)
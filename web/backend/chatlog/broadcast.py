@@ -0,0 +1,75 @@
+import asyncio
+
+
+# rows a subscriber may fall behind by before it is disconnected
+QUEUE_SIZE = 10_000
+
+# queued in place of rows for a subscriber that fell too far behind
+LAGGED = None
+
+
+class Subscriber:
+    def __init__(self, filters, queue_size=QUEUE_SIZE):
+        self.filters = filters
+        self.queue = asyncio.Queue(queue_size)
+        self.lagged = False
+
+    def matches(self, row):
+        return all(getattr(row, name) == value for name, value in self.filters.items())
+
+    def drain(self, limit):
+        """Return up to limit items that are queued already, without waiting."""
+        items = []
+        while len(items) < limit and not self.queue.empty():
+            items.append(self.queue.get_nowait())
+        return items
+
+    def send(self, row_id, data):
+        if self.lagged:
+            return
+        try:
+            self.queue.put_nowait((row_id, data))
+        except asyncio.QueueFull:
+            # drop what is queued instead of buffering without bound or
+            # holding up everyone else; the client resumes from its last id
+            self.lagged = True
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(LAGGED)
+
+
+class Broadcast:
+    """Fan newly stored ChatMessage rows out to every matching subscriber.
+
+    Runs on the event loop: publish() never waits, each subscriber has its
+    own bounded queue, and a subscriber whose queue fills up is sent LAGGED
+    and dropped rather than slowing down the others.
+    """
+
+    def __init__(self, queue_size=QUEUE_SIZE):
+        self.queue_size = queue_size
+        self.subscribers = set()
+
+    def subscribe(self, **filters):
+        """Return a Subscriber for rows whose columns equal the non-None filters."""
+        subscriber = Subscriber(
+            {name: value for name, value in filters.items() if value is not None},
+            self.queue_size,
+        )
+        self.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        self.subscribers.discard(subscriber)
+
+    def publish(self, rows, encode):
+        """Queue each row, encoded once with ``encode(row)``, for its subscribers."""
+        for row in rows:
+            data = None
+            for subscriber in list(self.subscribers):
+                if subscriber.matches(row):
+                    if data is None:
+                        data = encode(row)
+                    subscriber.send(row.id, data)
+                if subscriber.lagged:
+                    self.unsubscribe(subscriber)
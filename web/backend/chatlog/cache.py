@@ -0,0 +1,100 @@
+import hashlib
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+
+@dataclass(slots=True)
+class CachedResponse:
+    body: bytes
+    etag: str
+    headers: dict
+    channel_name: str | None
+    expires: float
+
+
+def make_etag(body):
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+class ResponseCache:
+    """LRU cache of encoded responses with a TTL and per-channel invalidation.
+
+    Entries are keyed on the normalised query parameters and remember the
+    channel they were filtered on; invalidate(channel_name) drops those
+    entries along with every unfiltered one, which can include that channel.
+    A response computed while its channel was invalidated is not stored, so
+    a slow query cannot put rows from before the write back in the cache.
+    """
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.versions = {}
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def token(self, channel_name):
+        """Version to pass to put(), taken before the query runs."""
+        if channel_name is None:
+            return self.version
+        return self.versions.get(channel_name, 0)
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is not None and entry.expires <= time.monotonic():
+            del self.entries[key]
+            self.evictions += 1
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def put(self, key, channel_name, token, body, headers):
+        entry = CachedResponse(
+            body, make_etag(body), headers, channel_name, time.monotonic() + self.ttl
+        )
+        if self.max_entries <= 0 or token != self.token(channel_name):
+            return entry
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+        return entry
+
+    def invalidate(self, channel_names):
+        """Drop entries that may include new rows for any of channel_names."""
+        channel_names = set(channel_names)
+        if not channel_names:
+            return
+        self.version += 1
+        for channel_name in channel_names:
+            self.versions[channel_name] = self.versions.get(channel_name, 0) + 1
+
+        stale = [
+            key
+            for key, entry in self.entries.items()
+            if entry.channel_name is None or entry.channel_name in channel_names
+        ]
+        for key in stale:
+            del self.entries[key]
+        self.invalidations += len(stale)
+
+    def stats(self):
+        return {
+            "entries": len(self.entries),
+            "max_entries": self.max_entries,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
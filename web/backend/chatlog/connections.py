@@ -0,0 +1,71 @@
+import sqlite3
+from pathlib import Path
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.pool import QueuePool
+
+
+# milliseconds a connection waits for a lock before "database is locked"
+BUSY_TIMEOUT_MS = 10_000
+
+# bytes of the database file read through a memory map instead of read()
+MMAP_SIZE = 256 * 1024 * 1024
+
+# applied to every connection when it is opened, see apply_pragmas(); WAL
+# lets readers go on while the writer commits, and with it synchronous=NORMAL
+# only syncs at checkpoints, which a crash cannot corrupt
+READER_PRAGMAS = {"busy_timeout": BUSY_TIMEOUT_MS, "mmap_size": MMAP_SIZE}
+WRITER_PRAGMAS = {"journal_mode": "WAL", "synchronous": "NORMAL", **READER_PRAGMAS}
+
+
+def apply_pragmas(engine, pragmas):
+    """Run ``PRAGMA name=value`` for each of pragmas on every new connection of engine."""
+
+    @event.listens_for(engine, "connect")
+    def set_pragmas(dbapi_connection, _connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f"PRAGMA {name}={value}")
+        finally:
+            cursor.close()
+
+    return engine
+
+
+def write_engine(path, echo=False):
+    """The engine ingest writes through: one connection, in WAL mode.
+
+    SQLite allows one writer at a time, so a single pooled connection is
+    all a writing process can use; a second checkout waits for the first
+    to be returned instead of failing on the database lock. The database
+    file is created if missing.
+    """
+    engine = create_engine(
+        f"sqlite:///{path}",
+        echo=echo,
+        connect_args={"check_same_thread": False},
+        pool_size=1,
+        max_overflow=0,
+    )
+    return apply_pragmas(engine, WRITER_PRAGMAS)
+
+
+def read_engine(path, pool_size, echo=False):
+    """A pool of pool_size read-only (``mode=ro``) connections, for the API's worker threads.
+
+    In WAL mode readers see the last commit and never wait for the writer.
+    The database has to exist and be in WAL mode already, see write_engine().
+    """
+    # as_uri() escapes what SQLite would otherwise read as URI syntax, which
+    # a sqlite:/// URL would have decoded again
+    uri = f"{Path(path).resolve().as_uri()}?mode=ro"
+    engine = create_engine(
+        "sqlite://",
+        creator=lambda: sqlite3.connect(uri, uri=True, check_same_thread=False),
+        echo=echo,
+        poolclass=QueuePool,
+        pool_size=pool_size,
+        max_overflow=0,
+    )
+    return apply_pragmas(engine, READER_PRAGMAS)
@@ -0,0 +1,446 @@
+import time
+from contextlib import contextmanager
+from itertools import islice
+
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.schema import CreateIndex, CreateTable, DropIndex
+from sqlmodel import SQLModel
+
+from chatlog.models import (
+    ArchiveFile,
+    Channel,
+    ChatEvent,
+    ChatMessage,
+    ChatUser,
+    IngestState,
+    LogFileRows,
+    MessageType,
+)
+from chatlog.events import events_missing, insert_events, rebuild_events
+from chatlog.names import NO_USER, chat_columns, names
+from chatlog.rollups import (
+    rebuild_rollups,
+    remove_from_rollups,
+    rollups_missing,
+    update_rollups,
+)
+from chatlog.search import (
+    create_search_index,
+    create_search_triggers,
+    drop_search_triggers,
+    index_rows_after,
+)
+
+
+# rows written per transaction by store_rows()
+CHUNK_SIZE = 10_000
+
+# page cache used during bulk_load(), in KiB
+BULK_CACHE_KIB = 256 * 1024
+
+# optional unique index over the columns that identify a log line, see add_natural_key()
+NATURAL_KEY_INDEX = "ux_chatmessage_natural_key"
+NATURAL_KEY = ["channel_id", "timestamp", "user_id", "message_type_id", "message_text"]
+
+
+def create_indexes(conn):
+    """Create any ChatMessage index that is missing, e.g. after an interrupted bulk load."""
+    for index in ChatMessage.__table__.indexes:
+        conn.execute(CreateIndex(index, if_not_exists=True))
+
+
+def drop_stale_indexes(conn):
+    """Drop ``ix_chatmessage_*`` indexes that ChatMessage no longer declares."""
+    declared = {index.name for index in ChatMessage.__table__.indexes}
+    for (name,) in conn.exec_driver_sql(
+        "SELECT name FROM sqlite_master "
+        "WHERE type = 'index' AND tbl_name = 'chatmessage' AND name LIKE 'ix_chatmessage_%'"
+    ).all():
+        if name not in declared:
+            conn.exec_driver_sql(f'DROP INDEX "{name}"')
+
+
+def table_exists(conn, name):
+    return (
+        conn.exec_driver_sql(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)
+        ).scalar()
+        is not None
+    )
+
+
+def copy_named_rows(conn, source, keep_ids):
+    """Fill chatmessage from a table that stores channel, user and type as strings.
+
+    The names are added to the lookup tables first. With ``keep_ids`` the
+    rows keep their ids, otherwise they are numbered in timestamp order.
+    """
+    for model, column in [
+        (Channel, "channel_name"),
+        (ChatUser, f"coalesce(username, '{NO_USER}')"),
+        (MessageType, "message_type"),
+    ]:
+        conn.exec_driver_sql(
+            f"INSERT OR IGNORE INTO {model.__tablename__} (name) "
+            f"SELECT DISTINCT {column} FROM {source} ORDER BY 1"
+        )
+    conn.exec_driver_sql(
+        "INSERT INTO chatmessage "
+        f"({'id, ' if keep_ids else ''}created_at, timestamp, channel_id, user_id, "
+        "message_text, message_type_id) "
+        f"SELECT {'m.id, ' if keep_ids else ''}m.created_at, m.timestamp, c.id, u.id, "
+        f"m.message_text, t.id FROM {source} m "
+        "JOIN channel c ON c.name = m.channel_name "
+        f"JOIN chatuser u ON u.name = coalesce(m.username, '{NO_USER}') "
+        "JOIN messagetype t ON t.name = m.message_type "
+        f"ORDER BY {'m.id' if keep_ids else 'm.timestamp'}"
+    )
+
+
+def rename_chatmessage(conn, name):
+    """Move chatmessage out of the way as ``name``, dropping its indexes."""
+    for (index,) in conn.exec_driver_sql(
+        "SELECT name FROM sqlite_master "
+        "WHERE type = 'index' AND tbl_name = 'chatmessage' AND sql IS NOT NULL"
+    ).all():
+        conn.exec_driver_sql(f'DROP INDEX "{index}"')
+    conn.exec_driver_sql(f"ALTER TABLE chatmessage RENAME TO {name}")
+
+
+def chatmessage_columns(conn):
+    return {
+        row[1]: row[2] for row in conn.exec_driver_sql("PRAGMA table_info(chatmessage)")
+    }
+
+
+def migrate_chatmessage(conn, source, keep_ids):
+    """Rebuild chatmessage from the renamed table ``source``, then drop it.
+
+    The copy and the drop commit together; if the migration is interrupted,
+    the next call starts the copy again from ``source``.
+    """
+    conn.exec_driver_sql("DROP TABLE IF EXISTS chatmessage")
+    for model in [Channel, ChatUser, MessageType, ChatMessage]:
+        conn.execute(CreateTable(model.__table__, if_not_exists=True))
+    copy_named_rows(conn, source, keep_ids)
+    conn.exec_driver_sql(f"DROP TABLE {source}")
+
+
+def migrate_uuid_ids(conn):
+    """Rebuild a chatmessage table keyed by uuid4 with INTEGER PRIMARY KEY ids.
+
+    The old table is renamed to ``chatmessage_uuid`` and copied over in
+    timestamp order, so ids follow message time.
+    """
+    if not table_exists(conn, "chatmessage_uuid"):
+        columns = chatmessage_columns(conn)
+        if not columns or columns["id"].upper() == "INTEGER":
+            return False
+        rename_chatmessage(conn, "chatmessage_uuid")
+
+    print("migrating chatmessage to integer ids...")
+    migrate_chatmessage(conn, "chatmessage_uuid", keep_ids=False)
+    return True
+
+
+def migrate_name_columns(conn):
+    """Move channel_name, username and message_type strings into lookup tables.
+
+    The old table is renamed to ``chatmessage_names`` and copied over with
+    the same ids, so the FTS index, which is keyed by id, stays valid.
+    """
+    if not table_exists(conn, "chatmessage_names"):
+        if "channel_name" not in chatmessage_columns(conn):
+            return False
+        rename_chatmessage(conn, "chatmessage_names")
+
+    print("migrating chatmessage names to lookup tables...")
+    migrate_chatmessage(conn, "chatmessage_names", keep_ids=True)
+    return True
+
+
+def migrate_log_offsets(conn):
+    """Turn the tailer's old LogOffset rows into LogFile manifest entries.
+
+    They get no content hash and a stat that never matches, so each file
+    is checked against its offset once, the next time it is read.
+    """
+    if not table_exists(conn, "logoffset"):
+        return False
+    conn.exec_driver_sql(
+        "INSERT OR IGNORE INTO logfile (path, size, mtime_ns, offset) "
+        "SELECT path, offset, 0, offset FROM logoffset"
+    )
+    conn.exec_driver_sql("DROP TABLE logoffset")
+    return True
+
+
+def has_natural_key(conn):
+    return (
+        conn.exec_driver_sql(
+            "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = ?",
+            (NATURAL_KEY_INDEX,),
+        ).scalar()
+        is not None
+    )
+
+
+def add_natural_key(conn):
+    """Delete duplicate rows and add the NATURAL_KEY unique index.
+
+    Rows are duplicates when the same user posted the same text of the same
+    type in the same channel and second; the first stored copy is kept.
+    With the index, insert_rows() skips rows that are stored already.
+    Returns the number of rows deleted; the rollups are rebuilt if any were.
+    """
+    if has_natural_key(conn):
+        return 0
+    columns = ", ".join(NATURAL_KEY)
+    duplicates = (
+        "SELECT id FROM chatmessage WHERE id NOT IN "
+        f"(SELECT min(id) FROM chatmessage GROUP BY {columns})"
+    )
+    conn.exec_driver_sql(f"DELETE FROM chatevent WHERE message_id IN ({duplicates})")
+    deleted = conn.exec_driver_sql(
+        f"DELETE FROM chatmessage WHERE id IN ({duplicates})"
+    ).rowcount
+    conn.exec_driver_sql(
+        f"CREATE UNIQUE INDEX {NATURAL_KEY_INDEX} ON chatmessage ({columns})"
+    )
+    if deleted:
+        print(f"deleted {deleted} duplicate rows")
+        rebuild_rollups(conn)
+    return deleted
+
+
+def new_keys(conn, encoded):
+    """Indexes of the encoded rows whose natural key is neither stored nor repeated."""
+    table = ChatMessage.__table__
+    keys = [tuple(row[name] for name in NATURAL_KEY) for row in encoded]
+    seen = set()
+    for channel_id in {key[0] for key in keys}:
+        times = [key[1] for key in keys if key[0] == channel_id]
+        seen.update(
+            tuple(row)
+            for row in conn.execute(
+                select(*(table.c[name] for name in NATURAL_KEY)).where(
+                    table.c.channel_id == channel_id,
+                    table.c.timestamp.between(min(times), max(times)),
+                )
+            )
+        )
+
+    keep = []
+    for i, key in enumerate(keys):
+        if key not in seen:
+            seen.add(key)
+            keep.append(i)
+    return keep
+
+
+def search_pending_after(conn):
+    return conn.exec_driver_sql(
+        "SELECT value FROM ingeststate WHERE key = 'fts_pending_after'"
+    ).scalar()
+
+
+def catch_up_search_index(conn):
+    """Index the rows a bulk load added while the FTS triggers were off."""
+    last_id = search_pending_after(conn)
+    if last_id is None:
+        return
+    index_rows_after(conn, last_id)
+    conn.exec_driver_sql("DELETE FROM ingeststate WHERE key = 'fts_pending_after'")
+
+
+def init_db(engine, natural_key=False):
+    """Create or migrate the schema; with natural_key, also add_natural_key()."""
+    with engine.begin() as conn:
+        migrate_uuid_ids(conn)
+        migrate_name_columns(conn)
+    SQLModel.metadata.create_all(engine)
+    with engine.begin() as conn:
+        migrate_log_offsets(conn)
+        drop_stale_indexes(conn)
+        create_indexes(conn)
+        create_search_index(conn)
+        catch_up_search_index(conn)
+        if rollups_missing(conn):
+            rebuild_rollups(conn)
+        if events_missing(conn):
+            rebuild_events(conn)
+        if natural_key:
+            add_natural_key(conn)
+
+
+def first_row_id(conn):
+    """Id of a database's first ChatMessage row: the ``first_id`` IngestState, or 1."""
+    first_id = conn.exec_driver_sql(
+        "SELECT value FROM ingeststate WHERE key = 'first_id'"
+    ).scalar()
+    return first_id if first_id is not None else 1
+
+
+def next_row_id(conn):
+    """Id of the next ChatMessage row; ids are never handed out twice.
+
+    The ``next_id`` IngestState is one past the last id insert_rows() gave
+    out. Rows archived to Parquet and their ChatEvent rows keep their ids
+    after the ChatMessage row is deleted, so a database without it yet
+    starts past those too.
+    """
+    next_id = conn.exec_driver_sql(
+        "SELECT value FROM ingeststate WHERE key = 'next_id'"
+    ).scalar()
+    if next_id is None:
+        used = [
+            conn.execute(select(func.max(ArchiveFile.max_id))).scalar(),
+            conn.execute(select(func.max(ChatEvent.message_id))).scalar(),
+        ]
+        used = [row_id for row_id in used if row_id is not None]
+        next_id = max(used) + 1 if used else first_row_id(conn)
+    last_id = conn.execute(select(func.max(ChatMessage.id))).scalar()
+    return max(next_id, last_id + 1) if last_id is not None else next_id
+
+
+def record_file_rows(conn, rows, first_id):
+    """Add LogFileRows runs for inserted rows with a ``log_file``, numbered from first_id."""
+    runs = []
+    for row_id, row in enumerate(rows, first_id):
+        path = row.get("log_file")
+        if path is None:
+            continue
+        if runs and runs[-1]["path"] == path and runs[-1]["last_id"] == row_id - 1:
+            runs[-1]["last_id"] = row_id
+        else:
+            runs.append({"path": path, "first_id": row_id, "last_id": row_id})
+    if runs:
+        conn.execute(insert(LogFileRows), runs)
+
+
+def forget_file(conn, path):
+    """Delete the rows stored from log file path, before it is stored again from the start.
+
+    Their ChatEvent rows, rollup counts and FTS entries go with them, in the
+    caller's transaction. Rows archived to Parquet since are not deleted.
+    Returns the number of rows deleted.
+    """
+    runs = conn.execute(
+        select(LogFileRows.first_id, LogFileRows.last_id).where(
+            LogFileRows.path == str(path)
+        )
+    ).all()
+    # the FTS triggers are off during a bulk load; rows it indexed need deleting by hand
+    indexed_up_to = search_pending_after(conn)
+    deleted = 0
+    for first_id, last_id in runs:
+        ids = ChatMessage.id.between(first_id, last_id)
+        rows = names(conn).decode(conn, conn.execute(select(*chat_columns).where(ids)).all())
+        remove_from_rollups(conn, [row._asdict() for row in rows])
+        conn.execute(delete(ChatEvent).where(ChatEvent.message_id.between(first_id, last_id)))
+        if indexed_up_to is not None and first_id <= indexed_up_to:
+            conn.exec_driver_sql(
+                "INSERT INTO chatmessage_fts (chatmessage_fts, rowid, message_text) "
+                "SELECT 'delete', id, message_text FROM chatmessage WHERE id BETWEEN ? AND ?",
+                (first_id, min(last_id, indexed_up_to)),
+            )
+        deleted += conn.execute(delete(ChatMessage).where(ids)).rowcount
+    conn.execute(delete(LogFileRows).where(LogFileRows.path == str(path)))
+    return deleted
+
+
+def insert_rows(conn, rows):
+    """Insert row dicts that name their channel, user and message type.
+
+    The names are interned into the lookup tables, the ``details`` of event
+    rows stored in ChatEvent and the rows counted into the /stats/ rollups,
+    all in the caller's transaction. Rows with a ``log_file`` path get their
+    ids recorded in LogFileRows, for forget_file(). With the natural key
+    index, rows that are stored already are left out, also from the rollups.
+    Returns the number of rows inserted.
+    """
+    encoded = names(conn).encode(conn, rows)
+    if has_natural_key(conn):
+        keep = new_keys(conn, encoded)
+        rows = [rows[i] for i in keep]
+        encoded = [encoded[i] for i in keep]
+    if encoded:
+        # the batch gets consecutive ids from next_row_id()
+        first_id = next_row_id(conn)
+        for i, row in enumerate(encoded):
+            row["id"] = first_id + i
+        conn.execute(insert(ChatMessage), encoded)
+        conn.exec_driver_sql(
+            "INSERT OR REPLACE INTO ingeststate (key, value) VALUES ('next_id', ?)",
+            (first_id + len(encoded),),
+        )
+        insert_events(conn, rows, encoded, first_id)
+        update_rollups(conn, rows)
+        record_file_rows(conn, rows, first_id)
+    return len(encoded)
+
+
+def store_rows(conn, rows, chunk_size=CHUNK_SIZE, progress=True):
+    """Insert row dicts with insert_rows(), committing every ``chunk_size`` rows.
+
+    Returns ``(total, elapsed_seconds)``.
+    """
+    started = time.perf_counter()
+    total = 0
+
+    for chunk in iter(lambda: list(islice(rows, chunk_size)), []):
+        with conn.begin():
+            total += insert_rows(conn, chunk)
+        if progress:
+            elapsed = time.perf_counter() - started
+            print(f"stored {total} rows ({total / elapsed:,.0f} rows/sec)")
+
+    return total, time.perf_counter() - started
+
+
+@contextmanager
+def bulk_load(engine):
+    """Yield a connection tuned for a large load into ChatMessage.
+
+    Secondary indexes and the FTS sync triggers are dropped and the
+    connection runs with WAL, ``synchronous=OFF`` and a large page cache. On
+    exit, also when the load fails, the indexes are rebuilt, the new rows
+    are added to the FTS index and the previous settings restored. A load
+    killed outside Python is repaired by the next init_db(): indexes are
+    recreated and the FTS index catches up from the ``fts_pending_after``
+    IngestState row.
+    """
+    with engine.connect() as conn:
+        journal_mode = conn.exec_driver_sql("PRAGMA journal_mode").scalar()
+        synchronous = conn.exec_driver_sql("PRAGMA synchronous").scalar()
+        cache_size = conn.exec_driver_sql("PRAGMA cache_size").scalar()
+        conn.commit()
+
+        conn.exec_driver_sql("PRAGMA journal_mode=WAL")
+        conn.exec_driver_sql("PRAGMA synchronous=OFF")
+        conn.exec_driver_sql(f"PRAGMA cache_size=-{BULK_CACHE_KIB}")
+        for index in ChatMessage.__table__.indexes:
+            conn.execute(DropIndex(index, if_exists=True))
+        if search_pending_after(conn) is None:
+            last_id = conn.exec_driver_sql("SELECT max(id) FROM chatmessage").scalar()
+            conn.execute(
+                insert(IngestState).values(key="fts_pending_after", value=last_id or 0)
+            )
+        drop_search_triggers(conn)
+        conn.commit()
+
+        try:
+            yield conn
+        finally:
+            conn.rollback()
+            started = time.perf_counter()
+            with conn.begin():
+                create_indexes(conn)
+                catch_up_search_index(conn)
+                create_search_triggers(conn)
+            print(f"rebuilt indexes in {time.perf_counter() - started:.2f}s")
+
+            conn.exec_driver_sql(f"PRAGMA synchronous={synchronous}")
+            conn.exec_driver_sql(f"PRAGMA cache_size={cache_size}")
+            conn.exec_driver_sql(f"PRAGMA journal_mode={journal_mode}")
+            conn.commit()
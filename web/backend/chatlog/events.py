@@ -0,0 +1,159 @@
+from sqlalchemy import func, insert, select
+
+from chatlog.models import ChatEvent, ChatMessage, ChatUser, MessageType
+from chatlog.names import names
+from chatlog.parser import classify, extract_details
+from chatlog.patterns import detail_groups, single_gift_patterns
+from chatlog.queries import name_id
+
+
+# ChatEvent columns that take their ParsedEvent.details value as is
+DETAIL_FIELDS = [
+    "tier",
+    "months",
+    "streak",
+    "duration_months",
+    "gift_count",
+    "gift_total",
+    "raiders",
+    "timeout_seconds",
+]
+
+# ChatMessage rows read per query by rebuild_events()
+REBUILD_BATCH = 10_000
+
+
+def event_rows(conn, events):
+    """ChatEvent insert dicts for ``(message_id, details, message)`` triples.
+
+    ``message`` has the ChatMessage columns by name; recipients are interned
+    into the user lookup table.
+    """
+    users = names(conn).users.intern(
+        conn, (details["recipient"] for _, details, _ in events if "recipient" in details)
+    )
+    return [
+        {
+            "message_id": message_id,
+            "channel_id": message["channel_id"],
+            "user_id": message["user_id"],
+            "message_type_id": message["message_type_id"],
+            "timestamp": message["timestamp"],
+            **{field: details.get(field) for field in DETAIL_FIELDS},
+            "recipient_id": users[details["recipient"]] if "recipient" in details else None,
+        }
+        for message_id, details, message in events
+    ]
+
+
+def insert_events(conn, rows, encoded, first_id):
+    """Insert the ChatEvent rows of ChatMessage rows just inserted with ids from first_id.
+
+    ``rows`` are the row dicts, with ``details`` from parse_lines(), and
+    ``encoded`` their insert dicts. Call in the transaction that inserts
+    the messages.
+    """
+    events = [
+        (first_id + i, row["details"], message)
+        for i, (row, message) in enumerate(zip(rows, encoded))
+        if row.get("details") is not None
+    ]
+    if events:
+        conn.execute(insert(ChatEvent), event_rows(conn, events))
+
+
+def detail_type_ids(conn):
+    """MessageType id -> name of the types that have a ChatEvent row."""
+    return dict(
+        conn.execute(
+            select(MessageType.id, MessageType.name).where(
+                MessageType.name.in_(detail_groups)
+            )
+        ).all()
+    )
+
+
+def rebuild_events(conn):
+    """Recreate ChatEvent from the text of ChatMessage rows, e.g. for a database that predates it.
+
+    Messages keep the text after the time, which classify() matches again
+    with a placeholder time in front. Events of archived messages are kept
+    as they are; for ones archived before ChatEvent existed there is no
+    text left to read.
+    """
+    conn.exec_driver_sql(
+        "DELETE FROM chatevent WHERE message_id IN (SELECT id FROM chatmessage)"
+    )
+    types = detail_type_ids(conn)
+    m = ChatMessage.__table__.c
+    last_id = 0
+    while True:
+        batch = conn.execute(
+            select(
+                m.id,
+                m.channel_id,
+                m.user_id,
+                m.message_type_id,
+                m.timestamp,
+                m.message_text,
+            )
+            .where(m.message_type_id.in_(list(types)), m.id > last_id)
+            .order_by(m.id)
+            .limit(REBUILD_BATCH)
+        ).all()
+        if not batch:
+            return
+
+        events = []
+        for row in batch:
+            pattern_name, groups = classify(f"[00:00:00] {row.message_text}")
+            if pattern_name == types[row.message_type_id]:
+                details = extract_details(pattern_name, groups)
+                events.append((row.id, details, row._mapping))
+        if events:
+            conn.execute(insert(ChatEvent), event_rows(conn, events))
+        last_id = batch[-1].id
+
+
+def events_missing(conn):
+    """True when ChatEvent is empty but ChatMessage has messages that belong in it."""
+    if conn.exec_driver_sql("SELECT 1 FROM chatevent LIMIT 1").scalar() is not None:
+        return False
+    types = detail_type_ids(conn)
+    return (
+        conn.execute(
+            select(ChatMessage.id).where(ChatMessage.message_type_id.in_(list(types))).limit(1)
+        ).scalar()
+        is not None
+    )
+
+
+def top_gifters_query(channel_name=None, start_datetime=None, end_datetime=None):
+    """Select (username, gifts) by subs gifted, most first.
+
+    Every gifted sub has its own gift_individual or gift_first line, also
+    when it is part of a community gift, so those lines are counted and the
+    announcements are not. Anonymous gifts have no user and are left out.
+    """
+    event = ChatEvent
+    conditions = [
+        event.message_type_id.in_(
+            select(MessageType.id).where(MessageType.name.in_(single_gift_patterns))
+        )
+    ]
+    if channel_name is not None:
+        conditions.append(event.channel_id == name_id("channel_name", channel_name))
+    if start_datetime is not None:
+        conditions.append(event.timestamp >= start_datetime)
+    if end_datetime is not None:
+        conditions.append(event.timestamp <= end_datetime)
+
+    gifts = func.count().label("gifts")
+    return (
+        select(ChatUser.name, gifts)
+        .select_from(event)
+        .join(ChatUser, ChatUser.id == event.user_id)
+        .where(*conditions)
+        .group_by(event.user_id)
+        .order_by(gifts.desc(), ChatUser.name)
+    )
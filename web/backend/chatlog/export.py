@@ -0,0 +1,133 @@
+import csv
+import io
+from datetime import datetime
+from typing import Literal
+
+import orjson
+
+
+ExportFormat = Literal["ndjson", "csv", "parquet"]
+
+# media type and file extension of each export format
+export_types = {
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "csv": ("text/csv; charset=utf-8", "csv"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+
+
+class NdjsonEncoder:
+    def __init__(self, fields):
+        self.fields = fields
+
+    def encode(self, rows):
+        return b"".join(
+            orjson.dumps(dict(zip(self.fields, row)), option=orjson.OPT_UTC_Z) + b"\n"
+            for row in rows
+        )
+
+    def close(self):
+        return b""
+
+
+class CsvEncoder:
+    def __init__(self, fields):
+        self.buffer = io.StringIO()
+        self.writer = csv.writer(self.buffer)
+        self.writer.writerow(fields)
+
+    def encode(self, rows):
+        self.writer.writerows(
+            [
+                value.isoformat() if isinstance(value, datetime) else value
+                for value in row
+            ]
+            for row in rows
+        )
+        data = self.buffer.getvalue().encode()
+        self.buffer.seek(0)
+        self.buffer.truncate()
+        return data
+
+    def close(self):
+        return self.encode([])
+
+
+class ChunkSink(io.RawIOBase):
+    """Write-only file that hands back what was written since the last take()."""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def take(self):
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+class ParquetEncoder:
+    """One Parquet row group per batch, written out as soon as it is encoded."""
+
+    def __init__(self, schema):
+        import pyarrow.parquet as pq
+
+        self.schema = schema
+        self.sink = ChunkSink()
+        self.writer = pq.ParquetWriter(self.sink, schema, compression="zstd")
+
+    def encode(self, rows):
+        import pyarrow as pa
+
+        if rows:
+            arrays = [
+                pa.array(column, field.type)
+                for column, field in zip(zip(*rows), self.schema)
+            ]
+            self.writer.write_table(pa.Table.from_arrays(arrays, schema=self.schema))
+        return self.sink.take()
+
+    def close(self):
+        self.writer.close()
+        return self.sink.take()
+
+
+def arrow_schema(fields):
+    """ChatMessage fields as an Arrow schema, timestamps in UTC microseconds."""
+    import pyarrow as pa
+
+    timestamp = pa.timestamp("us", tz="UTC")
+    types = {
+        "created_at": timestamp,
+        "timestamp": timestamp,
+        "channel_name": pa.string(),
+        "username": pa.string(),
+        "message_text": pa.string(),
+        "message_type": pa.string(),
+        "id": pa.int64(),
+    }
+    return pa.schema([(name, types[name]) for name in fields])
+
+
+def export_encoder(format, fields):
+    """Return an encoder with ``encode(rows) -> bytes`` and ``close() -> bytes``.
+
+    ``fields`` are the ChatMessage field names, in the order rows hold them.
+    Parquet needs pyarrow, which is imported only when it is asked for.
+    """
+    if format == "ndjson":
+        return NdjsonEncoder(fields)
+    if format == "csv":
+        return CsvEncoder(fields)
+    return ParquetEncoder(arrow_schema(fields))
@@ -0,0 +1,250 @@
+import time
+from pathlib import Path
+
+from chatlog.db import CHUNK_SIZE, forget_file, insert_rows
+from chatlog.logfiles import (
+    channel_of,
+    clock_at,
+    decode_lines,
+    find_headers,
+    last_line_end,
+    stream_date_at,
+)
+from chatlog.manifest import load_manifest, manifest_entry, record_files, resume_offset
+from chatlog.metrics import add_timings, new_stage_timings, record_ingest
+from chatlog.parser import ONE_DAY, ROLLOVER_SECONDS, StreamClock, parse_lines
+from chatlog.patterns import new_pattern_counts
+
+
+# byte-range size large files are split into, aligned to line boundaries
+CHUNK_BYTES = 8 * 1024 * 1024
+
+
+def plan_chunks(path, start, end, channel_name=None, chunk_bytes=CHUNK_BYTES):
+    """Split bytes ``[start, end)`` of path into tasks for parse_chunk().
+
+    A task is ``(path, channel_name, start, end, clock)``; the channel
+    defaults to the name of the file's directory. The first task's
+    StreamClock is the one a serial read would have at ``start``; later ones
+    start at the date of the last header before them, and carry_clock()
+    moves their dates on if an earlier chunk went past midnight.
+    """
+    headers = find_headers(path)
+    channel_name = channel_name or channel_of(path)
+
+    tasks = []
+    for chunk_start in range(start, end, chunk_bytes):
+        if chunk_start == start:
+            clock = clock_at(path, start, headers)
+        else:
+            clock = StreamClock(stream_date_at(headers, chunk_start))
+        chunk_end = min(chunk_start + chunk_bytes, end)
+        tasks.append((path, channel_name, chunk_start, chunk_end, clock))
+    return tasks
+
+
+def plan_ingest(conn, paths, channel_name=None, chunk_bytes=CHUNK_BYTES):
+    """Plan the chunks of paths whose lines are not stored yet, from the LogFile manifest.
+
+    Unchanged files are skipped and grown ones only have their appended
+    tail planned; a file that shrank or was rewritten is planned from the
+    start. Files are read up to their last complete line, a line still being
+    written is left for the next run. Returns ``(tasks, stats, skipped)``:
+    the tasks, the stat of every planned file, to record in the manifest
+    once its lines are stored, and the number of files with nothing new.
+    """
+    manifest = load_manifest(conn)
+    tasks = []
+    stats = {}
+    skipped = 0
+
+    for path in paths:
+        # manifest paths are absolute, whatever directory the run started in
+        path = Path(path).resolve()
+        stat = path.stat()
+        entry = manifest.get(str(path))
+        start = resume_offset(path, entry, stat)
+        end = last_line_end(path, stat.st_size)
+        if start >= end:
+            skipped += 1
+            continue
+        if entry is not None and start == 0:
+            print(f"{path} shrank or was rewritten, replacing its rows from the start")
+        tasks += plan_chunks(path, start, end, channel_name, chunk_bytes)
+        stats[path] = stat
+    return tasks, stats, skipped
+
+
+def read_chunk(path, start, end):
+    """Return the bytes of the lines that start within ``[start, end)``."""
+    with open(path, "rb") as f:
+        if start:
+            f.seek(start - 1)
+            f.readline()
+        pos = f.tell()
+        if pos >= end:
+            return b""
+        data = f.read(end - pos)
+        if not data.endswith(b"\n"):
+            data += f.readline()
+    return data
+
+
+def parse_chunk(task):
+    """Worker: parse one byte range into compact row tuples, pattern counts and stage timings.
+
+    Also returns what carry_clock() needs: the number of rows before the
+    chunk's first header, the seconds past midnight of the first of them,
+    and the StreamClock at the end of the chunk.
+    """
+    path, channel_name, start, end, clock = task
+    clock = clock.copy()
+    counts = new_pattern_counts()
+    timings = new_stage_timings()
+    started = time.perf_counter()
+    data = read_chunk(path, start, end)
+    timings["read"] = [time.perf_counter() - started, data.count(b"\n")]
+    # decode the way open(path, "r") does, so lines split exactly as in a serial read
+    lines = decode_lines(data)
+
+    rows = []
+    lead = 0
+    first = None
+    for event in parse_lines(lines, counts=counts, clock=clock, timings=timings):
+        if event.type is None:
+            continue
+        rows.append(
+            (
+                event.time,
+                event.usernames[0] if event.usernames else None,
+                event.text,
+                event.type,
+                event.details,
+            )
+        )
+        if not clock.restarted:
+            if not lead:
+                first = clock.last
+            lead += 1
+    clock.cache = {}
+    return channel_name, rows, counts, timings, (lead, first, clock)
+
+
+def carry_clock(task, result, previous):
+    """Move on the dates of a chunk whose earlier chunks went past midnight.
+
+    parse_chunk() dates the lines before a chunk's first header from that
+    header, not knowing about the midnights passed in the chunks before it.
+    ``previous`` is the StreamClock the chunk before ended with; the rows and
+    the end clock in ``result`` are corrected in place.
+    """
+    assumed = task[4].day
+    _, rows, _, _, (lead, first, clock) = result
+    if assumed is None or previous.day is None:
+        return
+
+    day = previous.day
+    if first is not None and previous.last is not None:
+        if first < previous.last - ROLLOVER_SECONDS:
+            day += ONE_DAY
+    shift = day - assumed
+    if shift:
+        for i in range(lead):
+            rows[i] = (rows[i][0] + shift, *rows[i][1:])
+    if not clock.restarted:
+        clock.day += shift
+        if clock.last is None:
+            clock.last = previous.last
+
+
+def store_chunks(
+    conn,
+    tasks,
+    batches,
+    stats,
+    created_at,
+    counts,
+    chunk_size=CHUNK_SIZE,
+    progress=True,
+    timings=None,
+):
+    """Store parse_chunk() results, given in task order, with the manifest entries.
+
+    Rows are committed once at least ``chunk_size`` are pending, in the
+    same transaction as the manifest offset after the last task they came
+    from, so an interrupted run resumes right after what it committed, and
+    as their pattern counts and stage timings, added to the IngestMetric
+    totals. Pattern counts are also added to counts, and stage timings to
+    ``timings`` if given. A file stored from the start has the rows of its
+    earlier contents deleted in the transaction that stores its first rows,
+    see chatlog.db.forget_file. Returns ``(total, elapsed_seconds)``.
+    """
+    started = time.perf_counter()
+    total = 0
+    rows = []
+    entries = {}
+    pending_counts = new_pattern_counts()
+    pending_timings = new_stage_timings()
+    # (end offset, StreamClock) of the last chunk of each file
+    clocks = {}
+    # files stored from the start since the last commit
+    restarted = set()
+
+    def commit():
+        nonlocal total, pending_counts, pending_timings
+        with conn.begin():
+            for path in restarted:
+                forget_file(conn, path)
+            inserting = time.perf_counter()
+            for i in range(0, len(rows), chunk_size):
+                total += insert_rows(conn, rows[i : i + chunk_size])
+            record_files(conn, list(entries.values()))
+            insert_timing = pending_timings["insert"]
+            insert_timing[0] += time.perf_counter() - inserting
+            insert_timing[1] += len(rows)
+            record_ingest(conn, pending_counts, pending_timings)
+        if timings is not None:
+            add_timings(timings, pending_timings)
+        rows.clear()
+        entries.clear()
+        restarted.clear()
+        pending_counts = new_pattern_counts()
+        pending_timings = new_stage_timings()
+        if progress:
+            elapsed = time.perf_counter() - started
+            print(f"stored {total} rows ({total / elapsed:,.0f} rows/sec)")
+
+    for task, result in zip(tasks, batches):
+        path, _, start, end, _ = task
+        channel_name, batch, batch_counts, batch_timings, (_, _, clock) = result
+        previous_end, previous = clocks.get(path, (None, None))
+        if previous_end == start:
+            carry_clock(task, result, previous)
+        clocks[path] = (end, clock)
+        if start == 0:
+            restarted.add(path)
+
+        for key, value in batch_counts.items():
+            counts[key] += value
+            pending_counts[key] += value
+        add_timings(pending_timings, batch_timings)
+        for timestamp, username, message_text, message_type, details in batch:
+            rows.append(
+                {
+                    "created_at": created_at,
+                    "timestamp": timestamp,
+                    "channel_name": channel_name,
+                    "username": username,
+                    "message_text": message_text,
+                    "message_type": message_type,
+                    "details": details,
+                    "log_file": str(path),
+                }
+            )
+        entries[path] = manifest_entry(path, stats[path], end)
+        if len(rows) >= chunk_size:
+            commit()
+    if entries:
+        commit()
+
+    return total, time.perf_counter() - started
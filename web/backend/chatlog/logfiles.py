@@ -0,0 +1,105 @@
+import io
+import mmap
+import os
+import re
+from pathlib import Path
+
+from chatlog.parser import StreamClock, read_stream_date
+
+
+# Chatterino's default log directory on macOS: Channels/<channel>/<channel>-<date>.log
+channels_directory = (
+    Path.home() / "Library/Application Support/chatterino/Logs/Twitch/Channels"
+)
+
+HEADER = b"# Start logging at "
+
+TIME_OF_DAY = re.compile(rb"^\[(\d\d):(\d\d):(\d\d)\]", re.MULTILINE)
+
+
+def find_log_files(root):
+    """Return ``Channels/<channel>/*.log`` files under root, or root itself if it is a file."""
+    if root.is_file():
+        return [root]
+    if any(root.glob("*.log")):
+        return sorted(root.glob("*.log"))
+    return sorted(root.glob("*/*.log"))
+
+
+def channel_of(path):
+    return Path(path).parent.name
+
+
+def header_dates(data):
+    """Return ``(offset, stream_date)`` for every ``# Start logging at`` header in data."""
+    headers = []
+    offset = data.find(HEADER)
+    while offset != -1:
+        if offset == 0 or data[offset - 1] == ord("\n"):
+            end = data.find(b"\n", offset)
+            line = data[offset : end if end != -1 else len(data)]
+            headers.append((offset, read_stream_date(line.decode("utf-8"))))
+        offset = data.find(HEADER, offset + 1)
+    return headers
+
+
+def find_headers(path):
+    """Return ``(offset, stream_date)`` for every header in the file at path."""
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return []
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            return header_dates(data)
+
+
+def stream_date_at(headers, offset):
+    """Return the date of the last header before offset, or None."""
+    stream_date = None
+    for header_offset, date in headers:
+        if header_offset >= offset:
+            break
+        stream_date = date
+    return stream_date
+
+
+def clock_at(path, offset, headers=None):
+    """The StreamClock as parse_lines() leaves it after the lines before offset.
+
+    Only the ``[HH:MM:SS]`` prefixes of the lines between the last header
+    before offset and offset are scanned, to find the midnights passed.
+    """
+    headers = find_headers(path) if headers is None else headers
+    start, stream_date = 0, None
+    for header_offset, date in headers:
+        if header_offset >= offset:
+            break
+        start, stream_date = header_offset, date
+
+    clock = StreamClock(stream_date)
+    if stream_date is None:
+        return clock
+    with open(path, "rb") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            for match in TIME_OF_DAY.finditer(data, start, offset):
+                hours, minutes, seconds = match.groups()
+                clock.advance(int(hours) * 3600 + int(minutes) * 60 + int(seconds))
+    return clock
+
+
+def last_line_end(path, size):
+    """Offset just past the last newline in the first ``size`` bytes of path, or 0."""
+    with open(path, "rb") as f:
+        end = size
+        while end > 0:
+            start = max(0, end - 64 * 1024)
+            f.seek(start)
+            newline = f.read(end - start).rfind(b"\n")
+            if newline != -1:
+                return start + newline + 1
+            end = start
+    return 0
+
+
+def decode_lines(data):
+    """Iterate the lines of raw log bytes the way ``open(path, "r")`` would."""
+    return io.TextIOWrapper(io.BytesIO(data), encoding="utf-8")
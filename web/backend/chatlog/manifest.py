@@ -0,0 +1,79 @@
+import hashlib
+import os
+
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert
+
+from chatlog.models import LogFile
+
+
+# bytes at the start and at the end of a file's stored part that content_hash covers
+HASH_BYTES = 64 * 1024
+
+
+def content_hash(path, offset):
+    """Digest of the first and the last HASH_BYTES of path's first ``offset`` bytes.
+
+    Logs are only ever appended to, so a file rewritten in place differs in
+    its ``# Start logging`` header or in the lines stored last; checking
+    those ends avoids reading all of a large file whenever it grows.
+    """
+    digest = hashlib.blake2b(str(offset).encode(), digest_size=16)
+    with open(path, "rb") as f:
+        digest.update(f.read(min(offset, HASH_BYTES)))
+        if offset > HASH_BYTES:
+            f.seek(max(HASH_BYTES, offset - HASH_BYTES))
+            digest.update(f.read(offset - f.tell()))
+    return digest.hexdigest()
+
+
+def load_manifest(conn):
+    """LogFile entries by path."""
+    return {entry.path: entry for entry in conn.execute(select(LogFile)).all()}
+
+
+def resume_offset(path, entry, stat=None):
+    """Byte offset to continue storing path's lines from, given its LogFile entry.
+
+    A file with the size and mtime it had is trusted without reading it.
+    Otherwise it resumes at ``entry.offset`` if it still holds the bytes
+    stored from it, and starts over at 0 if it shrank or was rewritten.
+    """
+    if entry is None:
+        return 0
+    stat = stat or os.stat(path)
+    if stat.st_size == entry.size and stat.st_mtime_ns == entry.mtime_ns:
+        return entry.offset
+    if stat.st_size < entry.offset:
+        return 0
+    if entry.content_hash is None:
+        return entry.offset
+    if content_hash(path, entry.offset) != entry.content_hash:
+        return 0
+    return entry.offset
+
+
+def manifest_entry(path, stat, offset):
+    """LogFile values for path, stored up to offset while it had ``stat``."""
+    return {
+        "path": str(path),
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "content_hash": content_hash(path, offset),
+        "offset": offset,
+    }
+
+
+def record_files(conn, entries):
+    """Upsert manifest_entry() dicts; call in the transaction storing their lines."""
+    if not entries:
+        return
+    stmt = insert(LogFile)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[LogFile.path],
+        set_={
+            name: stmt.excluded[name]
+            for name in ["size", "mtime_ns", "content_hash", "offset"]
+        },
+    )
+    conn.execute(stmt, entries)
@@ -0,0 +1,240 @@
+from datetime import date, datetime
+
+from sqlalchemy import Index
+from sqlmodel import Field, SQLModel
+
+
+class ChatMessageBase(SQLModel):
+    created_at: datetime
+    timestamp: datetime
+    channel_name: str
+    username: str | None = None
+    message_text: str
+    message_type: str
+
+
+class Channel(SQLModel, table=True):
+    id: int | None = Field(default=None, primary_key=True)
+    name: str = Field(unique=True)
+
+
+class ChatUser(SQLModel, table=True):
+    """Usernames; messages without a user point at the row named ``""``.
+
+    The empty name sorts first like NULL did, and keeps ChatMessage.user_id
+    NOT NULL so ordering by username can walk this table's name index.
+    """
+
+    id: int | None = Field(default=None, primary_key=True)
+    name: str = Field(unique=True)
+
+
+class MessageType(SQLModel, table=True):
+    id: int | None = Field(default=None, primary_key=True)
+    name: str = Field(unique=True)
+
+
+class ChatMessage(SQLModel, table=True):
+    # Channel, user and message type are stored as ids into the lookup
+    # tables above, see chatlog.names for the cache that maps them to names.
+    #
+    # Filters are equality on channel/user/type plus a timestamp range, and
+    # rows sort by (column, timestamp, id), so every index ends in timestamp
+    # (and the implicit rowid) to return rows in order without a sort step.
+    __table_args__ = (
+        Index("ix_chatmessage_channel_id_timestamp", "channel_id", "timestamp"),
+        Index("ix_chatmessage_user_id_timestamp", "user_id", "timestamp"),
+        Index("ix_chatmessage_message_type_id_timestamp", "message_type_id", "timestamp"),
+        Index(
+            "ix_chatmessage_channel_id_user_id_timestamp",
+            "channel_id",
+            "user_id",
+            "timestamp",
+        ),
+        Index(
+            "ix_chatmessage_channel_id_message_type_id_timestamp",
+            "channel_id",
+            "message_type_id",
+            "timestamp",
+        ),
+    )
+
+    # INTEGER PRIMARY KEY aliases the SQLite rowid, so rows are appended in
+    # insert order instead of being scattered by a random uuid
+    id: int | None = Field(default=None, primary_key=True)
+    created_at: datetime = Field(index=True)
+    timestamp: datetime = Field(index=True)
+    channel_id: int = Field(foreign_key="channel.id")
+    user_id: int = Field(foreign_key="chatuser.id")
+    message_text: str
+    message_type_id: int = Field(foreign_key="messagetype.id")
+
+
+class ChatEvent(SQLModel, table=True):
+    """Fields of a sub, gift, raid or timeout message, see patterns.detail_groups.
+
+    One row per such ChatMessage, keyed by its id. The message's channel,
+    user, type and timestamp are copied in, so aggregates over events read
+    this table and its indexes alone; like the rollups, rows stay when their
+    message is archived. ``tier`` is None for Prime subs, ``months`` is the
+    cumulative count and ``duration_months`` the length of a sub bought in
+    advance or gifted for several months.
+    """
+
+    __table_args__ = (
+        Index("ix_chatevent_message_type_id_timestamp", "message_type_id", "timestamp"),
+        Index(
+            "ix_chatevent_channel_id_message_type_id_timestamp",
+            "channel_id",
+            "message_type_id",
+            "timestamp",
+        ),
+        Index("ix_chatevent_user_id_timestamp", "user_id", "timestamp"),
+    )
+
+    message_id: int = Field(primary_key=True)
+    channel_id: int = Field(foreign_key="channel.id")
+    user_id: int = Field(foreign_key="chatuser.id")
+    message_type_id: int = Field(foreign_key="messagetype.id")
+    timestamp: datetime
+    tier: int | None = None
+    months: int | None = None
+    streak: int | None = None
+    duration_months: int | None = None
+    gift_count: int | None = None
+    gift_total: int | None = None
+    recipient_id: int | None = Field(default=None, foreign_key="chatuser.id", index=True)
+    raiders: int | None = None
+    timeout_seconds: int | None = None
+
+
+class ChatMessageRead(ChatMessageBase):
+    """A ChatMessage as the API returns it, with names instead of ids."""
+
+    id: int
+
+
+class ChatSearchResult(ChatMessageBase):
+    id: int
+    snippet: str
+    rank: float
+
+
+class IngestState(SQLModel, table=True):
+    """Bookkeeping that has to survive a crashed load, keyed by name."""
+
+    key: str = Field(primary_key=True)
+    value: int
+
+
+class IngestMetric(SQLModel, table=True):
+    """Running totals of the loaders and the tailer, see chatlog.metrics.
+
+    Ingest runs in other processes than the API, so its counters are kept
+    here for GET /metrics to read. ``label`` is the pattern or stage that
+    ``name`` is counted for.
+    """
+
+    name: str = Field(primary_key=True)
+    label: str = Field(primary_key=True)
+    value: float
+
+
+class LogFile(SQLModel, table=True):
+    """What a log file looked like when its lines were last stored in ChatMessage.
+
+    ``offset`` is the byte offset up to which lines are stored, always at a
+    line boundary. ``size`` and ``mtime_ns`` are the file's stat at that
+    point and ``content_hash`` a digest of the stored bytes, see
+    chatlog.manifest; it is None for entries from before it was recorded.
+    """
+
+    path: str = Field(primary_key=True)
+    size: int
+    mtime_ns: int
+    content_hash: str | None = None
+    offset: int
+
+
+class LogFileRows(SQLModel, table=True):
+    """A run of consecutive ChatMessage ids stored from one log file.
+
+    A file that is rewritten is stored again from the start; these runs
+    find the rows stored from its earlier contents, see chatlog.db.forget_file.
+    """
+
+    path: str = Field(primary_key=True)
+    first_id: int = Field(primary_key=True)
+    last_id: int
+
+
+class MessageCountRollup(SQLModel, table=True):
+    """ChatMessage counts per channel, message_type and time bucket.
+
+    ``bucket`` is the bucket's start in Unix seconds and ``resolution`` its
+    length in seconds, one set of rows per entry in rollups.RESOLUTIONS.
+    """
+
+    __table_args__ = (
+        Index("ix_messagecountrollup_resolution_bucket", "resolution", "bucket"),
+    )
+
+    channel_name: str = Field(primary_key=True)
+    resolution: int = Field(primary_key=True)
+    bucket: int = Field(primary_key=True)
+    message_type: str = Field(primary_key=True)
+    count: int
+
+
+class ChatterCountRollup(SQLModel, table=True):
+    """Chat messages per channel, username and UTC day (Unix seconds)."""
+
+    __table_args__ = (Index("ix_chattercountrollup_day", "day"),)
+
+    channel_name: str = Field(primary_key=True)
+    day: int = Field(primary_key=True)
+    username: str = Field(primary_key=True)
+    count: int
+
+
+class MessageCountBucket(SQLModel):
+    channel_name: str
+    bucket: datetime
+    message_type: str
+    count: int
+
+
+class ChatterCount(SQLModel):
+    username: str
+    count: int
+
+
+class GifterCount(SQLModel):
+    username: str
+    gifts: int
+
+
+class EventTotals(SQLModel):
+    channel_name: str
+    subs: int = 0
+    gifts: int = 0
+    raids: int = 0
+    timeouts: int = 0
+    bans: int = 0
+
+
+class ArchiveFile(SQLModel, table=True):
+    """A Parquet file of archived ChatMessage rows for one channel and UTC day.
+
+    ``path`` is relative to the archive directory. The timestamp and id
+    ranges let queries skip files without opening them.
+    """
+
+    path: str = Field(primary_key=True)
+    channel_name: str = Field(index=True)
+    day: date
+    min_timestamp: datetime
+    max_timestamp: datetime
+    min_id: int
+    max_id: int
+    rows: int
@@ -0,0 +1,164 @@
+from collections import namedtuple
+
+from sqlalchemy import event, select
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.engine import Engine
+
+from chatlog.models import Channel, ChatMessage, ChatMessageRead, ChatUser, MessageType
+
+
+# ChatUser name of messages without a user
+NO_USER = ""
+
+# API fields in model order, and the ChatMessage columns holding them, with
+# ids where the fields have names; decode() turns the one into the other
+chat_fields = list(ChatMessageRead.model_fields)
+ChatRow = namedtuple("ChatRow", chat_fields)
+chat_columns = [
+    ChatMessage.__table__.c[name]
+    for name in [
+        "created_at",
+        "timestamp",
+        "channel_id",
+        "user_id",
+        "message_text",
+        "message_type_id",
+        "id",
+    ]
+]
+
+# chatmessage with names in place of ids, for SQL that aggregates by name
+NAMED_MESSAGES = (
+    "(SELECT m.id, m.created_at, m.timestamp, c.name AS channel_name, "
+    "nullif(u.name, '') AS username, m.message_text, t.name AS message_type "
+    "FROM chatmessage m "
+    "JOIN channel c ON c.id = m.channel_id "
+    "JOIN chatuser u ON u.id = m.user_id "
+    "JOIN messagetype t ON t.id = m.message_type_id)"
+)
+
+
+class Lookup:
+    """Both directions of one lookup table, loaded as names come up.
+
+    Ids only grow, so rows this cache has not seen, e.g. ones another
+    process added, are the ones with an id past the largest it knows.
+    """
+
+    def __init__(self, model):
+        self.table = model.__table__
+        self.ids = {}
+        self.names = {}
+        # names inserted by the open transaction, forgotten if it rolls back
+        self.pending = []
+
+    def refresh(self, conn):
+        c = self.table.c
+        last = max(self.names, default=0)
+        for row_id, name in conn.execute(select(c.id, c.name).where(c.id > last)):
+            self.ids[name] = row_id
+            self.names[row_id] = name
+
+    def intern(self, conn, names):
+        """Return the name -> id dict, adding rows for the names not in it yet."""
+        missing = [name for name in set(names) if name not in self.ids]
+        if missing:
+            self.refresh(conn)
+            missing = [name for name in missing if name not in self.ids]
+        if missing:
+            conn.execute(
+                insert(self.table).on_conflict_do_nothing(),
+                [{"name": name} for name in missing],
+            )
+            self.refresh(conn)
+            self.pending += missing
+        return self.ids
+
+    def rollback(self):
+        for name in self.pending:
+            row_id = self.ids.pop(name, None)
+            self.names.pop(row_id, None)
+        self.pending = []
+
+
+class Names:
+    """Interning cache for the channel, user and message type lookup tables."""
+
+    def __init__(self):
+        self.channels = Lookup(Channel)
+        self.users = Lookup(ChatUser)
+        self.message_types = Lookup(MessageType)
+        self.lookups = [self.channels, self.users, self.message_types]
+
+    def encode(self, conn, rows):
+        """ChatMessage insert dicts for row dicts with channel/user/type names."""
+        channels = self.channels.intern(conn, (row["channel_name"] for row in rows))
+        users = self.users.intern(conn, (row["username"] or NO_USER for row in rows))
+        message_types = self.message_types.intern(
+            conn, (row["message_type"] for row in rows)
+        )
+        return [
+            {
+                "created_at": row["created_at"],
+                "timestamp": row["timestamp"],
+                "channel_id": channels[row["channel_name"]],
+                "user_id": users[row["username"] or NO_USER],
+                "message_text": row["message_text"],
+                "message_type_id": message_types[row["message_type"]],
+            }
+            for row in rows
+        ]
+
+    def decode(self, conn, rows):
+        """ChatRows for rows of chat_columns (further columns are ignored)."""
+        try:
+            return self.named(rows)
+        except KeyError:
+            for lookup in self.lookups:
+                lookup.refresh(conn)
+            return self.named(rows)
+
+    def named(self, rows):
+        channels = self.channels.names
+        users = self.users.names
+        message_types = self.message_types.names
+        return [
+            ChatRow(
+                row[0],
+                row[1],
+                channels[row[2]],
+                users[row[3]] or None,
+                row[4],
+                message_types[row[5]],
+                row[6],
+            )
+            for row in rows
+        ]
+
+
+def names(conn):
+    """The Names cache of conn's database connection, created on first use.
+
+    The cache lives as long as the pooled connection, so it is never
+    shared between databases.
+    """
+    cache = conn.info.get("names")
+    if cache is None:
+        cache = conn.info["names"] = Names()
+    return cache
+
+
+@event.listens_for(Engine, "commit")
+def keep_interned_names(conn):
+    cache = conn.info.get("names")
+    if cache is not None:
+        for lookup in cache.lookups:
+            lookup.pending = []
+
+
+@event.listens_for(Engine, "rollback")
+def forget_interned_names(conn):
+    cache = conn.info.get("names")
+    if cache is not None:
+        for lookup in cache.lookups:
+            lookup.rollback()
@@ -0,0 +1,225 @@
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+
+from chatlog.patterns import detail_groups, dispatch, duration_units, username_indices
+
+
+# a line timed this much earlier than the one before it was logged after midnight
+ROLLOVER_SECONDS = 12 * 60 * 60
+
+ONE_DAY = timedelta(days=1)
+
+# parse_lines() times one line in this many when given timings, as timing
+# every line would slow it down by a seventh
+TIMING_SAMPLE = 16
+
+
+@dataclass(slots=True)
+class ParsedEvent:
+    type: str | None  # pattern name, None when no pattern matched
+    time: datetime | None
+    usernames: tuple[str, ...]
+    text: str
+    details: dict | None = None  # ChatEvent fields, see extract_details()
+
+
+def classify(message):
+    for keyword, group in dispatch:
+        if keyword is None or keyword in message:
+            for pattern_name, pattern in group:
+                match = pattern.match(message)
+                if match:
+                    return pattern_name, match.groups()
+    return None, None
+
+
+def extract_usernames(pattern_name, match_groups):
+    if pattern_name not in username_indices:
+        return []
+
+    indices = username_indices[pattern_name]
+    usernames = []
+
+    for idx in indices:
+        if idx < len(match_groups) and match_groups[idx]:
+            usernames.append(match_groups[idx])
+
+    return usernames
+
+
+def duration_seconds(text):
+    """Seconds in a timeout duration such as ``10m 0s``, None if it has another form."""
+    total = 0
+    for part in text.split():
+        unit = duration_units.get(part[-1])
+        if unit is None or not part[:-1].isdigit():
+            return None
+        total += int(part[:-1]) * unit
+    return total
+
+
+def extract_details(pattern_name, match_groups):
+    """ChatEvent fields from a match's groups, None for patterns without a ChatEvent."""
+    fields = detail_groups.get(pattern_name)
+    if fields is None:
+        return None
+
+    details = {}
+    for field, idx in fields.items():
+        value = match_groups[idx]
+        if value is None:
+            continue
+        if field == "recipient":
+            details[field] = value
+        elif field == "timeout_seconds":
+            details[field] = duration_seconds(value)
+        else:
+            details[field] = int(value)
+    return details
+
+
+def read_stream_date(header):
+    """Return the date from a ``# Start logging at <date> <time> ...`` header."""
+    return header.split("at ")[1].strip().split(" ")[0]
+
+
+def midnight(stream_date):
+    if stream_date is None:
+        return None
+    return datetime.fromisoformat(stream_date).replace(tzinfo=timezone.utc)
+
+
+class StreamClock:
+    """Datetimes for the ``HH:MM:SS`` times of a stream's log lines.
+
+    Lines only carry the time of day. The date comes from the last
+    ``# Start logging at`` header and moves forward a day whenever a time is
+    more than ROLLOVER_SECONDS earlier than the line before it, i.e. the
+    stream went past midnight. Instead of a strptime per line, times are
+    added as seconds to the day's midnight and cached per ``HH:MM:SS`` until
+    the date changes.
+    """
+
+    __slots__ = ("day", "last", "restarted", "cache")
+
+    def __init__(self, stream_date=None, last=None):
+        self.day = midnight(stream_date)
+        self.last = last  # seconds past midnight of the last line
+        self.restarted = False  # whether a header started a new stream since
+        self.cache = {}
+
+    def copy(self):
+        clock = StreamClock(last=self.last)
+        clock.day = self.day
+        return clock
+
+    def start(self, stream_date):
+        """Start the stream of a header line."""
+        self.day = midnight(stream_date)
+        self.last = None
+        self.restarted = True
+        self.cache = {}
+
+    def advance(self, seconds):
+        """Move on to a line ``seconds`` past midnight; True if midnight passed."""
+        rolled = self.last is not None and seconds < self.last - ROLLOVER_SECONDS
+        if rolled:
+            if self.day is not None:
+                self.day += ONE_DAY
+            self.cache = {}
+        self.last = seconds
+        return rolled
+
+    def __call__(self, time_of_day):
+        """The datetime of a line logged at ``HH:MM:SS``, None before any header."""
+        cached = self.cache.get(time_of_day)
+        if cached is not None:
+            seconds, timestamp = cached
+            if not self.advance(seconds):
+                return timestamp
+        else:
+            seconds = (
+                int(time_of_day[:2]) * 3600
+                + int(time_of_day[3:5]) * 60
+                + int(time_of_day[6:8])
+            )
+            self.advance(seconds)
+        if self.day is None:
+            return None
+        timestamp = self.day + timedelta(seconds=seconds)
+        self.cache[time_of_day] = (seconds, timestamp)
+        return timestamp
+
+
+def parse_lines(lines, stream_date=None, counts=None, clock=None, timings=None):
+    """Parse Chatterino log lines into ParsedEvents, one per message line.
+
+    Header lines (``# Start logging at ...``) set the date used for the
+    timestamps that follow; ``stream_date`` covers input that starts after the
+    header. Pass a StreamClock as ``clock`` instead to continue from where an
+    earlier call left off, midnight rollovers included; it is updated in
+    place. Unmatched lines are yielded with ``type=None`` and the raw line as
+    text. ``counts``, e.g. from new_pattern_counts(), is updated in place,
+    and so is ``timings``, e.g. from metrics.new_stage_timings(), with the
+    time spent in classify() and in dating matched lines, estimated from one
+    line in TIMING_SAMPLE.
+    """
+    if clock is None:
+        clock = StreamClock(stream_date)
+    if timings is not None:
+        perf_counter = time.perf_counter
+        classify_timing = timings["classify"]
+        timestamp_timing = timings["timestamp"]
+    countdown = 1
+
+    for line in lines:
+        message = line.strip()
+        if not message:
+            continue
+
+        if message.startswith("#"):
+            if "Start logging at" in message:
+                clock.start(read_stream_date(message))
+            continue
+
+        timed = False
+        if timings is not None:
+            countdown -= 1
+            if not countdown:
+                countdown = TIMING_SAMPLE
+                timed = True
+                started = perf_counter()
+        pattern_name, groups = classify(message)
+        if timed:
+            classified = perf_counter()
+            classify_timing[0] += (classified - started) * TIMING_SAMPLE
+            classify_timing[1] += TIMING_SAMPLE
+        if pattern_name is None:
+            if counts is not None:
+                counts["no_match"] += 1
+            yield ParsedEvent(None, None, (), message)
+            continue
+
+        if counts is not None:
+            counts[pattern_name] += 1
+
+        timestamp = clock(groups[0])
+        if timed:
+            timestamp_timing[0] += (perf_counter() - classified) * TIMING_SAMPLE
+            timestamp_timing[1] += TIMING_SAMPLE
+
+        if pattern_name == "chat_message":
+            text = groups[2]
+        elif pattern_name == "chat_message_foreign":
+            text = groups[2] + groups[3]
+        else:
+            text = message.split("] ")[1].strip()
+
+        yield ParsedEvent(
+            pattern_name,
+            timestamp,
+            tuple(extract_usernames(pattern_name, groups)),
+            text,
+            extract_details(pattern_name, groups),
+        )
@@ -0,0 +1,199 @@
+import re
+
+
+patterns = {
+    "stream_live": re.compile(r"^\[(\d{2}:\d{2}:\d{2})\]\s+(\w+)\s+is live!$"),
+    "sub_basic": re.compile(
+        r"^\[(\d{2}:\d{2}:\d{2})\]\s+(\w+)\s+subscribed at Tier (\d+)\.$"
+    ),
+    "sub_prime_basic": re.compile(
+        r"^\[(\d{2}:\d{2}:\d{2})\]\s+(\w+)\s+subscribed with Prime\.$"
+    ),
+    "sub_with_months": re.compile(
+        r"^\[(\d{2}:\d{2}:\d{2})\]\s+(\w+)\s+subscribed (?:at Tier (\d+)|with Prime)\.\s+They\'ve subscribed for (\d+) months?!$"
+    ),
+    "sub_with_streak": re.compile(
+        r"^\[(\d{2}:\d{2}:\d{2})\]\s+(\w+)\s+subscribed (?:at Tier (\d+)|with Prime)\.\s+They\'ve subscribed for (\d+) months?, currently on a (\d+) month streak!$"
+    ),
+    "sub_advance": re.compile(
+        r"^\[(\d{2}:\d{2}:\d{2})\]\s+(\w+)\s+subscribed at Tier (\d+) for (\d+) months? in advance(?:, reaching (\d+) months cumulatively so far)?!$"
+    ),
+    "gift_announcement": re.compile(
+        r"^\[(\d{2}:\d{2}:\d{2})\]\s+(\w+)\s+is gifting (\d+) Tier (\d+) Subs? to (\w+)\'s community!\s+They\'ve gifted a total of (\d+) in the channel!$"
+    ),
+    "gift_individual": re.compile(
+        r"^\[(\d{2}:\d{2}:\d{2})\]\s+(\w+)\s+gifted a Tier (\d+) sub to (\w+)!(?:\s+They have given (\d+) Gift Subs in the channel!)?$"
+    ),
+    "gift_first": re.compile(
+        r"^\[(\d{2}:\d{2}:\d{2})\]\s+(\w+)\s+gifted a Tier (\d+) sub to (\w+)!\s+This is their first Gift Sub in the channel!$"
+    ),
+    "anon_gift_announcement": re.compile(
+        r"^\[(\d{2}:\d{2}:\d{2})\]\s+AnAnonymousGifter is gifting (\d+) Tier (\d+) Subs? to (\w+)\'s community!$"
+    ),
+    "anon_gift_individual": re.compile(
+        r"^\[(\d{2}:\d{2}:\d{2})\]\s+An anonymous user gifted(?: (\d+) months? of)? a Tier (\d+) sub to (\w+)!$"
+    ),
+    "timeout": re.compile(
+        r"^\[(\d{2}:\d{2}:\d{2})\]\s+(\w+)\s+has been timed out for (.+)\.$"
+    ),
+    "permanent_ban": re.compile(
+        r"^\[(\d{2}:\d{2}:\d{2})\]\s+(\w+)\s+has been permanently banned\.$"
+    ),
+    "raid": re.compile(
+        r"^\[(\d{2}:\d{2}:\d{2})\]\s+(\d+) raiders? from (\w+) have joined!$"
+    ),
+    "room_mode_on": re.compile(
+        r"^\[(\d{2}:\d{2}:\d{2})\]\s+This room is now in (.+) mode\.$"
+    ),
+    "room_mode_off": re.compile(
+        r"^\[(\d{2}:\d{2}:\d{2})\]\s+This room is no longer in (.+) mode\.$"
+    ),
+    "announcement": re.compile(r"^\[(\d{2}:\d{2}:\d{2})\]\s+Announcement$"),
+    "chat_message": re.compile(r"^\[(\d{2}:\d{2}:\d{2})\]\s+(\w+):\s+(.+)$"),
+    "chat_message_foreign": re.compile(
+        r"^\[(\d{2}:\d{2}:\d{2})\]\s+([\w\u0080-\uFFFF]+)\s+(\w+):\s+(.+)$"
+    ),
+}
+
+
+def new_pattern_counts():
+    """Return a zeroed counter for every pattern plus ``no_match``."""
+    return {**dict.fromkeys(patterns, 0), "no_match": 0}
+
+
+# Username extraction mapping: pattern_name -> list of indices where usernames are
+username_indices = {
+    # Stream Events
+    "stream_live": [1],  # streamer name
+    "raid": [2],  # raider channel name
+    "announcement": [],  # no username
+    # Subscriptions (subscriber is always at index 1)
+    "sub_basic": [1],
+    "sub_prime_basic": [1],
+    "sub_with_months": [1],
+    "sub_with_streak": [1],
+    "sub_advance": [1],
+    # Gift Subs (gifter, recipient)
+    "gift_announcement": [1, 4],  # gifter, channel owner
+    "gift_individual": [1, 3],  # gifter, recipient
+    "gift_first": [1, 3],  # gifter, recipient
+    "anon_gift_announcement": [3],  # channel owner only (anonymous gifter)
+    "anon_gift_individual": [2],  # recipient only (anonymous gifter)
+    # Moderation
+    "timeout": [1],  # user who got timed out
+    "permanent_ban": [1],  # user who got banned
+    # Room modes
+    "room_mode_on": [],  # no username
+    "room_mode_off": [],  # no username
+    # Chat messages (adjust based on your actual chat patterns)
+    "chat_message": [1],  # assuming username at index 1
+    "chat_message_foreign": [1, 2],  # display name, username
+}
+
+
+# ChatEvent fields captured by each pattern, as field -> group index. Every
+# pattern listed gets a ChatEvent row, also when it captures no field, e.g.
+# a Prime sub, whose tier is None.
+detail_groups = {
+    "sub_basic": {"tier": 2},
+    "sub_prime_basic": {},
+    "sub_with_months": {"tier": 2, "months": 3},
+    "sub_with_streak": {"tier": 2, "months": 3, "streak": 4},
+    "sub_advance": {"tier": 2, "duration_months": 3, "months": 4},
+    "gift_announcement": {"gift_count": 2, "tier": 3, "gift_total": 5},
+    "gift_individual": {"tier": 2, "recipient": 3, "gift_total": 4},
+    "gift_first": {"tier": 2, "recipient": 3},
+    "anon_gift_announcement": {"gift_count": 1, "tier": 2},
+    "anon_gift_individual": {"duration_months": 1, "tier": 2, "recipient": 3},
+    "timeout": {"timeout_seconds": 2},
+    "raid": {"raiders": 1},
+}
+
+# seconds per unit of a timeout duration such as "1h 10m 0s"
+duration_units = {"d": 86400, "h": 3600, "m": 60, "s": 1}
+
+
+non_chat_patterns = [
+    "stream_live",
+    "sub_basic",
+    "sub_prime_basic",
+    "sub_with_months",
+    "sub_with_streak",
+    "sub_advance",
+    "gift_announcement",
+    "gift_individual",
+    "gift_first",
+    "anon_gift_announcement",
+    "anon_gift_individual",
+    "timeout",
+    "permanent_ban",
+    "raid",
+    "room_mode_on",
+    "room_mode_off",
+    "announcement",
+]
+
+
+# Message types counted together in the /stats/ event totals
+event_categories = {
+    "subs": [
+        "sub_basic",
+        "sub_prime_basic",
+        "sub_with_months",
+        "sub_with_streak",
+        "sub_advance",
+    ],
+    "gifts": [
+        "gift_announcement",
+        "gift_individual",
+        "gift_first",
+        "anon_gift_announcement",
+        "anon_gift_individual",
+    ],
+    "raids": ["raid"],
+    "timeouts": ["timeout"],
+    "bans": ["permanent_ban"],
+}
+
+# Message types whose username is counted as a chatter
+chat_patterns = ["chat_message", "chat_message_foreign"]
+
+# Message types that each stand for one gifted sub, see events.top_gifters_query
+single_gift_patterns = ["gift_individual", "gift_first"]
+
+
+# Keyword pre-dispatch for classify(): every pattern in a group requires its
+# keyword as a literal substring, so groups whose keyword is missing can be
+# skipped. Groups follow the order of `patterns`, which keeps the first match
+# identical to trying each pattern in turn.
+dispatch = [
+    (keyword, [(pattern_name, patterns[pattern_name]) for pattern_name in names])
+    for keyword, names in [
+        ("is live!", ["stream_live"]),
+        (
+            "subscribed",
+            [
+                "sub_basic",
+                "sub_prime_basic",
+                "sub_with_months",
+                "sub_with_streak",
+                "sub_advance",
+            ],
+        ),
+        (
+            "gift",
+            [
+                "gift_announcement",
+                "gift_individual",
+                "gift_first",
+                "anon_gift_announcement",
+                "anon_gift_individual",
+            ],
+        ),
+        ("has been", ["timeout", "permanent_ban"]),
+        ("raider", ["raid"]),
+        ("This room is", ["room_mode_on", "room_mode_off"]),
+        ("Announcement", ["announcement"]),
+        (None, ["chat_message", "chat_message_foreign"]),
+    ]
+]
@@ -0,0 +1,162 @@
+import operator
+from datetime import timezone
+from typing import Literal
+
+from sqlalchemy import Join, tuple_
+from sqlalchemy.ext.compiler import compiles
+from sqlmodel import select
+
+from chatlog.models import Channel, ChatMessage, ChatUser, MessageType
+from chatlog.names import NO_USER
+
+
+OrderBy = Literal["timestamp", "username", "message_type"]
+
+# lookup table whose name an OrderBy/filter field is
+lookups = {"channel_name": Channel, "username": ChatUser, "message_type": MessageType}
+
+# ChatMessage column that points into each lookup table
+lookup_ids = {
+    "channel_name": ChatMessage.channel_id,
+    "username": ChatMessage.user_id,
+    "message_type": ChatMessage.message_type_id,
+}
+
+
+def as_utc(timestamp):
+    """An aware datetime in UTC, as timestamps are stored; naive ones are taken as UTC.
+
+    Depending on the sqlmodel version, SQLite gives timestamps back naive or
+    aware, while Parquet files and Arrow filters always hold aware ones.
+    """
+    if timestamp is None or timestamp.tzinfo is None:
+        return timestamp and timestamp.replace(tzinfo=timezone.utc)
+    return timestamp.astimezone(timezone.utc)
+
+
+class CrossJoin(Join):
+    """``left CROSS JOIN right ON ...``, which SQLite always runs with left outermost."""
+
+    inherit_cache = True
+
+
+@compiles(CrossJoin, "sqlite")
+def compile_cross_join(join, compiler, **kw):
+    kw["asfrom"] = True
+    return (
+        f"{compiler.process(join.left, **kw)} CROSS JOIN "
+        f"{compiler.process(join.right, **kw)} "
+        f"ON {compiler.process(join.onclause, **kw)}"
+    )
+
+
+def sort_fields(order_by):
+    """Return the fields rows are sorted by: order_by, then timestamp, then id.
+
+    Breaking ties on (timestamp, id) gives a total order for keyset paging and
+    matches the ``(..., timestamp)`` composite indexes, whose rowid suffix
+    supplies the id.
+    """
+    if order_by == "timestamp":
+        return ["timestamp", "id"]
+    return [order_by, "timestamp", "id"]
+
+
+def sort_columns(order_by):
+    """The SQL columns of sort_fields(order_by); names come from the lookup table."""
+    table = ChatMessage.__table__
+    columns = [table.c.timestamp, table.c.id]
+    if order_by != "timestamp":
+        columns.insert(0, lookups[order_by].__table__.c.name)
+    return columns
+
+
+def after_cursor(order_by, desc, key):
+    """Seek condition for rows after ``key`` (the sort_fields values of a row)."""
+    if order_by == "username" and key[0] is None:
+        key = [NO_USER, *key[1:]]
+    compare = operator.lt if desc else operator.gt
+    return compare(tuple_(*sort_columns(order_by)), tuple_(*key))
+
+
+def name_id(field, name):
+    """Scalar subquery for the id of a channel, user or message type name.
+
+    It is NULL for unknown names, so an equality filter on it matches nothing.
+    """
+    table = lookups[field].__table__
+    return select(table.c.id).where(table.c.name == name).scalar_subquery()
+
+
+def chats_filters(
+    channel_name=None,
+    username=None,
+    message_type=None,
+    start_datetime=None,
+    end_datetime=None,
+):
+    """Return the WHERE conditions for the /chats/ filter parameters."""
+    conditions = []
+
+    for field, name in [
+        ("channel_name", channel_name),
+        ("username", username),
+        ("message_type", message_type),
+    ]:
+        if name is not None:
+            conditions.append(lookup_ids[field] == name_id(field, name))
+
+    if start_datetime is not None:
+        conditions.append(getattr(ChatMessage, "timestamp") >= start_datetime)
+
+    if end_datetime is not None:
+        conditions.append(getattr(ChatMessage, "timestamp") <= end_datetime)
+
+    return conditions
+
+
+def chats_query(
+    channel_name=None,
+    username=None,
+    message_type=None,
+    start_datetime=None,
+    end_datetime=None,
+    order_by="timestamp",
+    desc=False,
+    after=None,
+    columns=None,
+):
+    """Build the filtered, ordered ChatMessage select behind GET /chats/.
+
+    ``after`` is a sort key from a previous page, see after_cursor().
+    ``columns`` selects plain rows of those columns instead of ChatMessage
+    objects.
+
+    Ordering by username or message_type walks the lookup table's name
+    index and, per name, the ``(..._id, timestamp)`` index, so rows come
+    out in order without sorting the matches.
+    """
+    stmt = select(*columns) if columns else select(ChatMessage)
+    if order_by != "timestamp":
+        lookup = lookups[order_by].__table__
+        stmt = stmt.select_from(
+            CrossJoin(
+                lookup, ChatMessage.__table__, lookup.c.id == lookup_ids[order_by]
+            )
+        )
+    stmt = stmt.where(
+        *chats_filters(
+            channel_name, username, message_type, start_datetime, end_datetime
+        )
+    )
+
+    if after is not None:
+        stmt = stmt.where(after_cursor(order_by, desc, after))
+
+    columns = sort_columns(order_by)
+    if desc:
+        stmt = stmt.order_by(*(column.desc() for column in columns))
+    else:
+        stmt = stmt.order_by(*columns)
+
+    return stmt
@@ -0,0 +1,225 @@
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Literal
+
+from sqlalchemy import and_, bindparam, case, func
+from sqlalchemy.dialects.sqlite import insert
+from sqlmodel import select
+
+from chatlog.models import ChatterCountRollup, MessageCountRollup
+from chatlog.names import NAMED_MESSAGES
+from chatlog.patterns import chat_patterns, event_categories
+
+
+# bucket lengths kept in MessageCountRollup, in seconds
+RESOLUTIONS = {"minute": 60, "hour": 3600, "day": 86400}
+
+Interval = Literal["minute", "hour", "day"]
+
+DAY = RESOLUTIONS["day"]
+
+# primary keys of the rollup tables, as count_rows() tallies them
+MESSAGE_KEYS = ["channel_name", "resolution", "bucket", "message_type"]
+CHATTER_KEYS = ["channel_name", "day", "username"]
+
+
+def epoch(timestamp):
+    """Unix seconds for a datetime, treating naive values as UTC like SQLite does."""
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    return int(timestamp.timestamp())
+
+
+def from_epoch(seconds):
+    return datetime.fromtimestamp(seconds, timezone.utc)
+
+
+def count_rows(rows):
+    """Tally ChatMessage row dicts into MessageCountRollup and ChatterCountRollup keys."""
+    messages = Counter()
+    chatters = Counter()
+    for row in rows:
+        if row["timestamp"] is None:
+            continue
+        seconds = epoch(row["timestamp"])
+        channel_name = row["channel_name"]
+        message_type = row["message_type"]
+        for resolution in RESOLUTIONS.values():
+            bucket = seconds - seconds % resolution
+            messages[channel_name, resolution, bucket, message_type] += 1
+        if message_type in chat_patterns and row["username"] is not None:
+            chatters[channel_name, seconds - seconds % DAY, row["username"]] += 1
+    return messages, chatters
+
+
+def add_counts(conn, model, keys, counts):
+    if not counts:
+        return
+    table = model.__table__
+    stmt = insert(table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=keys, set_={"count": table.c.count + stmt.excluded.count}
+    )
+    conn.execute(
+        stmt, [{**dict(zip(keys, key)), "count": n} for key, n in counts.items()]
+    )
+
+
+def update_rollups(conn, rows):
+    """Add freshly inserted ChatMessage row dicts to the rollup tables.
+
+    Call in the transaction that inserts the rows, so counts and rows
+    commit together.
+    """
+    messages, chatters = count_rows(rows)
+    add_counts(conn, MessageCountRollup, MESSAGE_KEYS, messages)
+    add_counts(conn, ChatterCountRollup, CHATTER_KEYS, chatters)
+
+
+def remove_from_rollups(conn, rows):
+    """Take ChatMessage row dicts that are being deleted out of the rollup tables.
+
+    Keys counted down to zero are dropped, as rebuild_rollups() would not
+    have them.
+    """
+    messages, chatters = count_rows(rows)
+    for model, keys, counts in [
+        (MessageCountRollup, MESSAGE_KEYS, messages),
+        (ChatterCountRollup, CHATTER_KEYS, chatters),
+    ]:
+        if not counts:
+            continue
+        add_counts(conn, model, keys, {key: -n for key, n in counts.items()})
+        table = model.__table__
+        conn.execute(
+            table.delete().where(
+                and_(*(table.c[name] == bindparam(f"key_{name}") for name in keys)),
+                table.c.count <= 0,
+            ),
+            [{f"key_{name}": value for name, value in zip(keys, key)} for key in counts],
+        )
+
+
+def rebuild_rollups(conn):
+    """Recount both rollup tables from ChatMessage, e.g. for a database that predates them."""
+    conn.exec_driver_sql("DELETE FROM messagecountrollup")
+    conn.exec_driver_sql("DELETE FROM chattercountrollup")
+    seconds = "CAST(strftime('%s', timestamp) AS INTEGER)"
+    for resolution in RESOLUTIONS.values():
+        conn.exec_driver_sql(
+            "INSERT INTO messagecountrollup "
+            "(channel_name, resolution, bucket, message_type, count) "
+            f"SELECT channel_name, {resolution}, "
+            f"{seconds} - {seconds} % {resolution} AS bucket, message_type, count(*) "
+            f"FROM {NAMED_MESSAGES} WHERE timestamp IS NOT NULL "
+            "GROUP BY channel_name, bucket, message_type"
+        )
+    placeholders = ", ".join("?" for _ in chat_patterns)
+    conn.exec_driver_sql(
+        "INSERT INTO chattercountrollup (channel_name, day, username, count) "
+        f"SELECT channel_name, {seconds} - {seconds} % {DAY} AS day, username, count(*) "
+        f"FROM {NAMED_MESSAGES} WHERE timestamp IS NOT NULL AND username IS NOT NULL "
+        f"AND message_type IN ({placeholders}) "
+        "GROUP BY channel_name, day, username",
+        tuple(chat_patterns),
+    )
+
+
+def rollups_missing(conn):
+    """True when ChatMessage has rows but the rollup tables are empty."""
+    return (
+        conn.exec_driver_sql("SELECT 1 FROM messagecountrollup LIMIT 1").scalar() is None
+        and conn.exec_driver_sql("SELECT 1 FROM chatmessage LIMIT 1").scalar()
+        is not None
+    )
+
+
+def bucket_range(column, resolution, start_datetime, end_datetime):
+    """Conditions for buckets overlapping ``[start_datetime, end_datetime]``.
+
+    Counts are only as precise as the buckets, so a range that starts or
+    ends inside a bucket includes all of it.
+    """
+    conditions = []
+    if start_datetime is not None:
+        start = epoch(start_datetime)
+        conditions.append(column >= start - start % resolution)
+    if end_datetime is not None:
+        conditions.append(column <= epoch(end_datetime))
+    return conditions
+
+
+def message_counts_query(
+    channel_name=None,
+    message_type=None,
+    start_datetime=None,
+    end_datetime=None,
+    interval="minute",
+):
+    """Select (channel_name, bucket, message_type, count) rows, oldest bucket first."""
+    resolution = RESOLUTIONS[interval]
+    rollup = MessageCountRollup
+    conditions = [rollup.resolution == resolution]
+    if channel_name is not None:
+        conditions.append(rollup.channel_name == channel_name)
+    if message_type is not None:
+        conditions.append(rollup.message_type == message_type)
+    conditions += bucket_range(rollup.bucket, resolution, start_datetime, end_datetime)
+
+    return (
+        select(rollup.channel_name, rollup.bucket, rollup.message_type, rollup.count)
+        .where(*conditions)
+        .order_by(rollup.channel_name, rollup.bucket, rollup.message_type)
+    )
+
+
+def top_chatters_query(channel_name=None, start_datetime=None, end_datetime=None):
+    """Select (username, count) by chat messages, most first.
+
+    Counts are kept per UTC day, so the range is widened to whole days.
+    """
+    rollup = ChatterCountRollup
+    conditions = bucket_range(rollup.day, DAY, start_datetime, end_datetime)
+    if channel_name is not None:
+        conditions.append(rollup.channel_name == channel_name)
+
+    total = func.sum(rollup.count).label("count")
+    return (
+        select(rollup.username, total)
+        .where(*conditions)
+        .group_by(rollup.username)
+        .order_by(total.desc(), rollup.username)
+    )
+
+
+def event_totals_query(channel_name=None, start_datetime=None, end_datetime=None):
+    """Select channel_name plus one total per event_categories entry, per channel.
+
+    Reads the coarsest resolution whose buckets line up with the range, e.g.
+    day buckets for ``2024-11-01T00:00:00`` to ``2024-11-30T23:59:59``.
+    """
+    resolution = RESOLUTIONS["minute"]
+    for seconds in RESOLUTIONS.values():
+        if (start_datetime is None or epoch(start_datetime) % seconds == 0) and (
+            end_datetime is None or (epoch(end_datetime) + 1) % seconds == 0
+        ):
+            resolution = seconds
+
+    rollup = MessageCountRollup
+    conditions = [rollup.resolution == resolution]
+    conditions += bucket_range(rollup.bucket, resolution, start_datetime, end_datetime)
+    if channel_name is not None:
+        conditions.append(rollup.channel_name == channel_name)
+
+    totals = [
+        func.coalesce(
+            func.sum(case((rollup.message_type.in_(types), rollup.count), else_=0)), 0
+        ).label(category)
+        for category, types in event_categories.items()
+    ]
+    return (
+        select(rollup.channel_name, *totals)
+        .where(*conditions)
+        .group_by(rollup.channel_name)
+        .order_by(rollup.channel_name)
+    )
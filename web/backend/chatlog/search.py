@@ -0,0 +1,144 @@
+from typing import Literal
+
+from sqlalchemy import column, func, literal_column, table
+from sqlmodel import select
+
+from chatlog.models import ChatMessage
+from chatlog.names import chat_columns
+from chatlog.queries import chats_filters
+
+
+SearchSyntax = Literal["words", "phrase", "prefix", "fts"]
+
+SearchOrderBy = Literal["rank", "timestamp"]
+
+# External-content FTS5 index over ChatMessage.message_text; the text itself
+# stays in chatmessage and the index is keyed by its rowid.
+CREATE_FTS = """
+CREATE VIRTUAL TABLE chatmessage_fts USING fts5(
+    message_text,
+    content='chatmessage',
+    content_rowid='id',
+    tokenize='unicode61 remove_diacritics 2',
+    prefix='2 3'
+)
+"""
+
+FTS_TRIGGERS = {
+    "chatmessage_fts_insert": """
+        CREATE TRIGGER IF NOT EXISTS chatmessage_fts_insert AFTER INSERT ON chatmessage
+        BEGIN
+            INSERT INTO chatmessage_fts (rowid, message_text)
+            VALUES (new.id, new.message_text);
+        END
+    """,
+    "chatmessage_fts_delete": """
+        CREATE TRIGGER IF NOT EXISTS chatmessage_fts_delete AFTER DELETE ON chatmessage
+        BEGIN
+            INSERT INTO chatmessage_fts (chatmessage_fts, rowid, message_text)
+            VALUES ('delete', old.id, old.message_text);
+        END
+    """,
+    "chatmessage_fts_update": """
+        CREATE TRIGGER IF NOT EXISTS chatmessage_fts_update AFTER UPDATE OF message_text ON chatmessage
+        BEGIN
+            INSERT INTO chatmessage_fts (chatmessage_fts, rowid, message_text)
+            VALUES ('delete', old.id, old.message_text);
+            INSERT INTO chatmessage_fts (rowid, message_text)
+            VALUES (new.id, new.message_text);
+        END
+    """,
+}
+
+chatmessage_fts = table("chatmessage_fts", column("rowid"), column("rank"))
+
+
+def create_search_index(conn):
+    """Create the FTS index and its sync triggers, indexing existing rows if new."""
+    exists = conn.exec_driver_sql(
+        "SELECT 1 FROM sqlite_master WHERE name = 'chatmessage_fts'"
+    ).scalar()
+    if not exists:
+        conn.exec_driver_sql(CREATE_FTS)
+        conn.exec_driver_sql(
+            "INSERT INTO chatmessage_fts (chatmessage_fts) VALUES ('rebuild')"
+        )
+    create_search_triggers(conn)
+
+
+def create_search_triggers(conn):
+    for sql in FTS_TRIGGERS.values():
+        conn.exec_driver_sql(sql)
+
+
+def drop_search_triggers(conn):
+    for name in FTS_TRIGGERS:
+        conn.exec_driver_sql(f"DROP TRIGGER IF EXISTS {name}")
+
+
+def index_rows_after(conn, last_id):
+    """Add rows with ``id > last_id`` to the FTS index, e.g. after a bulk load."""
+    conn.exec_driver_sql(
+        "INSERT INTO chatmessage_fts (rowid, message_text) "
+        "SELECT id, message_text FROM chatmessage WHERE id > ?",
+        (last_id,),
+    )
+
+
+def fts_query(q, syntax="words"):
+    """Turn user input into an FTS5 query.
+
+    ``words`` matches every word, ``phrase`` the words in order, ``prefix``
+    every word as a prefix, and ``fts`` passes q through as FTS5 syntax.
+    """
+    if syntax == "fts":
+        return q
+
+    def quote(term):
+        return '"' + term.replace('"', '""') + '"'
+
+    terms = q.split()
+    if syntax == "phrase":
+        return quote(" ".join(terms))
+    if syntax == "prefix":
+        return " ".join(quote(term) + "*" for term in terms)
+    return " ".join(quote(term) for term in terms)
+
+
+def search_query(
+    q,
+    syntax="words",
+    channel_name=None,
+    username=None,
+    message_type=None,
+    start_datetime=None,
+    end_datetime=None,
+    order_by="rank",
+    desc=False,
+    highlight=("<mark>", "</mark>"),
+):
+    """Select rows of chat_columns plus snippet and rank matching q and the /chats/ filters.
+
+    ``order_by="rank"`` returns best matches first (bm25) and ignores desc.
+    """
+    snippet = func.snippet(
+        literal_column("chatmessage_fts"), 0, highlight[0], highlight[1], "…", 16
+    ).label("snippet")
+    rank = chatmessage_fts.c.rank.label("rank")
+
+    stmt = (
+        select(*chat_columns, snippet, rank)
+        .join_from(chatmessage_fts, ChatMessage, ChatMessage.id == chatmessage_fts.c.rowid)
+        .where(literal_column("chatmessage_fts").op("MATCH")(fts_query(q, syntax)))
+        .where(
+            *chats_filters(
+                channel_name, username, message_type, start_datetime, end_datetime
+            )
+        )
+    )
+
+    if order_by == "rank":
+        return stmt.order_by(rank, ChatMessage.id)
+    if desc:
+        return stmt.order_by(ChatMessage.timestamp.desc(), ChatMessage.id.desc())
+    return stmt.order_by(ChatMessage.timestamp, ChatMessage.id)
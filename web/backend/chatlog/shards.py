@@ -0,0 +1,197 @@
+import re
+import threading
+from datetime import date
+from pathlib import Path
+from typing import Literal, get_args
+
+from sqlalchemy import func, select
+
+from chatlog.connections import read_engine, write_engine
+from chatlog.db import init_db
+from chatlog.logfiles import channel_of, find_headers
+from chatlog.models import ArchiveFile, ChatMessage
+from chatlog.queries import as_utc
+
+
+ShardBy = Literal["channel", "month"]
+
+# rows of shard n get ids from n * SHARD_ID_SPACE on, so ids stay unique
+# across shards and pages read from several shards merge without clashes
+SHARD_ID_SPACE = 1 << 40
+
+# numbers the shards of a directory, see ShardRouter
+CATALOG_NAME = "catalog.db"
+
+# the date in a Chatterino log file name, <channel>-YYYY-MM-DD.log
+FILE_MONTH = re.compile(r"-(\d{4}-\d\d)-\d\d\.log$")
+
+
+def shard_key(path, by):
+    """The shard a log file's lines are stored in: its channel, or the month of its date.
+
+    A file goes to one shard as a whole, so its LogFile manifest entry is
+    committed with its rows. Files without a date in their name go by the
+    date of their first header.
+    """
+    if by == "channel":
+        return channel_of(path)
+    match = FILE_MONTH.search(Path(path).name)
+    if match is not None:
+        return match.group(1)
+    headers = find_headers(path)
+    return f"{date.fromisoformat(headers[0][1]):%Y-%m}" if headers else "undated"
+
+
+def add_up(pages, key_size):
+    """Sum rows from several shards that agree on their first key_size columns.
+
+    Returns ``{key: [sums of the other columns]}``. Stats are rolled up per
+    shard, and a channel, user or bucket can have rows in more than one.
+    """
+    totals = {}
+    for page in pages:
+        for row in page:
+            key = tuple(row[:key_size])
+            sums = totals.get(key)
+            if sums is None:
+                totals[key] = list(row[key_size:])
+            else:
+                for i, value in enumerate(row[key_size:]):
+                    sums[i] += value
+    return totals
+
+
+class ShardRouter:
+    """ChatMessage split over one SQLite database per channel or per month.
+
+    Each shard is a complete chatlog database, ``shard-<key>.db`` in
+    directory, with its own lookup tables, rollups, ChatEvent, search index
+    and LogFile manifest, so ingest runs against it unchanged and writers to
+    different shards never wait on each other's lock. ``catalog.db`` numbers
+    the shards in the order they were added; shard n numbers its rows from
+    ``n * SHARD_ID_SPACE``.
+
+    route() picks the shards a query's filters can match, by key and by the
+    timestamp range of each shard's rows. The ranges are read once per
+    process and kept until refresh() is called for a shard that got new rows.
+
+    Shards are opened with write_engine(), or with ``readers`` as
+    read_engine() pools of that many connections, as the API does; a
+    reader never adds or creates a shard.
+    """
+
+    def __init__(self, directory, by="channel", natural_key=False, readers=None, echo=False):
+        if by not in get_args(ShardBy):
+            raise ValueError(f"shard by one of {get_args(ShardBy)}, not {by!r}")
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.by = by
+        self.natural_key = natural_key
+        self.readers = readers
+        self.echo = echo
+
+        catalog = self.directory / CATALOG_NAME
+        self.catalog = write_engine(catalog)
+        with self.catalog.begin() as conn:
+            conn.exec_driver_sql(
+                "CREATE TABLE IF NOT EXISTS shard "
+                "(key TEXT PRIMARY KEY, number INTEGER NOT NULL UNIQUE)"
+            )
+        if readers is not None:
+            self.catalog.dispose()
+            self.catalog = read_engine(catalog, readers)
+        self.lock = threading.Lock()
+        self.engines = {}
+        # key -> (min, max) timestamp of the shard's rows, None while it has none
+        self.bounds = {}
+
+    def key_for(self, path):
+        return shard_key(path, self.by)
+
+    def keys(self):
+        """Keys of every shard in the catalog, in key order."""
+        with self.catalog.connect() as conn:
+            return [
+                key
+                for (key,) in conn.exec_driver_sql("SELECT key FROM shard ORDER BY key")
+            ]
+
+    def engine(self, key):
+        """The engine of shard key; a writer adds the shard and creates it on first use."""
+        with self.lock:
+            engine = self.engines.get(key)
+            if engine is not None:
+                return engine
+
+            path = self.directory / f"shard-{key}.db"
+            if self.readers is not None:
+                engine = self.engines[key] = read_engine(path, self.readers, self.echo)
+                return engine
+
+            # the shard is created before its catalog row commits, so readers
+            # only see shards they can open
+            with self.catalog.begin() as conn:
+                conn.exec_driver_sql(
+                    "INSERT OR IGNORE INTO shard (key, number) "
+                    "SELECT ?, coalesce(max(number), 0) + 1 FROM shard",
+                    (key,),
+                )
+                number = conn.exec_driver_sql(
+                    "SELECT number FROM shard WHERE key = ?", (key,)
+                ).scalar()
+                engine = write_engine(path, self.echo)
+                init_db(engine, self.natural_key)
+                with engine.begin() as shard:
+                    # read by insert_rows() to number the shard's first row
+                    shard.exec_driver_sql(
+                        "INSERT OR IGNORE INTO ingeststate (key, value) "
+                        "VALUES ('first_id', ?)",
+                        (number * SHARD_ID_SPACE,),
+                    )
+            self.engines[key] = engine
+            return engine
+
+    def refresh(self, key):
+        """Read the timestamp range of shard key's rows again, archived ones included."""
+        with self.engine(key).connect() as conn:
+            stored = conn.execute(
+                select(func.min(ChatMessage.timestamp), func.max(ChatMessage.timestamp))
+            ).one()
+            archived = conn.execute(
+                select(
+                    func.min(ArchiveFile.min_timestamp), func.max(ArchiveFile.max_timestamp)
+                )
+            ).one()
+        # naive or aware depending on the sqlmodel version, see as_utc()
+        lows = [as_utc(value) for value in (stored[0], archived[0]) if value is not None]
+        highs = [as_utc(value) for value in (stored[1], archived[1]) if value is not None]
+        self.bounds[key] = (min(lows), max(highs)) if lows else None
+
+    def route(self, channel_name=None, start_datetime=None, end_datetime=None):
+        """Keys of the shards that can hold rows matching the /chats/ filters, in key order.
+
+        Shards without rows are left out.
+        """
+        keys = self.keys()
+        if self.by == "channel" and channel_name is not None:
+            keys = [key for key in keys if key == channel_name]
+        start = as_utc(start_datetime)
+        end = as_utc(end_datetime)
+
+        routed = []
+        for key in keys:
+            if key not in self.bounds:
+                self.refresh(key)
+            bounds = self.bounds[key]
+            if bounds is None:
+                continue
+            low, high = bounds
+            if (start is not None and high < start) or (end is not None and low > end):
+                continue
+            routed.append(key)
+        return routed
+
+    def dispose(self):
+        for engine in self.engines.values():
+            engine.dispose()
+        self.catalog.dispose()
@@ -0,0 +1,292 @@
+import os
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+
+from sqlalchemy.engine import Engine
+from watchfiles import Change, watch
+
+from chatlog.db import CHUNK_SIZE, forget_file, insert_rows
+from chatlog.logfiles import channel_of, clock_at, decode_lines, find_log_files
+from chatlog.manifest import load_manifest, manifest_entry, record_files, resume_offset
+from chatlog.metrics import add_timings, new_stage_timings, record_ingest
+from chatlog.parser import StreamClock, parse_lines
+from chatlog.patterns import new_pattern_counts
+
+
+# seconds between flushes of buffered rows
+FLUSH_INTERVAL = 0.25
+
+
+@dataclass(slots=True)
+class TailedFile:
+    channel_name: str
+    engine: Engine  # database the file's rows and manifest entry are stored in
+    stat: os.stat_result  # as of the last read
+    offset: int  # bytes read and parsed so far, always at a line boundary
+    clock: StreamClock  # dates the lines after offset, midnights passed included
+
+
+class Tailer:
+    """Follow every log file under a Chatterino ``Channels/`` directory.
+
+    File changes come from watchfiles instead of a sleep loop. Complete
+    lines are parsed as they are appended and buffered; the buffer is
+    written in one transaction every ``flush_interval`` seconds or
+    ``flush_rows`` rows, together with each file's new byte offset in the
+    LogFile manifest, so a restart resumes exactly where the last flush
+    ended, and with the pattern counts and stage timings since the last
+    flush, added to the IngestMetric totals.
+
+    Chatterino starts a new file per channel and day, which is picked up
+    from the start when it appears. A file that shrinks below its offset,
+    or is replaced by another file, was truncated or rotated in place and is
+    read again from the start; on load, so is a file whose stored part
+    changed since the last run. The rows stored from its earlier contents
+    are deleted in the next flush, see chatlog.db.forget_file.
+
+    With a ShardRouter, each file is stored in its shard instead of in
+    ``engine``, one transaction per shard with rows to flush.
+    """
+
+    def __init__(
+        self,
+        engine,
+        root,
+        flush_interval=FLUSH_INTERVAL,
+        flush_rows=CHUNK_SIZE,
+        from_start=False,
+        router=None,
+    ):
+        self.engine = engine
+        self.router = router
+        self.root = Path(root).resolve()
+        self.flush_interval = flush_interval
+        self.flush_rows = flush_rows
+        self.from_start = from_start
+
+        self.files = {}
+        # engine -> buffered row dicts to store there
+        self.rows = {}
+        self.buffered = 0
+        self.dirty = set()
+        # engine -> paths read again from the start, whose stored rows are deleted
+        self.forget = {}
+        self.counts = new_pattern_counts()
+        self.timings = new_stage_timings()
+        # counts and timings of the lines read since the last flush
+        self.pending_counts = new_pattern_counts()
+        self.pending_timings = new_stage_timings()
+        self.total = 0
+        self.last_flush = time.monotonic()
+
+    def load(self):
+        """Start tracking the files already on disk, at their stored offsets."""
+        manifest = {}
+        for engine in self.engines():
+            with engine.connect() as conn:
+                manifest.update(load_manifest(conn))
+
+        for path in find_log_files(self.root):
+            entry = manifest.get(str(path))
+            if entry is not None:
+                offset = resume_offset(path, entry)
+            elif self.from_start:
+                offset = 0
+            else:
+                offset = path.stat().st_size
+            tailed = self.track(path, offset)
+            if entry is not None and offset == 0:
+                self.forget.setdefault(tailed.engine, set()).add(path)
+
+    def engines(self):
+        """The databases stored to: ``engine``, or every shard the router has."""
+        if self.router is None:
+            return [self.engine]
+        return [self.router.engine(key) for key in self.router.keys()]
+
+    def engine_for(self, path):
+        if self.router is None:
+            return self.engine
+        return self.router.engine(self.router.key_for(path))
+
+    def track(self, path, offset):
+        path = Path(path)
+        self.files[path] = TailedFile(
+            channel_of(path),
+            self.engine_for(path),
+            path.stat(),
+            offset,
+            clock_at(path, offset),
+        )
+        return self.files[path]
+
+    def read(self, path):
+        """Parse the complete lines appended to path since the last read."""
+        path = Path(path)
+        tailed = self.files.get(path)
+        if tailed is None:
+            try:
+                tailed = self.track(path, 0)
+            except FileNotFoundError:
+                return
+
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return
+        size = stat.st_size
+        if size < tailed.offset or stat.st_ino != tailed.stat.st_ino:
+            print(f"{path} was truncated or replaced, reading it again from the start")
+            # lines buffered from its earlier contents go with its stored rows
+            rows = self.rows.get(tailed.engine, [])
+            kept = [row for row in rows if row["log_file"] != str(path)]
+            self.buffered -= len(rows) - len(kept)
+            rows[:] = kept
+            self.forget.setdefault(tailed.engine, set()).add(path)
+            tailed = self.track(path, 0)
+        if size == tailed.offset:
+            return
+
+        started = time.perf_counter()
+        with open(path, "rb") as f:
+            f.seek(tailed.offset)
+            data = f.read(size - tailed.offset)
+        # a line still being written is left for the next read
+        data = data[: data.rfind(b"\n") + 1]
+        if not data:
+            return
+
+        read_timing = self.pending_timings["read"]
+        read_timing[0] += time.perf_counter() - started
+        read_timing[1] += data.count(b"\n")
+
+        now = datetime.now(timezone.utc)
+        rows = self.rows.setdefault(tailed.engine, [])
+        buffered = len(rows)
+        lines = decode_lines(data)
+        for event in parse_lines(
+            lines,
+            counts=self.pending_counts,
+            clock=tailed.clock,
+            timings=self.pending_timings,
+        ):
+            if event.type is None:
+                continue
+            rows.append(
+                {
+                    "created_at": now,
+                    "timestamp": event.time,
+                    "channel_name": tailed.channel_name,
+                    "username": event.usernames[0] if event.usernames else None,
+                    "message_text": event.text,
+                    "message_type": event.type,
+                    "details": event.details,
+                    "log_file": str(path),
+                }
+            )
+
+        self.buffered += len(rows) - buffered
+        tailed.offset += len(data)
+        tailed.stat = stat
+        self.dirty.add(path)
+
+    def flush(self):
+        """Store buffered rows with their rollups, metrics and manifest entries in one transaction.
+
+        With a router, it is one transaction per shard; the metrics go with
+        the last one.
+        """
+        self.last_flush = time.monotonic()
+        if not self.dirty:
+            return
+
+        groups = {engine: [] for engine in [*self.rows, *self.forget]}
+        for path in self.dirty:
+            tailed = self.files.get(path)
+            if tailed is None:
+                continue
+            try:
+                entry = manifest_entry(path, tailed.stat, tailed.offset)
+            except FileNotFoundError:
+                continue
+            groups.setdefault(tailed.engine, []).append(entry)
+        self.dirty.clear()
+        if not groups:
+            return
+
+        inserted = 0
+        last = len(groups) - 1
+        for i, (engine, entries) in enumerate(groups.items()):
+            rows = self.rows.get(engine)
+            with engine.begin() as conn:
+                started = time.perf_counter()
+                for path in self.forget.get(engine, ()):
+                    forget_file(conn, path)
+                inserted += insert_rows(conn, rows) if rows else 0
+                record_files(conn, entries)
+                insert_timing = self.pending_timings["insert"]
+                insert_timing[0] += time.perf_counter() - started
+                if i == last:
+                    insert_timing[1] += self.buffered
+                    record_ingest(conn, self.pending_counts, self.pending_timings)
+
+        for key, value in self.pending_counts.items():
+            self.counts[key] += value
+        add_timings(self.timings, self.pending_timings)
+        self.pending_counts = new_pattern_counts()
+        self.pending_timings = new_stage_timings()
+
+        if self.buffered:
+            self.total += inserted
+            print(f"stored {inserted} rows ({self.total} total)")
+        self.rows = {}
+        self.buffered = 0
+        self.forget = {}
+
+    def handle(self, changes):
+        for change, path in changes:
+            path = Path(path)
+            if path.suffix != ".log":
+                continue
+            if change == Change.deleted:
+                if path in self.files and path not in self.dirty:
+                    del self.files[path]
+                continue
+            self.read(path)
+            if self.buffered >= self.flush_rows:
+                self.flush()
+
+    def scan(self):
+        """Read every log file under root, including ones no event was seen for."""
+        for path in find_log_files(self.root):
+            self.read(path)
+
+    def run(self, stop_event=None):
+        """Tail until stop_event is set (or forever), flushing on the way out."""
+        self.load()
+        self.scan()
+        self.flush()
+
+        interval_ms = int(self.flush_interval * 1000)
+        watching = False
+        try:
+            for changes in watch(
+                self.root,
+                debounce=interval_ms,
+                step=min(50, interval_ms),
+                rust_timeout=interval_ms,
+                yield_on_timeout=True,
+                stop_event=stop_event,
+            ):
+                if not watching:
+                    # lines written before the watcher started raise no event
+                    watching = True
+                    self.scan()
+                self.handle(changes)
+                if time.monotonic() - self.last_flush >= self.flush_interval:
+                    self.flush()
+            self.scan()
+        finally:
+            self.flush()
@@ -1,15 +1,64 @@
 from contextlib import asynccontextmanager
-from typing import Annotated, Literal, Optional
+from typing import Annotated, Optional
 
 from fastapi.middleware.cors import CORSMiddleware
 
-from fastapi import Depends, FastAPI, HTTPException, Query, Request, Response
-from sqlmodel import Field, Session, SQLModel, create_engine, select
-
-import uuid
+from fastapi import FastAPI, Header, HTTPException, Query, Request, Response
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from sqlmodel import Session, select
+
+import asyncio
+import base64
+import heapq
+import json
+import os
+import time
+from collections import Counter
+from itertools import islice
 from pathlib import Path
 from datetime import datetime
 
+import anyio
+import orjson
+from sqlalchemy import func
+from sqlalchemy.exc import OperationalError
+
+from chatlog import ChatMessage, init_db
+from chatlog.archive import (
+    archive_files,
+    archived_page,
+    archived_rows,
+    merge_pages,
+    sort_key,
+    utc_rows,
+)
+from chatlog.broadcast import LAGGED, Broadcast
+from chatlog.cache import ResponseCache
+from chatlog.connections import read_engine, write_engine
+from chatlog.events import top_gifters_query
+from chatlog.export import ExportFormat, export_encoder, export_types
+from chatlog.metrics import Registry, ingest_metrics, render_ingest, request_stages, stage
+from chatlog.models import (
+    Channel,
+    ChatMessageRead,
+    ChatSearchResult,
+    ChatterCount,
+    EventTotals,
+    GifterCount,
+    MessageCountBucket,
+)
+from chatlog.names import chat_columns, chat_fields, names
+from chatlog.queries import OrderBy, as_utc, chats_filters, chats_query, sort_fields
+from chatlog.rollups import (
+    Interval,
+    event_totals_query,
+    from_epoch,
+    message_counts_query,
+    top_chatters_query,
+)
+from chatlog.search import SearchOrderBy, SearchSyntax, search_query
+from chatlog.shards import ShardRouter, add_up
+
 
 ##############################################################################
 
@@ -23,37 +72,219 @@ def find_project_root(marker=".git"):
 
 
 project_root = find_project_root()
-db_path = project_root / "database.db"
+db_path = Path(os.getenv("DATABASE_PATH", project_root / "database.db"))
+
+# Parquet files of rows moved out of the database by scripts/python/archive.py
+archive_path = Path(os.getenv("ARCHIVE_PATH", project_root / "archive"))
+
+# worker threads that may run queries at once; the read-only pool holds as
+# many connections, so a query never waits on the pool once it has a thread
+DB_THREADS = int(os.getenv("DB_THREADS", "8"))
+
+# seconds between checks for new rows to push to /chats/stream subscribers
+STREAM_POLL_INTERVAL = float(os.getenv("STREAM_POLL_INTERVAL", "0.25"))
+
+# rows read per query when publishing or replaying rows to /chats/stream
+STREAM_BATCH = 1_000
 
+# seconds of silence after which /chats/stream sends a keep-alive comment
+STREAM_KEEPALIVE = 15
 
-class ChatMessage(SQLModel, table=True):
-    id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
-    created_at: datetime = Field(index=True)
-    timestamp: datetime = Field(index=True)
-    channel_name: str = Field(index=True)
-    username: str | None = Field(default=None, index=True)
-    message_text: str
-    message_type: str = Field(index=True)
+# largest page GET /chats/ and GET /chats/search serve
+CHATS_MAX_LIMIT = int(os.getenv("CHATS_MAX_LIMIT", "1000"))
+
+# rows fetched and encoded at a time by GET /chats/export, and how many
+# exports may run at once; each holds a pooled connection until it ends
+EXPORT_BATCH = 10_000
+EXPORT_CONCURRENCY = int(os.getenv("EXPORT_CONCURRENCY", "2"))
+
+# GET /chats/ responses kept in memory, and for how many seconds at most;
+# CACHE_SIZE=0 turns the cache off
+CACHE_SIZE = int(os.getenv("CACHE_SIZE", "1024"))
+CACHE_TTL = float(os.getenv("CACHE_TTL", "30"))
+
+# SQL_ECHO=1 logs every SQL statement the engine runs
+SQL_ECHO = os.getenv("SQL_ECHO", "0") == "1"
+
+# a directory of per-channel databases, or per-month ones with
+# SHARD_BY=month, to use instead of DATABASE_PATH; see chatlog.shards
+SHARD_DIR = os.getenv("SHARD_DIR")
+SHARD_BY = os.getenv("SHARD_BY", "channel")
 
 
 ##############################################################################
 
 
-sqlite_url = f"sqlite:///{db_path}"
-connect_args = {"check_same_thread": False}
-engine = create_engine(sqlite_url, echo=True, connect_args=connect_args)
+# the API only reads; ingest writes from its own processes, see
+# chatlog.connections
+engine = read_engine(db_path, DB_THREADS, echo=SQL_ECHO)
+router = None
+if SHARD_DIR:
+    router = ShardRouter(SHARD_DIR, SHARD_BY, readers=DB_THREADS, echo=SQL_ECHO)
 
 
 def create_db_and_tables():
-    SQLModel.metadata.create_all(engine)
+    """Create or migrate the database through a writer connection, closed again after.
+
+    Shards are created and migrated by the ingest that writes to them.
+    """
+    if router is None:
+        writer = write_engine(db_path, echo=SQL_ECHO)
+        init_db(writer)
+        writer.dispose()
+
+
+async def run_in_db_thread(fn, *args, db=None):
+    """Call ``fn(session, *args)`` in a worker thread, at most DB_THREADS at once.
+
+    Keeps SQLite queries off the event loop, so one slow query does not stall
+    every other request. The session is opened and closed in the worker, so
+    a connection is only held while the query runs. ``db`` is the engine
+    to query, by default the one database.
+    """
+
+    def work():
+        with stage("sql"), Session(db or engine) as session:
+            return fn(session, *args)
+
+    return await anyio.to_thread.run_sync(work, limiter=app.state.db_limiter)
+
+
+async def run_in_shards(dbs, fn, *args):
+    """run_in_db_thread() on each engine in dbs at once; returns the results in order."""
+    return await asyncio.gather(*(run_in_db_thread(fn, *args, db=db) for db in dbs))
+
+
+async def databases(channel_name=None, start_datetime=None, end_datetime=None):
+    """Engines a query with these filters reads: the one database, or its shards.
+
+    With shards, only those router.route() finds can match the filters.
+    """
+    if router is None:
+        return [engine]
+
+    def route():
+        keys = router.route(channel_name, start_datetime, end_datetime)
+        return [router.engine(key) for key in keys]
+
+    return await anyio.to_thread.run_sync(route, limiter=app.state.db_limiter)
 
 
-def get_session():
-    with Session(engine) as session:
-        yield session
+async def all_databases():
+    if router is None:
+        return [engine]
+    keys = await anyio.to_thread.run_sync(router.keys)
+    return [await anyio.to_thread.run_sync(router.engine, key) for key in keys]
 
 
-SessionDep = Annotated[Session, Depends(get_session)]
+def max_id(session):
+    return session.exec(select(func.max(ChatMessage.id))).one() or 0
+
+
+def channels_after(session, last_id):
+    """Return ``(channel_name, max_id)`` for each channel with rows after last_id."""
+    stmt = (
+        select(Channel.name, func.max(ChatMessage.id))
+        .join(ChatMessage, ChatMessage.channel_id == Channel.id)
+        .where(ChatMessage.id > last_id)
+        .group_by(Channel.name)
+    )
+    return session.exec(stmt).all()
+
+
+def decode_rows(session, rows):
+    """ChatRows for rows of chat_columns, with names from the connection's cache.
+
+    /chats/ encodes these directly instead of building and validating a
+    model per row. Timestamps are aware UTC whatever the sqlmodel version,
+    as rows merged from shards and archive files are.
+    """
+    conn = session.connection()
+    return list(utc_rows(names(conn).decode(conn, rows)))
+
+
+def encode_rows(rows):
+    """JSON-encode ChatRows, the same as list[ChatMessageRead] would be."""
+    return orjson.dumps(
+        [dict(zip(chat_fields, row)) for row in rows], option=orjson.OPT_UTC_Z
+    )
+
+
+def fetch_rows(conn, result):
+    """The rows of a chat_columns cursor as ChatRows, fetched EXPORT_BATCH at a time."""
+    while batch := result.fetchmany(EXPORT_BATCH):
+        yield from utc_rows(names(conn).decode(conn, batch))
+
+
+def rows_after(session, last_id, filters=()):
+    stmt = (
+        select(*chat_columns)
+        .where(ChatMessage.id > last_id, *filters)
+        .order_by(ChatMessage.id)
+        .limit(STREAM_BATCH)
+    )
+    return decode_rows(session, session.exec(stmt).all())
+
+
+def encode_event(row):
+    data = orjson.dumps(dict(zip(chat_fields, row)), option=orjson.OPT_UTC_Z).decode()
+    return f"id: {row.id}\ndata: {data}\n\n"
+
+
+async def follow_new_rows(broadcast, cache):
+    """Poll for rows stored since the last check, publish them and invalidate the cache.
+
+    Ingest runs in its own process, so new rows are found by id. This is
+    one query per interval however many clients are streaming, and only
+    the new rows' channel names while nobody is.
+    """
+    last_id = await run_in_db_thread(max_id)
+    while True:
+        await asyncio.sleep(STREAM_POLL_INTERVAL)
+        try:
+            if not broadcast.subscribers:
+                changed = await run_in_db_thread(channels_after, last_id)
+                cache.invalidate(channel_name for channel_name, _ in changed)
+                last_id = max((row_id for _, row_id in changed), default=last_id)
+                continue
+
+            while True:
+                rows = await run_in_db_thread(rows_after, last_id)
+                if not rows:
+                    break
+                cache.invalidate({row.channel_name for row in rows})
+                broadcast.publish(rows, encode_event)
+                last_id = rows[-1].id
+                if len(rows) < STREAM_BATCH:
+                    break
+        except OperationalError as e:
+            print(f"follow_new_rows: {e.orig}, retrying")
+
+
+async def follow_shards(cache):
+    """follow_new_rows() for sharded storage, without publishing to /chats/stream.
+
+    Each shard is polled for rows after the last id seen in it. A shard
+    with new rows has its channels' cache entries invalidated and its
+    timestamp range read again, so router.route() finds the new rows.
+    """
+    last_ids = {}
+    while True:
+        try:
+            for key in await anyio.to_thread.run_sync(router.keys):
+                db = await anyio.to_thread.run_sync(router.engine, key)
+                if key not in last_ids:
+                    last_ids[key] = await run_in_db_thread(max_id, db=db)
+                    await anyio.to_thread.run_sync(router.refresh, key)
+                    continue
+                changed = await run_in_db_thread(channels_after, last_ids[key], db=db)
+                if changed:
+                    cache.invalidate(channel_name for channel_name, _ in changed)
+                    last_ids[key] = max(row_id for _, row_id in changed)
+                    await anyio.to_thread.run_sync(router.refresh, key)
+        except OperationalError as e:
+            print(f"follow_shards: {e.orig}, retrying")
+        await asyncio.sleep(STREAM_POLL_INTERVAL)
 
 
 ##############################################################################
@@ -64,13 +295,26 @@ def add_cors_middleware(fastapi_app):
         allow_origins=["*"],
         allow_methods=["*"],
         allow_headers=["*"],
+        expose_headers=["X-Next-Cursor", "ETag"],
     )
 
 
 @asynccontextmanager
 async def lifespan(_app: FastAPI):
     create_db_and_tables()
+    _app.state.db_limiter = anyio.CapacityLimiter(DB_THREADS)
+    _app.state.export_limiter = anyio.CapacityLimiter(EXPORT_CONCURRENCY)
+    _app.state.broadcast = Broadcast()
+    _app.state.cache = ResponseCache(CACHE_SIZE, CACHE_TTL)
+    _app.state.metrics = Registry()
+    if router is None:
+        follower = asyncio.create_task(
+            follow_new_rows(_app.state.broadcast, _app.state.cache)
+        )
+    else:
+        follower = asyncio.create_task(follow_shards(_app.state.cache))
     yield
+    follower.cancel()
     print("shutting down")
 
 
@@ -79,55 +323,556 @@ app = FastAPI(lifespan=lifespan)
 app.add_middleware(add_cors_middleware)
 
 
+def query_shape(route, query_params):
+    """The query parameters a request sets out of those its route declares.
+
+    E.g. ``channel_name,limit,start_datetime``; values and undeclared
+    parameters are left out, so the number of shapes stays bounded.
+    """
+    dependant = getattr(route, "dependant", None)
+    if dependant is None:
+        return ""
+    declared = {param.alias for param in dependant.query_params}
+    return ",".join(sorted(declared.intersection(query_params)))
+
+
 @app.middleware("http")
-async def add_logging_middleware(request: Request, call_next):
-    print(f"Request path: {request.url.path}")
+async def add_metrics_middleware(request: Request, call_next):
+    """Time each request per route and query shape, see GET /metrics.
+
+    For streaming responses this is the time until the body starts.
+    """
+    stages = {}
+    request_stages.set(stages)
+    started = time.perf_counter()
     response: Response = await call_next(request)
-    print(f"Response status: {response.status_code}")
+    elapsed = time.perf_counter() - started
+
+    route = request.scope.get("route")
+    app.state.metrics.observe_request(
+        route.path if route is not None else "unmatched",
+        query_shape(route, request.query_params),
+        response.status_code,
+        elapsed,
+        stages,
+    )
     return response
 
 
 ##############################################################################
 
 
-@app.get("/chats/", response_model=list[ChatMessage])
+def encode_cursor(order_by: str, desc: bool, row) -> str:
+    key = [
+        value.isoformat() if isinstance(value, datetime) else value
+        for value in (getattr(row, field) for field in sort_fields(order_by))
+    ]
+    payload = json.dumps([order_by, desc, key]).encode()
+    return base64.urlsafe_b64encode(payload).decode()
+
+
+def decode_cursor(cursor: str, order_by: str, desc: bool) -> list:
+    try:
+        cursor_order_by, cursor_desc, key = json.loads(
+            base64.urlsafe_b64decode(cursor.encode())
+        )
+        fields = sort_fields(order_by)
+        if len(key) != len(fields):
+            raise ValueError(key)
+        key = [
+            datetime.fromisoformat(value)
+            if value is not None and field == "timestamp"
+            else value
+            for field, value in zip(fields, key)
+        ]
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    if (cursor_order_by, cursor_desc) != (order_by, desc):
+        raise HTTPException(
+            status_code=400, detail="Cursor does not match order_by and desc"
+        )
+    return key
+
+
+def cache_key(*params):
+    return tuple(
+        value.isoformat() if isinstance(value, datetime) else value for value in params
+    )
+
+
+@app.get("/chats/", response_model=list[ChatMessageRead])
 async def read_chats(
-        session: SessionDep,
         channel_name: Annotated[str | None, Query()] = None,
         username: Annotated[str | None, Query()] = None,
         message_type: Annotated[str | None, Query()] = None,
         start_datetime: Optional[datetime] = Query(None),
         end_datetime: Optional[datetime] = Query(None),
         offset: int = 0,
-        limit: Annotated[int, Query(ge=1, le=100)] = 100,
-        order_by: Annotated[
-            Literal["timestamp", "username", "message_type"], Query()
-        ] = "timestamp",
+        limit: Annotated[int, Query(ge=1, le=CHATS_MAX_LIMIT)] = 100,
+        order_by: Annotated[OrderBy, Query()] = "timestamp",
         desc: bool = False,
-) -> list[ChatMessage]:
-    stmt = select(ChatMessage)
+        cursor: Annotated[str | None, Query()] = None,
+        if_none_match: Annotated[str | None, Header()] = None,
+) -> Response:
+    """List chat messages.
+
+    Full pages set an ``X-Next-Cursor`` header. Passing it back as ``cursor``
+    seeks straight to the next page instead of skipping ``offset`` rows.
+
+    Rows archived to Parquet are merged in, reading only the files whose
+    channel and time range can match. With sharded storage, so are the
+    pages of every shard the filters can match.
+
+    Responses are cached until their channel gets new rows or CACHE_TTL
+    passes, and carry an ``ETag``; a matching ``If-None-Match`` gets a 304.
+    Times without a timezone are taken as UTC.
+    """
+    start_datetime = as_utc(start_datetime)
+    end_datetime = as_utc(end_datetime)
+    after = decode_cursor(cursor, order_by, desc) if cursor is not None else None
+    if cursor is not None:
+        offset = 0
+
+    cache = app.state.cache
+    key = cache_key(
+        channel_name,
+        username,
+        message_type,
+        start_datetime,
+        end_datetime,
+        offset,
+        limit,
+        order_by,
+        desc,
+        cursor,
+    )
+    entry = cache.get(key)
+
+    if entry is None:
+        token = cache.token(channel_name)
+        stmt = chats_query(
+            channel_name,
+            username,
+            message_type,
+            start_datetime,
+            end_datetime,
+            order_by,
+            desc,
+            after,
+            chat_columns,
+        )
+
+        def query(session, skip, count):
+            files = archive_files(
+                session.connection(), channel_name, start_datetime, end_datetime
+            )
+            if not files:
+                rows = session.exec(stmt.offset(skip).limit(count)).all()
+                return decode_rows(session, rows)
+
+            # the page is within the first skip + count rows of each source
+            hot = decode_rows(session, session.exec(stmt.limit(skip + count)).all())
+            cold = archived_page(
+                archive_path,
+                files,
+                username,
+                message_type,
+                start_datetime,
+                end_datetime,
+                order_by,
+                desc,
+                after,
+                skip + count,
+            )
+            return list(
+                islice(merge_pages(order_by, desc, hot, cold), skip, skip + count)
+            )
+
+        dbs = await databases(channel_name, start_datetime, end_datetime)
+        if len(dbs) == 1:
+            results = await run_in_db_thread(query, offset, limit, db=dbs[0])
+        else:
+            pages = await run_in_shards(dbs, query, 0, offset + limit)
+            results = list(
+                islice(merge_pages(order_by, desc, *pages), offset, offset + limit)
+            )
+
+        headers = {}
+        if len(results) == limit:
+            headers["X-Next-Cursor"] = encode_cursor(order_by, desc, results[-1])
+        with stage("serialize"):
+            body = encode_rows(results)
+        entry = cache.put(key, channel_name, token, body, headers)
+
+    if if_none_match is not None and entry.etag in if_none_match:
+        return Response(status_code=304, headers={"ETag": entry.etag})
+    return Response(
+        entry.body,
+        media_type="application/json",
+        headers={**entry.headers, "ETag": entry.etag},
+    )
 
-    if channel_name is not None:
-        stmt = stmt.where(getattr(ChatMessage, "channel_name") == channel_name)
 
-    if username is not None:
-        stmt = stmt.where(getattr(ChatMessage, "username") == username)
+@app.get("/chats/export")
+async def export_chats(
+        channel_name: Annotated[str | None, Query()] = None,
+        username: Annotated[str | None, Query()] = None,
+        message_type: Annotated[str | None, Query()] = None,
+        start_datetime: Optional[datetime] = Query(None),
+        end_datetime: Optional[datetime] = Query(None),
+        order_by: Annotated[OrderBy, Query()] = "timestamp",
+        desc: bool = False,
+        export_format: Annotated[ExportFormat, Query(alias="format")] = "ndjson",
+) -> StreamingResponse:
+    """Stream every matching chat message as NDJSON, CSV or Parquet.
+
+    Rows come from one cursor per database, EXPORT_BATCH at a time, so
+    memory use does not grow with the size of the export. Rows archived to
+    Parquet are merged in as in /chats/. Parquet needs pyarrow installed.
+    """
+    start_datetime = as_utc(start_datetime)
+    end_datetime = as_utc(end_datetime)
+    stmt = chats_query(
+        channel_name,
+        username,
+        message_type,
+        start_datetime,
+        end_datetime,
+        order_by,
+        desc,
+        columns=chat_columns,
+    )
+    try:
+        encoder = export_encoder(export_format, chat_fields)
+    except ImportError:
+        raise HTTPException(status_code=501, detail="Parquet export needs pyarrow")
+
+    async def in_thread(fn, *args):
+        return await anyio.to_thread.run_sync(fn, *args, limiter=app.state.db_limiter)
+
+    async def body():
+        async with app.state.export_limiter:
+            dbs = await databases(channel_name, start_datetime, end_datetime)
+            conns = []
+            try:
+                cursors = []
+                for db in dbs:
+                    conn = await in_thread(db.connect)
+                    conns.append(conn)
+                    result = await in_thread(conn.execute, stmt)
+                    cursors.append(fetch_rows(conn, result))
+                    files = await in_thread(
+                        archive_files, conn, channel_name, start_datetime, end_datetime
+                    )
+                    if files:
+                        cursors.append(
+                            archived_rows(
+                                archive_path,
+                                files,
+                                username,
+                                message_type,
+                                start_datetime,
+                                end_datetime,
+                                order_by,
+                                desc,
+                            )
+                        )
+                # one cursor per shard and its archive, merged into one order
+                rows = heapq.merge(*cursors, key=sort_key(order_by, desc), reverse=desc)
+
+                def next_batch():
+                    batch = list(islice(rows, EXPORT_BATCH))
+                    return len(batch), encoder.encode(batch)
+
+                while True:
+                    count, data = await in_thread(next_batch)
+                    if data:
+                        yield data
+                    if count < EXPORT_BATCH:
+                        break
+                yield encoder.close()
+            finally:
+                for conn in conns:
+                    await in_thread(conn.close)
+
+    media_type, extension = export_types[export_format]
+    return StreamingResponse(
+        body(),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="chats.{extension}"'},
+    )
 
-    if message_type is not None:
-        stmt = stmt.where(getattr(ChatMessage, "message_type") == message_type)
 
-    if start_datetime is not None:
-        stmt = stmt.where(getattr(ChatMessage, "timestamp") >= start_datetime)
+@app.get("/chats/search", response_model=list[ChatSearchResult])
+async def search_chats(
+        response: Response,
+        q: Annotated[str, Query(min_length=1)],
+        syntax: Annotated[SearchSyntax, Query()] = "words",
+        channel_name: Annotated[str | None, Query()] = None,
+        username: Annotated[str | None, Query()] = None,
+        message_type: Annotated[str | None, Query()] = None,
+        start_datetime: Optional[datetime] = Query(None),
+        end_datetime: Optional[datetime] = Query(None),
+        offset: int = 0,
+        limit: Annotated[int, Query(ge=1, le=CHATS_MAX_LIMIT)] = 100,
+        order_by: Annotated[SearchOrderBy, Query()] = "rank",
+        desc: bool = False,
+) -> list[ChatSearchResult]:
+    """Full-text search over message_text.
+
+    ``syntax`` picks how q is read: ``words`` (all words), ``phrase``,
+    ``prefix`` (every word as a prefix) or ``fts`` (raw FTS5 query syntax).
+    Matches are highlighted with ``<mark>`` in ``snippet``. With sharded
+    storage, ranks come from each shard's own index, so across shards
+    ``order_by=rank`` is only roughly best first.
+
+    Rows archived to Parquet are not searched. When the channel and time
+    range reach archived days, ``X-Archived-Rows-Skipped`` gives the number
+    of rows archived for those channels and days, which were left out.
+    """
+    start_datetime = as_utc(start_datetime)
+    end_datetime = as_utc(end_datetime)
+    stmt = search_query(
+        q,
+        syntax,
+        channel_name,
+        username,
+        message_type,
+        start_datetime,
+        end_datetime,
+        order_by,
+        desc,
+    )
+
+    def query(session, skip, count):
+        results = session.exec(stmt.offset(skip).limit(count)).all()
+        return list(zip(decode_rows(session, results), results))
+
+    def archived(session):
+        files = archive_files(
+            session.connection(), channel_name, start_datetime, end_datetime
+        )
+        return sum(archived.rows for archived in files)
+
+    def key(result):
+        row = result[1]
+        return (row.rank if order_by == "rank" else row.timestamp), row.id
+
+    try:
+        dbs = await databases(channel_name, start_datetime, end_datetime)
+        if len(dbs) == 1:
+            results = await run_in_db_thread(query, offset, limit, db=dbs[0])
+        else:
+            pages = await run_in_shards(dbs, query, 0, offset + limit)
+            reverse = desc and order_by != "rank"
+            results = islice(
+                heapq.merge(*pages, key=key, reverse=reverse), offset, offset + limit
+            )
+    except OperationalError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid search query: {e.orig}")
+
+    skipped = sum(await run_in_shards(dbs, archived))
+    if skipped:
+        response.headers["X-Archived-Rows-Skipped"] = str(skipped)
+    return [
+        ChatSearchResult(**message._asdict(), snippet=row.snippet, rank=row.rank)
+        for message, row in results
+    ]
+
+
+@app.get("/chats/stream")
+async def stream_chats(
+        channel_name: Annotated[str | None, Query()] = None,
+        username: Annotated[str | None, Query()] = None,
+        message_type: Annotated[str | None, Query()] = None,
+        last_event_id: Annotated[int | None, Header()] = None,
+) -> StreamingResponse:
+    """Push newly stored chat messages as Server-Sent Events.
+
+    Each event's ``id`` is the message id and its ``data`` the message as
+    JSON. Reconnecting with ``Last-Event-ID`` first replays the matching
+    messages stored after that id. A client that falls too far behind is
+    sent a ``lagged`` event and disconnected, and can reconnect to resume.
+
+    Not served with sharded storage, whose ids do not grow across shards.
+    """
+    if router is not None:
+        raise HTTPException(
+            status_code=501, detail="/chats/stream is not served with sharded storage"
+        )
+    broadcast = app.state.broadcast
+    subscriber = broadcast.subscribe(
+        channel_name=channel_name, username=username, message_type=message_type
+    )
+    filters = chats_filters(channel_name, username, message_type)
+
+    async def events():
+        last_sent = last_event_id or 0
+        try:
+            if last_event_id is not None:
+                while True:
+                    rows = await run_in_db_thread(rows_after, last_sent, filters)
+                    if rows:
+                        yield "".join(encode_event(row) for row in rows)
+                        last_sent = rows[-1].id
+                    if len(rows) < STREAM_BATCH:
+                        break
+
+            while True:
+                try:
+                    item = await asyncio.wait_for(
+                        subscriber.queue.get(), STREAM_KEEPALIVE
+                    )
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+
+                # send whatever else is queued in the same write
+                chunk = []
+                for item in [item, *subscriber.drain(STREAM_BATCH)]:
+                    if item is LAGGED:
+                        chunk.append("event: lagged\ndata: {}\n\n")
+                        break
+                    row_id, data = item
+                    if row_id > last_sent:
+                        last_sent = row_id
+                        chunk.append(data)
+                yield "".join(chunk)
+                if item is LAGGED:
+                    return
+        finally:
+            broadcast.unsubscribe(subscriber)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
-    if end_datetime is not None:
-        stmt = stmt.where(getattr(ChatMessage, "timestamp") <= end_datetime)
 
-    if desc:
-        stmt = stmt.order_by(getattr(ChatMessage, order_by).desc())
+##############################################################################
+
+
+@app.get("/stats/messages", response_model=list[MessageCountBucket])
+async def message_stats(
+        channel_name: Annotated[str | None, Query()] = None,
+        message_type: Annotated[str | None, Query()] = None,
+        start_datetime: Optional[datetime] = Query(None),
+        end_datetime: Optional[datetime] = Query(None),
+        interval: Annotated[Interval, Query()] = "minute",
+        offset: int = 0,
+        limit: Annotated[int, Query(ge=1, le=10_000)] = 10_000,
+) -> list[MessageCountBucket]:
+    """Message counts per channel, time bucket and message_type.
+
+    Read from the rollup tables, never from the messages themselves; a
+    range that starts or ends inside a bucket includes the whole bucket.
+    """
+    # a bucket can reach past the rows of a shard, so /stats/ only prunes
+    # shards by channel
+    stmt = message_counts_query(
+        channel_name, message_type, start_datetime, end_datetime, interval
+    )
+    dbs = await databases(channel_name)
+    if len(dbs) == 1:
+        stmt = stmt.offset(offset).limit(limit)
+        results = await run_in_db_thread(lambda session: session.exec(stmt).all(), db=dbs[0])
     else:
-        stmt = stmt.order_by(getattr(ChatMessage, order_by))
+        pages = await run_in_shards(dbs, lambda session: session.exec(stmt).all())
+        totals = sorted(add_up(pages, 3).items())
+        results = [(*key, count) for key, (count,) in totals[offset : offset + limit]]
+    return [
+        MessageCountBucket(
+            channel_name=channel, bucket=from_epoch(bucket), message_type=kind, count=count
+        )
+        for channel, bucket, kind, count in results
+    ]
+
+
+async def top_totals(stmt, limit, channel_name):
+    """The first limit ``(username, total)`` rows of stmt, most first, over its shards.
+
+    Each shard's totals are read in full, as a user's total is the sum over
+    the shards.
+    """
+    dbs = await databases(channel_name)
+    if len(dbs) == 1:
+        return await run_in_db_thread(
+            lambda session: session.exec(stmt.limit(limit)).all(), db=dbs[0]
+        )
+    pages = await run_in_shards(dbs, lambda session: session.exec(stmt).all())
+    totals = add_up(pages, 1)
+    ranked = sorted(totals.items(), key=lambda item: (-item[1][0], item[0]))
+    return [(username, total) for (username,), (total,) in ranked[:limit]]
+
+
+@app.get("/stats/top-chatters", response_model=list[ChatterCount])
+async def top_chatters(
+        channel_name: Annotated[str | None, Query()] = None,
+        start_datetime: Optional[datetime] = Query(None),
+        end_datetime: Optional[datetime] = Query(None),
+        limit: Annotated[int, Query(ge=1, le=100)] = 10,
+) -> list[ChatterCount]:
+    """Usernames with the most chat messages, counted per UTC day."""
+    stmt = top_chatters_query(channel_name, start_datetime, end_datetime)
+    results = await top_totals(stmt, limit, channel_name)
+    return [ChatterCount(username=username, count=count) for username, count in results]
+
+
+@app.get("/stats/top-gifters", response_model=list[GifterCount])
+async def top_gifters(
+        channel_name: Annotated[str | None, Query()] = None,
+        start_datetime: Optional[datetime] = Query(None),
+        end_datetime: Optional[datetime] = Query(None),
+        limit: Annotated[int, Query(ge=1, le=100)] = 10,
+) -> list[GifterCount]:
+    """Usernames that gifted the most subs, from the ChatEvent table."""
+    stmt = top_gifters_query(channel_name, start_datetime, end_datetime)
+    results = await top_totals(stmt, limit, channel_name)
+    return [GifterCount(username=username, gifts=gifts) for username, gifts in results]
 
-    stmt = stmt.offset(offset).limit(limit)
 
-    results = session.exec(stmt).all()
-    return list(results)
+@app.get("/stats/events", response_model=list[EventTotals])
+async def event_totals(
+        channel_name: Annotated[str | None, Query()] = None,
+        start_datetime: Optional[datetime] = Query(None),
+        end_datetime: Optional[datetime] = Query(None),
+) -> list[EventTotals]:
+    """Sub, gift, raid, timeout and ban events per channel."""
+    stmt = event_totals_query(channel_name, start_datetime, end_datetime)
+    dbs = await databases(channel_name)
+    pages = await run_in_shards(dbs, lambda session: session.exec(stmt).all())
+    fields = list(stmt.selected_columns.keys())
+    return [
+        EventTotals(**dict(zip(fields, [*key, *sums])))
+        for key, sums in sorted(add_up(pages, 1).items())
+    ]
+
+
+@app.get("/cache/")
+async def cache_stats() -> dict:
+    """Hit, miss, eviction and invalidation counters of the GET /chats/ cache."""
+    return app.state.cache.stats()
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics() -> PlainTextResponse:
+    """Request latency histograms and ingest counters, in the Prometheus text format.
+
+    ``chatlog_http_request_duration_seconds`` is per route and query shape,
+    ``chatlog_http_stage_seconds`` splits requests into ``sql``,
+    ``serialize`` (GET /chats/ encoding its rows) and ``other``. The
+    ``chatlog_ingest_*`` counters are totals over every load and tailer run
+    against the database, or every shard, read from the IngestMetric table.
+    """
+    pages = await run_in_shards(
+        await all_databases(), lambda session: ingest_metrics(session.connection())
+    )
+    totals = Counter()
+    for page in pages:
+        totals.update(page)
+    return PlainTextResponse(
+        app.state.metrics.render() + render_ingest(totals),
+        media_type="text/plain; version=0.0.4",
+    )